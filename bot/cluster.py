@@ -0,0 +1,214 @@
+"""Cluster mode: a supervisor process and CLUSTER_WORKERS bot workers.
+
+    python -m bot.cluster
+
+The supervisor is the only process receiving updates from Telegram
+(long polling, or the webhook with BOT_MODE=webhook). It forwards each
+update over the loopback to a worker picked by consistent hashing on the
+chat id (the user id for updates without a chat). A chat is always served
+by the same worker, so its FSM state and prompts live in one process, and
+its updates are forwarded one at a time, so they are handled in order.
+
+Updates are confirmed to Telegram once routed, so a routed update is never
+dropped: it is retried until its worker (restarted if it died) accepts it.
+At most UPDATE_QUEUE_LIMIT updates are being forwarded at once; past that
+the supervisor stops fetching (or holds webhook responses) until they drain.
+
+Workers are ``python -m bot.main`` with BOT_MODE=worker. They elect a
+leader for the background jobs (bot.db.lease) and invalidate each other's
+caches (bot.utils.broadcast). A worker that exits is restarted and its
+chats wait for it. Point TELEGRAM_API_URL at a fake Bot API server to run
+the whole cluster locally.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import sys
+
+import aiohttp
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+
+from bot.config import settings
+from bot.db.database import init_db
+from bot.utils.hashring import HashRing
+from bot.utils.webhook import SECRET_HEADER, serve_webhook
+
+logger = logging.getLogger(__name__)
+
+_WORKER_PATH = "/update"
+
+_RETRY_DELAY = 2
+# Log a forward still waiting for its worker every this many retries
+_RETRY_LOG_EVERY = 30
+
+_api = (
+    TelegramAPIServer.from_base(settings.TELEGRAM_API_URL)
+    if settings.TELEGRAM_API_URL else PRODUCTION
+)
+
+
+def routing_key(update: dict) -> int:
+    """Chat id of the update's event, else its user id."""
+    for name, event in update.items():
+        if not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+    return update.get("update_id", 0)
+
+
+class Worker:
+    def __init__(self, worker_id: int, port: int, secret: str) -> None:
+        self.worker_id = worker_id
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}{_WORKER_PATH}"
+        self.secret = secret
+        # Forwards in flight to this worker; a worker that is down only holds its own
+        self.slots = asyncio.Semaphore(settings.UPDATE_CONCURRENCY)
+
+    async def supervise(self) -> None:
+        env = {
+            **os.environ,
+            "BOT_MODE": "worker",
+            "WORKER_ID": str(self.worker_id),
+            "WEBHOOK_HOST": "127.0.0.1",
+            "WEBHOOK_PORT": str(self.port),
+            "WEBHOOK_PATH": _WORKER_PATH,
+            "WEBHOOK_SECRET": self.secret,
+            "WEBHOOK_URL": "",
+        }
+        while True:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "bot.main", env=env
+            )
+            logger.info("Worker %d started (pid %d)", self.worker_id, process.pid)
+            try:
+                code = await process.wait()
+            except asyncio.CancelledError:
+                process.terminate()
+                await process.wait()
+                raise
+            logger.error("Worker %d exited with %s, restarting", self.worker_id, code)
+            await asyncio.sleep(_RETRY_DELAY)
+
+
+class UpdateRouter:
+    def __init__(self, workers: list[Worker], http: aiohttp.ClientSession) -> None:
+        self.workers = workers
+        self.ring = HashRing(range(len(workers)))
+        self.http = http
+        # Routing key -> its latest forward; the next update of the key waits for it
+        self._tails: dict[int, asyncio.Task] = {}
+        self._slots = asyncio.Semaphore(settings.UPDATE_QUEUE_LIMIT)
+
+    async def route(self, update: dict) -> None:
+        """Start forwarding ``update``; waits while the forwards in flight
+        are at the limit."""
+        await self._slots.acquire()
+        key = routing_key(update)
+        worker = self.workers[self.ring.get(key)]
+        previous = self._tails.get(key)
+        task = asyncio.create_task(self._forward(worker, update, previous))
+        self._tails[key] = task
+        task.add_done_callback(lambda done: self._release(key, done))
+
+    def _release(self, key: int, task: asyncio.Task) -> None:
+        if self._tails.get(key) is task:
+            del self._tails[key]
+        self._slots.release()
+
+    async def _forward(
+        self, worker: Worker, update: dict, previous: asyncio.Task | None
+    ) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        retries = 0
+        while True:
+            async with worker.slots:
+                try:
+                    async with self.http.post(
+                        worker.url, json=update, headers={SECRET_HEADER: worker.secret}
+                    ) as response:
+                        if response.status < 500:
+                            return
+                        logger.warning("Worker %d answered %d", worker.worker_id, response.status)
+                except aiohttp.ClientError:
+                    pass
+            if retries % _RETRY_LOG_EVERY == 0:
+                logger.error(
+                    "Update %s waits for worker %d (%d retries)",
+                    update.get("update_id"), worker.worker_id, retries,
+                )
+            retries += 1
+            # Sleep without the slot so other chats of the worker can still try
+            await asyncio.sleep(_RETRY_DELAY)
+
+
+async def poll(router: UpdateRouter) -> None:
+    url = _api.api_url(settings.BOT_TOKEN, "getUpdates")
+    offset = None
+    logger.info("Polling for updates")
+    while True:
+        try:
+            params = {"timeout": 30}
+            if offset is not None:
+                params["offset"] = offset
+            async with router.http.get(
+                url, params=params, timeout=aiohttp.ClientTimeout(total=40)
+            ) as response:
+                body = await response.json()
+            if not body.get("ok"):
+                logger.error("getUpdates failed: %s", body.get("description"))
+                await asyncio.sleep(_RETRY_DELAY)
+                continue
+            for update in body["result"]:
+                await router.route(update)
+                offset = update["update_id"] + 1
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            logger.exception("Error polling for updates")
+            await asyncio.sleep(_RETRY_DELAY)
+
+
+async def main() -> None:
+    logging.basicConfig(
+        level=getattr(logging, settings.LOG_LEVEL, logging.INFO),
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+    # Migrations run once here rather than racing in every worker (they skip init_db)
+    await init_db()
+
+    secret = secrets.token_urlsafe(32)
+    workers = [
+        Worker(i, settings.CLUSTER_BASE_PORT + i, secret)
+        for i in range(settings.CLUSTER_WORKERS)
+    ]
+    supervisors = [asyncio.create_task(worker.supervise()) for worker in workers]
+    logger.info("Cluster started: %d workers", len(workers))
+
+    async with aiohttp.ClientSession() as http:
+        router = UpdateRouter(workers, http)
+        try:
+            if settings.BOT_MODE == "webhook":
+                # Only sets the webhook: updates go to the workers unparsed
+                bot = Bot(settings.BOT_TOKEN, session=AiohttpSession(api=_api))
+                try:
+                    await serve_webhook(bot, router.route)
+                finally:
+                    await bot.session.close()
+            else:
+                await poll(router)
+        finally:
+            for task in supervisors:
+                task.cancel()
+            await asyncio.gather(*supervisors, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
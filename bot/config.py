@@ -24,5 +24,155 @@ class Settings:
     )
     LOG_LEVEL: str = field(default_factory=lambda: os.getenv("LOG_LEVEL", "INFO"))
 
+    # "polling" or "webhook" (embedded aiohttp server); "worker" is set by bot.cluster
+    BOT_MODE: str = field(default_factory=lambda: os.getenv("BOT_MODE", "polling"))
+    # Public URL registered with Telegram at startup (empty = do not register)
+    WEBHOOK_URL: str = field(default_factory=lambda: os.getenv("WEBHOOK_URL", ""))
+    WEBHOOK_PATH: str = field(default_factory=lambda: os.getenv("WEBHOOK_PATH", "/webhook"))
+    WEBHOOK_HOST: str = field(default_factory=lambda: os.getenv("WEBHOOK_HOST", "0.0.0.0"))
+    WEBHOOK_PORT: int = field(
+        default_factory=lambda: int(os.getenv("WEBHOOK_PORT", "8080"))
+    )
+    WEBHOOK_SECRET: str = field(default_factory=lambda: os.getenv("WEBHOOK_SECRET", ""))
+    # Bot API server, e.g. a local or fake one for testing (empty = api.telegram.org)
+    TELEGRAM_API_URL: str = field(default_factory=lambda: os.getenv("TELEGRAM_API_URL", ""))
+
+    # Cluster mode (python -m bot.cluster): worker processes, their loopback
+    # ports (HTTP for updates, UDP for cache invalidation) and the job lease
+    CLUSTER_WORKERS: int = field(
+        default_factory=lambda: int(os.getenv("CLUSTER_WORKERS", "2"))
+    )
+    CLUSTER_BASE_PORT: int = field(
+        default_factory=lambda: int(os.getenv("CLUSTER_BASE_PORT", "8100"))
+    )
+    # Set by the supervisor for each worker
+    WORKER_ID: int = field(default_factory=lambda: int(os.getenv("WORKER_ID", "0")))
+    LEASE_TTL: int = field(default_factory=lambda: int(os.getenv("LEASE_TTL", "30")))
+
+    # Updates handled at the same time, in both modes
+    UPDATE_CONCURRENCY: int = field(
+        default_factory=lambda: int(os.getenv("UPDATE_CONCURRENCY", "64"))
+    )
+    # Updates accepted but not yet handled; at the cap polling stops until they drain
+    UPDATE_QUEUE_LIMIT: int = field(
+        default_factory=lambda: int(os.getenv("UPDATE_QUEUE_LIMIT", "512"))
+    )
+
+    # SQLite storage profile
+    SQLITE_JOURNAL_MODE: str = field(
+        default_factory=lambda: os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    )
+    SQLITE_SYNCHRONOUS: str = field(
+        default_factory=lambda: os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    )
+    SQLITE_BUSY_TIMEOUT_MS: int = field(
+        default_factory=lambda: int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    )
+    SQLITE_CACHE_SIZE_KB: int = field(
+        default_factory=lambda: int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+    )
+    SQLITE_MMAP_SIZE_MB: int = field(
+        default_factory=lambda: int(os.getenv("SQLITE_MMAP_SIZE_MB", "128"))
+    )
+    SQLITE_TEMP_STORE: str = field(
+        default_factory=lambda: os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+    )
+    SQLITE_CHECKPOINT_INTERVAL: int = field(
+        default_factory=lambda: int(os.getenv("SQLITE_CHECKPOINT_INTERVAL", "60"))
+    )
+    SQLITE_WAL_TRUNCATE_PAGES: int = field(
+        default_factory=lambda: int(os.getenv("SQLITE_WAL_TRUNCATE_PAGES", "4000"))
+    )
+
+    # Group commit for ticket message inserts
+    WRITE_BATCH_SIZE: int = field(
+        default_factory=lambda: int(os.getenv("WRITE_BATCH_SIZE", "50"))
+    )
+    WRITE_BATCH_DELAY_MS: int = field(
+        default_factory=lambda: int(os.getenv("WRITE_BATCH_DELAY_MS", "5"))
+    )
+
+    # Archival of closed tickets into a separate SQLite file
+    ARCHIVE_DB_PATH: str = field(
+        default_factory=lambda: os.getenv("ARCHIVE_DB_PATH", "data/archive.db")
+    )
+    ARCHIVE_AFTER_DAYS: int = field(
+        default_factory=lambda: int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+    )
+    ARCHIVE_BATCH_SIZE: int = field(
+        default_factory=lambda: int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+    )
+    ARCHIVE_INTERVAL: int = field(
+        default_factory=lambda: int(os.getenv("ARCHIVE_INTERVAL", "3600"))
+    )
+
+    STATS_RECONCILE_INTERVAL: int = field(
+        default_factory=lambda: int(os.getenv("STATS_RECONCILE_INTERVAL", "21600"))
+    )
+
+    # Users whose current username/full_name is known to be stored
+    USER_CACHE_SIZE: int = field(
+        default_factory=lambda: int(os.getenv("USER_CACHE_SIZE", "10000"))
+    )
+
+    # Admin display names kept in memory for ticket cards
+    ADMIN_NAME_CACHE_SIZE: int = field(
+        default_factory=lambda: int(os.getenv("ADMIN_NAME_CACHE_SIZE", "1000"))
+    )
+    ADMIN_NAME_TTL: int = field(
+        default_factory=lambda: int(os.getenv("ADMIN_NAME_TTL", "3600"))
+    )
+
+    # FSM storage: writes are coalesced for this long; untouched drafts expire
+    FSM_FLUSH_DELAY_MS: int = field(
+        default_factory=lambda: int(os.getenv("FSM_FLUSH_DELAY_MS", "500"))
+    )
+    FSM_TTL_HOURS: int = field(
+        default_factory=lambda: int(os.getenv("FSM_TTL_HOURS", "24"))
+    )
+
+    # Admin chat "reply to this message" prompts: how many and how long to remember
+    PROMPT_MAX_SIZE: int = field(
+        default_factory=lambda: int(os.getenv("PROMPT_MAX_SIZE", "1000"))
+    )
+    PROMPT_TTL: int = field(
+        default_factory=lambda: int(os.getenv("PROMPT_TTL", "86400"))
+    )
+    # Also keep them in the DB (survive restarts, shared between workers)
+    PROMPT_PERSIST: bool = field(
+        default_factory=lambda: os.getenv("PROMPT_PERSIST", "0") == "1"
+    )
+
+    # Outbound queue: sender tasks and Telegram flood limits
+    OUTBOUND_WORKERS: int = field(
+        default_factory=lambda: int(os.getenv("OUTBOUND_WORKERS", "4"))
+    )
+    OUTBOUND_GLOBAL_RATE: float = field(
+        default_factory=lambda: float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+    )
+    OUTBOUND_PRIVATE_RATE: float = field(
+        default_factory=lambda: float(os.getenv("OUTBOUND_PRIVATE_RATE", "1"))
+    )
+    OUTBOUND_GROUP_RATE: float = field(
+        default_factory=lambda: float(os.getenv("OUTBOUND_GROUP_RATE", "20"))
+    )
+
+    # Reminder types (ticket statuses) sent as one digest per recipient
+    REMINDER_DIGEST: list[str] = field(default_factory=lambda: [
+        x.strip()
+        for x in os.getenv("REMINDER_DIGEST", "new,on_hold,in_progress").split(",")
+        if x.strip()
+    ])
+
+    # Compare the in-memory open ticket index with the DB every N seconds (0 = off)
+    OPEN_TICKETS_CHECK_INTERVAL: int = field(
+        default_factory=lambda: int(os.getenv("OPEN_TICKETS_CHECK_INTERVAL", "0"))
+    )
+
+    # How long the in-memory admin roster is trusted before a reload
+    ADMIN_ROSTER_TTL: int = field(
+        default_factory=lambda: int(os.getenv("ADMIN_ROSTER_TTL", "300"))
+    )
+
 
 settings = Settings()
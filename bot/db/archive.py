@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import Row, delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import settings
+from bot.db.database import engine, is_sqlite
+from bot.db.models import Ticket, TicketMessage, archived_ticket_messages, archived_tickets
+from bot.utils.pagination import OLDER, PAGE_SIZE, Cursor, Page, keyset, make_page
+
+logger = logging.getLogger(__name__)
+
+_ticket_columns = [c.name for c in Ticket.__table__.columns]
+_message_columns = [c.name for c in TicketMessage.__table__.columns]
+
+
+async def archive_batch(cutoff: datetime, batch_size: int) -> int:
+    """Move up to ``batch_size`` tickets closed before ``cutoff`` into the archive.
+
+    In WAL mode a transaction spanning attached databases is atomic per file
+    only, so rows are copied before they are deleted and the copy is
+    idempotent: a crash in between leaves a duplicate that the next run
+    overwrites, never a lost ticket.
+    """
+    async with engine.begin() as conn:
+        ticket_ids = (await conn.execute(
+            select(Ticket.id)
+            .where(Ticket.status == "closed", Ticket.closed_at < cutoff)
+            .order_by(Ticket.id)
+            .limit(batch_size)
+        )).scalars().all()
+        if not ticket_ids:
+            return 0
+
+        # Delete and insert rather than INSERT OR REPLACE: a replace doesn't
+        # fire the delete trigger that keeps the archive's search index in sync
+        await conn.execute(delete(archived_tickets).where(archived_tickets.c.id.in_(ticket_ids)))
+        await conn.execute(
+            insert(archived_tickets).from_select(
+                _ticket_columns,
+                select(*Ticket.__table__.c).where(Ticket.id.in_(ticket_ids)),
+            )
+        )
+        await conn.execute(
+            delete(archived_ticket_messages)
+            .where(archived_ticket_messages.c.ticket_id.in_(ticket_ids))
+        )
+        await conn.execute(
+            insert(archived_ticket_messages).from_select(
+                _message_columns,
+                select(*TicketMessage.__table__.c)
+                .where(TicketMessage.ticket_id.in_(ticket_ids)),
+            )
+        )
+        await conn.execute(delete(TicketMessage).where(TicketMessage.ticket_id.in_(ticket_ids)))
+        await conn.execute(delete(Ticket).where(Ticket.id.in_(ticket_ids)))
+    return len(ticket_ids)
+
+
+async def archive_closed_tickets() -> int:
+    cutoff = datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    total = 0
+    while True:
+        moved = await archive_batch(cutoff, settings.ARCHIVE_BATCH_SIZE)
+        total += moved
+        if moved < settings.ARCHIVE_BATCH_SIZE:
+            break
+        # Let handlers get at the write lock between batches
+        await asyncio.sleep(0)
+    if total:
+        logger.info("Archived %d closed tickets", total)
+    return total
+
+
+async def archive_loop() -> None:
+    if not is_sqlite:
+        return
+    logger.info("Archive loop started (interval: %ds)", settings.ARCHIVE_INTERVAL)
+    while True:
+        try:
+            await archive_closed_tickets()
+        except Exception:
+            logger.exception("Error in ticket archival")
+        await asyncio.sleep(settings.ARCHIVE_INTERVAL)
+
+
+# --- Lookups that fall back to the archive ---
+
+
+async def get_archived_ticket(session: AsyncSession, ticket_id: int) -> Row | None:
+    """Read-only row with the same attributes as Ticket, or None."""
+    result = await session.execute(
+        select(archived_tickets).where(archived_tickets.c.id == ticket_id)
+    )
+    return result.one_or_none()
+
+
+async def get_user_tickets_page(
+    session: AsyncSession,
+    user_id: int,
+    cursor: Cursor | None = None,
+    direction: str = OLDER,
+    page_size: int = PAGE_SIZE,
+) -> Page:
+    limit = page_size + 1
+    # Each side is limited on its own (user_id, created_at) index. The merge of
+    # the two pages happens here: as a UNION ALL, SQLite sorted both sides again
+    # in temp B-trees.
+    rows = []
+    for table in (Ticket.__table__, archived_tickets):
+        result = await session.execute(keyset(
+            select(*table.c).where(table.c.user_id == user_id),
+            (table.c.created_at, table.c.id), cursor, direction, limit,
+        ))
+        rows += result.all()
+    rows.sort(key=lambda row: (row.created_at, row.id), reverse=direction == OLDER)
+    return make_page(rows[:limit], cursor, direction, page_size)
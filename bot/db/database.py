@@ -1,20 +1,164 @@
+import asyncio
+import logging
 import os
+from dataclasses import dataclass
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import Table, event, func, insert, select, text
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.schema import CreateColumn
 
 from bot.config import settings
-from bot.db.models import Base
+from bot.db.models import (
+    TICKET_NUMBER_COUNTER,
+    Base,
+    Counter,
+    Ticket,
+    archive_metadata,
+    archived_tickets,
+)
+from bot.db.search import init_search
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    journal_mode: str
+    synchronous: str
+    busy_timeout_ms: int
+    cache_size_kb: int
+    mmap_size_mb: int
+    temp_store: str
+    checkpoint_interval: int
+    wal_truncate_pages: int
+
+    @classmethod
+    def from_settings(cls) -> "StorageProfile":
+        return cls(
+            journal_mode=settings.SQLITE_JOURNAL_MODE.upper(),
+            synchronous=settings.SQLITE_SYNCHRONOUS.upper(),
+            busy_timeout_ms=settings.SQLITE_BUSY_TIMEOUT_MS,
+            cache_size_kb=settings.SQLITE_CACHE_SIZE_KB,
+            mmap_size_mb=settings.SQLITE_MMAP_SIZE_MB,
+            temp_store=settings.SQLITE_TEMP_STORE.upper(),
+            checkpoint_interval=settings.SQLITE_CHECKPOINT_INTERVAL,
+            wal_truncate_pages=settings.SQLITE_WAL_TRUNCATE_PAGES,
+        )
+
+    def pragmas(self) -> list[str]:
+        return [
+            f"PRAGMA journal_mode={self.journal_mode}",
+            f"PRAGMA synchronous={self.synchronous}",
+            f"PRAGMA busy_timeout={self.busy_timeout_ms}",
+            # Negative cache_size is in KiB rather than pages
+            f"PRAGMA cache_size=-{self.cache_size_kb}",
+            f"PRAGMA mmap_size={self.mmap_size_mb * 1024 * 1024}",
+            f"PRAGMA temp_store={self.temp_store}",
+        ]
+
+
+storage_profile = StorageProfile.from_settings()
 
 engine = create_async_engine(settings.DATABASE_URL, echo=False)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+is_sqlite = engine.dialect.name == "sqlite"
+
+# Single-column indexes superseded by the composite ones in models.Ticket
+_SUPERSEDED_INDEXES = (
+    "ix_tickets_status", "ix_tickets_admin_id", "ix_tickets_user_id",
+    "ix_tickets_admin_status_created",
+)
+
+
+if is_sqlite:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _apply_storage_profile(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        # Attached first so the profile pragmas apply to the archive too
+        cursor.execute("ATTACH DATABASE ? AS archive", (settings.ARCHIVE_DB_PATH,))
+        for pragma in storage_profile.pragmas():
+            cursor.execute(pragma)
+        cursor.close()
+
+
+async def _add_missing_columns(conn: AsyncConnection, table: Table) -> None:
+    """create_all() leaves existing tables alone: add columns introduced since."""
+    schema = f"{table.schema}." if table.schema else ""
+    rows = await conn.execute(text(f"PRAGMA {schema}table_info({table.name})"))
+    existing = {row.name for row in rows}
+    for column in table.columns:
+        if column.name not in existing:
+            ddl = CreateColumn(column).compile(dialect=conn.dialect)
+            await conn.execute(text(f"ALTER TABLE {schema}{table.name} ADD COLUMN {ddl}"))
+            logger.info("Added column %s%s.%s", schema, table.name, column.name)
+
+
+def _create_missing_indexes(sync_conn, tables) -> None:
+    """create_all() also skips the indexes of existing tables."""
+    for table in tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
+async def _seed_ticket_numbers(conn: AsyncConnection) -> None:
+    """Start the ticket number sequence after the existing tickets, for
+    databases created before it existed."""
+    seeded = await conn.scalar(
+        select(Counter.value).where(Counter.name == TICKET_NUMBER_COUNTER)
+    )
+    if seeded is not None:
+        return
+    last_id = await conn.scalar(select(func.coalesce(func.max(Ticket.id), 0)))
+    await conn.execute(insert(Counter).values(name=TICKET_NUMBER_COUNTER, value=last_id))
+    logger.info("Ticket numbers start after %d", last_id)
+
 
 async def init_db() -> None:
     os.makedirs("data", exist_ok=True)
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        if is_sqlite:
+            await conn.run_sync(archive_metadata.create_all)
+            await init_search(conn)
+            for table in (Ticket.__table__, archived_tickets):
+                await _add_missing_columns(conn, table)
+        await conn.run_sync(_create_missing_indexes, Base.metadata.sorted_tables)
+        for index_name in _SUPERSEDED_INDEXES:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+        await _seed_ticket_numbers(conn)
 
 
 async def get_session() -> AsyncSession:
     async with async_session() as session:
         return session
+
+
+async def checkpoint_wal() -> None:
+    """Run a passive WAL checkpoint, escalating to TRUNCATE once the log grows."""
+    async with engine.connect() as conn:
+        busy, log_pages, checkpointed = (
+            await conn.execute(text("PRAGMA wal_checkpoint(PASSIVE)"))
+        ).one()
+        if log_pages >= storage_profile.wal_truncate_pages and log_pages == checkpointed:
+            await conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+            logger.info("WAL truncated (%d pages)", log_pages)
+
+
+async def checkpoint_loop() -> None:
+    if not is_sqlite or storage_profile.journal_mode != "WAL":
+        return
+    logger.info(
+        "WAL checkpoint loop started (interval: %ds)", storage_profile.checkpoint_interval
+    )
+    while True:
+        await asyncio.sleep(storage_profile.checkpoint_interval)
+        try:
+            await checkpoint_wal()
+        except Exception:
+            logger.exception("Error in WAL checkpoint")
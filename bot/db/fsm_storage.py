@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from bot.config import settings
+from bot.db.database import engine
+from bot.db.models import FsmRecord
+
+logger = logging.getLogger(__name__)
+
+# How often abandoned entries are looked for
+_SWEEP_INTERVAL = 600
+
+
+class _Entry:
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state: str | None, data: dict[str, Any], updated_at: datetime) -> None:
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SqliteStorage(BaseStorage):
+    """FSM storage that survives restarts.
+
+    Reads and writes hit an in-memory dict. Changed keys are written to the
+    fsm_states table in one transaction ``flush_delay`` seconds after the
+    first change, so a burst of set_state/update_data calls costs one write.
+    A crash loses at most that window. Entries untouched for ``ttl`` (drafts
+    nobody finished) are dropped from memory and from the table.
+    """
+
+    def __init__(self, flush_delay: float, ttl: timedelta) -> None:
+        self.flush_delay = flush_delay
+        self.ttl = ttl
+        self._key_builder = DefaultKeyBuilder(
+            with_bot_id=True, with_business_connection_id=True, with_destiny=True
+        )
+        self._entries: dict[str, _Entry] = {}
+        self._dirty: set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def load(self) -> None:
+        """Bulk-load every unexpired entry and start the background writer."""
+        cutoff = datetime.utcnow() - self.ttl
+        async with engine.begin() as conn:
+            await conn.execute(delete(FsmRecord).where(FsmRecord.updated_at < cutoff))
+            rows = await conn.execute(select(FsmRecord))
+            for row in rows:
+                self._entries[row.key] = _Entry(row.state, json.loads(row.data), row.updated_at)
+        logger.info("FSM storage loaded: %d entries", len(self._entries))
+        self._task = asyncio.create_task(self._run())
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = self._touch(key)
+        entry.state = state.state if isinstance(state, State) else state
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        entry = self._entries.get(self._key_builder.build(key))
+        return entry.state if entry is not None else None
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        entry = self._touch(key)
+        entry.data = dict(data)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        entry = self._entries.get(self._key_builder.build(key))
+        return dict(entry.data) if entry is not None else {}
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    # --- Write-behind ---
+
+    def _touch(self, key: StorageKey) -> _Entry:
+        raw = self._key_builder.build(key)
+        entry = self._entries.get(raw)
+        if entry is None:
+            entry = self._entries[raw] = _Entry(None, {}, datetime.utcnow())
+        else:
+            entry.updated_at = datetime.utcnow()
+        self._dirty.add(raw)
+        self._wakeup.set()
+        return entry
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for raw in keys:
+            entry = self._entries.get(raw)
+            if entry is None or entry.empty:
+                self._entries.pop(raw, None)
+                deletes.append(raw)
+            else:
+                upserts.append({
+                    "key": raw,
+                    "state": entry.state,
+                    "data": json.dumps(entry.data, ensure_ascii=False),
+                    "updated_at": entry.updated_at,
+                })
+        try:
+            async with engine.begin() as conn:
+                if deletes:
+                    await conn.execute(delete(FsmRecord).where(FsmRecord.key.in_(deletes)))
+                if upserts:
+                    stmt = sqlite_insert(FsmRecord)
+                    await conn.execute(
+                        stmt.on_conflict_do_update(
+                            index_elements=[FsmRecord.key],
+                            set_={
+                                "state": stmt.excluded.state,
+                                "data": stmt.excluded.data,
+                                "updated_at": stmt.excluded.updated_at,
+                            },
+                        ),
+                        upserts,
+                    )
+        except BaseException:
+            # Keep the keys for the next attempt (or close()); memory stays authoritative
+            self._dirty |= keys
+            raise
+
+    def _expire(self) -> None:
+        cutoff = datetime.utcnow() - self.ttl
+        expired = [raw for raw, entry in self._entries.items() if entry.updated_at < cutoff]
+        for raw in expired:
+            del self._entries[raw]
+        # Flushing a key that has no entry deletes its row
+        self._dirty.update(expired)
+        if expired:
+            logger.info("FSM storage: %d abandoned entries expired", len(expired))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_sweep = loop.time() + _SWEEP_INTERVAL
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=_SWEEP_INTERVAL)
+                # Let more changes pile up before writing
+                await asyncio.sleep(self.flush_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if loop.time() >= next_sweep:
+                self._expire()
+                next_sweep = loop.time() + _SWEEP_INTERVAL
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Error writing FSM storage")
+                await asyncio.sleep(self.flush_delay)
+
+
+def create_fsm_storage() -> SqliteStorage:
+    return SqliteStorage(
+        flush_delay=settings.FSM_FLUSH_DELAY_MS / 1000,
+        ttl=timedelta(hours=settings.FSM_TTL_HOURS),
+    )
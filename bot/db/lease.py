@@ -0,0 +1,78 @@
+"""Leader election for background jobs in cluster mode.
+
+Reminders, archiving, the WAL checkpoint and stats reconciliation must run
+in one process only. Workers compete for a row in the leases table: the
+holder renews it every ttl/3, anyone may take it over once it has expired.
+The leader starts the jobs and cancels them if it ever loses the lease.
+
+The jobs tolerate a short overlap after a stalled leader is replaced:
+reminders are claimed in the DB and archiving is idempotent.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy import delete, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from bot.db.database import engine
+from bot.db.models import Lease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    def __init__(self, name: str, holder: str, ttl: float) -> None:
+        self.name = name
+        self.holder = holder
+        self.ttl = ttl
+
+    async def acquire(self) -> bool:
+        """Take or renew the lease. False if another holder's lease is still valid."""
+        now = datetime.utcnow()
+        stmt = sqlite_insert(Lease).values(
+            name=self.name, holder=self.holder, expires_at=now + timedelta(seconds=self.ttl)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Lease.name],
+            set_={"holder": stmt.excluded.holder, "expires_at": stmt.excluded.expires_at},
+            where=or_(Lease.holder == self.holder, Lease.expires_at < now),
+        )
+        async with engine.begin() as conn:
+            return (await conn.execute(stmt)).rowcount == 1
+
+    async def release(self) -> None:
+        async with engine.begin() as conn:
+            await conn.execute(
+                delete(Lease).where(
+                    Lease.name == self.name, Lease.holder == self.holder
+                )
+            )
+
+
+async def run_as_leader(lease: LeaderLease, jobs: list[Callable[[], Awaitable]]) -> None:
+    """Run ``jobs`` while holding ``lease``."""
+    tasks: list[asyncio.Task] = []
+    try:
+        while True:
+            try:
+                leader = await lease.acquire()
+            except Exception:
+                logger.exception("Error renewing lease %s", lease.name)
+                leader = False
+            if leader and not tasks:
+                logger.info("%s is now the leader (%s)", lease.holder, lease.name)
+                tasks = [asyncio.create_task(job()) for job in jobs]
+            elif not leader and tasks:
+                logger.warning("%s lost the lease %s, stopping jobs", lease.holder, lease.name)
+                for task in tasks:
+                    task.cancel()
+                tasks = []
+            await asyncio.sleep(lease.ttl / 3)
+    finally:
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            # Let a standby take over without waiting for the lease to expire
+            await lease.release()
@@ -1,6 +1,19 @@
 from datetime import datetime
 
-from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Index, Integer, String, Text
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    text,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -8,6 +21,12 @@ class Base(DeclarativeBase):
     pass
 
 
+# WHERE of the partial indexes on open tickets (every status but closed).
+# SQLite uses them only for queries that repeat it literally, and unlike
+# status IN (...) the (status, created_at) index can't serve it instead.
+OPEN_WHERE = text("status != 'closed'")
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -48,11 +67,26 @@ class Ticket(Base):
     closed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     rating: Mapped[int | None] = mapped_column(Integer, nullable=True)
     message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # Reminders already sent for the current status, see bot.utils.reminders
+    reminder_level: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    last_reminded_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
     __table_args__ = (
-        Index("ix_tickets_status", "status"),
-        Index("ix_tickets_admin_id", "admin_id"),
-        Index("ix_tickets_user_id", "user_id"),
+        # /tickets: status = ? ORDER BY created_at
+        Index("ix_tickets_status_created", "status", "created_at"),
+        # status = ? AND updated_at < ?
+        Index("ix_tickets_status_updated", "status", "updated_at"),
+        # /tickets without a status filter: the open queue, newest first
+        Index("ix_tickets_open_created", "created_at", sqlite_where=OPEN_WHERE),
+        # "Мои заявки" of an admin: their open tickets, newest first
+        Index("ix_tickets_admin_open_created", "admin_id", "created_at", sqlite_where=OPEN_WHERE),
+        # /my
+        Index("ix_tickets_user_created", "user_id", "created_at"),
+        # Replies in the admin chat are matched by the card's message_id
+        Index(
+            "ix_tickets_message_id", "message_id",
+            sqlite_where=text("message_id IS NOT NULL"),
+        ),
     )
 
     user: Mapped["User"] = relationship(back_populates="tickets")
@@ -61,11 +95,21 @@ class Ticket(Base):
     )
 
 
+TICKET_NUMBER_COUNTER = "ticket_number"
+
+
+class Counter(Base):
+    __tablename__ = "counters"
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, default=0)
+
+
 class TicketMessage(Base):
     __tablename__ = "ticket_messages"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    ticket_id: Mapped[int] = mapped_column(Integer, ForeignKey("tickets.id"))
+    ticket_id: Mapped[int] = mapped_column(Integer, ForeignKey("tickets.id"), index=True)
     sender_id: Mapped[int] = mapped_column(BigInteger)
     sender_role: Mapped[str] = mapped_column(String(20))
     text: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -73,3 +117,69 @@ class TicketMessage(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     ticket: Mapped["Ticket"] = relationship(back_populates="messages")
+
+
+class FsmRecord(Base):
+    """aiogram FSM state and data of one storage key, see bot.db.fsm_storage."""
+
+    __tablename__ = "fsm_states"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    data: Mapped[str] = mapped_column(Text, default="{}")
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class PromptRecord(Base):
+    """Pending "reply to this message" prompt in the admin chat, see bot.db.prompts."""
+
+    __tablename__ = "prompts"
+
+    message_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    kind: Mapped[str] = mapped_column(String(10))
+    ticket_id: Mapped[int] = mapped_column(Integer)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+
+class Lease(Base):
+    """Time-limited ownership of a singleton role in cluster mode, see bot.db.lease."""
+
+    __tablename__ = "leases"
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(100))
+    expires_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+# --- Archive (attached SQLite database "archive") ---
+
+archive_metadata = MetaData(schema="archive")
+
+
+def _archive_columns(table: Table, primary_key: bool) -> list[Column]:
+    return [
+        Column(
+            c.name, c.type,
+            primary_key=primary_key and c.primary_key,
+            nullable=c.nullable,
+            server_default=c.server_default.arg if c.server_default is not None else None,
+        )
+        for c in table.columns
+    ]
+
+
+archived_tickets = Table(
+    "tickets",
+    archive_metadata,
+    *_archive_columns(Ticket.__table__, primary_key=True),
+    Index("ix_archive_tickets_user_created", "user_id", "created_at"),
+)
+
+# Message ids can be reused by the hot table once its newest rows are archived,
+# so here they are plain values and rows are replaced per ticket instead.
+archived_ticket_messages = Table(
+    "ticket_messages",
+    archive_metadata,
+    *_archive_columns(TicketMessage.__table__, primary_key=False),
+    Index("ix_archive_ticket_messages_ticket_id", "ticket_id"),
+)
@@ -0,0 +1,178 @@
+"""Process-local index of open tickets.
+
+Button handlers mostly need a few fields of an open ticket (status, user,
+assigned admin, admin-chat message). They are served from here instead of
+SQLite. The index is loaded at startup and updated write-through: ticket
+changes are collected at flush and applied once the transaction commits.
+Closed and deleted tickets are dropped.
+
+All ticket writes go through the ORM (see TicketRepository); a Core UPDATE
+of an open ticket would bypass the index. The archive job only moves
+closed tickets, which are never in it.
+"""
+import asyncio
+import logging
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.orm import Session
+
+from bot.config import settings
+from bot.db.database import engine
+from bot.db.models import Ticket
+from bot.utils.broadcast import broadcast, subscribe
+from bot.utils.ticket import OPEN_STATUSES, parse_ticket_number
+
+logger = logging.getLogger(__name__)
+
+
+class OpenTicket:
+    """Read-only snapshot of an open ticket."""
+
+    __slots__ = ("id", "ticket_number", "user_id", "admin_id", "status", "message_id")
+
+    def __init__(self, id, ticket_number, user_id, admin_id, status, message_id) -> None:
+        self.id = id
+        self.ticket_number = ticket_number
+        self.user_id = user_id
+        self.admin_id = admin_id
+        self.status = status
+        self.message_id = message_id
+
+    @classmethod
+    def of(cls, ticket) -> "OpenTicket":
+        return cls(*(getattr(ticket, name) for name in cls.__slots__))
+
+    def as_tuple(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+
+_COLUMNS = [getattr(Ticket, name) for name in OpenTicket.__slots__]
+
+
+class OpenTicketStore:
+    def __init__(self) -> None:
+        self._by_id: dict[int, OpenTicket] = {}
+        self._by_message: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def get(self, ticket_id: int) -> OpenTicket | None:
+        return self._by_id.get(ticket_id)
+
+    def get_by_number(self, ticket_number: str) -> OpenTicket | None:
+        ticket_id = parse_ticket_number(ticket_number)
+        return self._by_id.get(ticket_id) if ticket_id is not None else None
+
+    def get_by_message(self, message_id: int) -> OpenTicket | None:
+        ticket_id = self._by_message.get(message_id)
+        return self._by_id.get(ticket_id) if ticket_id is not None else None
+
+    def put(self, record: OpenTicket) -> None:
+        self.discard(record.id)
+        if record.status not in OPEN_STATUSES:
+            return
+        self._by_id[record.id] = record
+        if record.message_id is not None:
+            self._by_message[record.message_id] = record.id
+
+    def discard(self, ticket_id: int) -> None:
+        old = self._by_id.pop(ticket_id, None)
+        if old is not None and old.message_id is not None:
+            self._by_message.pop(old.message_id, None)
+
+    async def _load(self, conn: AsyncConnection) -> dict[int, OpenTicket]:
+        rows = await conn.execute(select(*_COLUMNS).where(Ticket.status.in_(OPEN_STATUSES)))
+        return {row.id: OpenTicket.of(row) for row in rows}
+
+    async def warm(self, conn: AsyncConnection) -> None:
+        self._by_id.clear()
+        self._by_message.clear()
+        for record in (await self._load(conn)).values():
+            self.put(record)
+        logger.info("Open ticket index loaded: %d tickets", len(self))
+
+    async def reload(self, conn: AsyncConnection, ticket_id: int) -> None:
+        """Re-read one ticket, e.g. after another worker changed it."""
+        row = (await conn.execute(select(*_COLUMNS).where(Ticket.id == ticket_id))).first()
+        if row is None:
+            self.discard(ticket_id)
+        else:
+            self.put(OpenTicket.of(row))
+
+    async def diff(self, conn: AsyncConnection) -> list[str]:
+        """Differences between the index and the tickets table (empty if consistent)."""
+        expected = await self._load(conn)
+        problems = []
+        for ticket_id in expected.keys() | self._by_id.keys():
+            want, have = expected.get(ticket_id), self._by_id.get(ticket_id)
+            if want is None or have is None or want.as_tuple() != have.as_tuple():
+                problems.append(
+                    f"ticket {ticket_id}: db={want and want.as_tuple()} "
+                    f"index={have and have.as_tuple()}"
+                )
+        for message_id, ticket_id in self._by_message.items():
+            if self._by_id.get(ticket_id) is None or self._by_id[ticket_id].message_id != message_id:
+                problems.append(f"message {message_id}: dangling entry for ticket {ticket_id}")
+        return problems
+
+
+open_tickets = OpenTicketStore()
+
+_PENDING_TICKETS = "pending_open_tickets"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_ticket_changes(session: Session, flush_context) -> None:
+    pending = session.info.setdefault(_PENDING_TICKETS, {})
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Ticket):
+            pending[obj.id] = OpenTicket.of(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Ticket):
+            pending[obj.id] = None
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_ticket_changes(session: Session) -> None:
+    for ticket_id, record in session.info.pop(_PENDING_TICKETS, {}).items():
+        if record is None:
+            open_tickets.discard(ticket_id)
+        else:
+            open_tickets.put(record)
+        # Other workers reload the ticket (index entry and reminder deadline)
+        broadcast.publish("ticket", ticket_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_ticket_changes(session: Session) -> None:
+    session.info.pop(_PENDING_TICKETS, None)
+
+
+@subscribe("ticket")
+async def _reload_ticket(ticket_id: int) -> None:
+    async with engine.connect() as conn:
+        await open_tickets.reload(conn, ticket_id)
+
+
+async def warm_open_tickets() -> None:
+    async with engine.connect() as conn:
+        await open_tickets.warm(conn)
+
+
+async def open_tickets_check_loop() -> None:
+    """Consistency check mode: periodically compare the index with the DB."""
+    interval = settings.OPEN_TICKETS_CHECK_INTERVAL
+    if not interval:
+        return
+    logger.info("Open ticket index check started (interval: %ds)", interval)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with engine.connect() as conn:
+                problems = await open_tickets.diff(conn)
+            for problem in problems:
+                logger.error("Open ticket index out of sync: %s", problem)
+        except Exception:
+            logger.exception("Error in open ticket index check")
@@ -0,0 +1,134 @@
+"""Pending admin chat prompts ("ответьте на это сообщение …").
+
+A prompt maps the bot's prompt message to a ticket until an admin replies
+to it or cancels. Ignored prompts used to stay in a dict forever; here they
+expire after ``ttl`` and the oldest is evicted beyond ``maxsize``. The TTL
+is the same for every entry, so insertion order is expiry order and
+expiring is popping from the front of an OrderedDict.
+
+With ``persist`` the prompts table is the source of truth: prompts survive
+a restart and work with several workers. pop() then looks the row up first
+and only a hit is consumed with DELETE ... RETURNING, so only one worker
+can consume a prompt. The DB work runs in its own short transaction: most
+admin chat replies aren't to a prompt, and none of them should hold the
+SQLite write lock while the handler talks to Telegram.
+"""
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from bot.config import settings
+from bot.db.database import async_session
+from bot.db.models import PromptRecord
+from bot.utils.cache import caches
+
+REPLY = "reply"
+EDIT = "edit"
+
+
+class Prompt(NamedTuple):
+    kind: str
+    ticket_id: int
+
+
+class PromptRegistry:
+    def __init__(self, name: str, maxsize: int, ttl: float, persist: bool) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.persist = persist
+        self.added = 0
+        self.consumed = 0
+        self.expired = 0
+        self.evicted = 0
+        # message_id -> (expires_at, Prompt), oldest first
+        self._data: OrderedDict[int, tuple[float, Prompt]] = OrderedDict()
+        caches[name] = self
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._data:
+            message_id, (expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            del self._data[message_id]
+            self.expired += 1
+
+    async def add(self, message_id: int, kind: str, ticket_id: int) -> None:
+        self._expire()
+        self._data.pop(message_id, None)
+        self._data[message_id] = (time.monotonic() + self.ttl, Prompt(kind, ticket_id))
+        self.added += 1
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evicted += 1
+        if self.persist:
+            now = datetime.utcnow()
+            stmt = sqlite_insert(PromptRecord).values(
+                message_id=message_id,
+                kind=kind,
+                ticket_id=ticket_id,
+                expires_at=now + timedelta(seconds=self.ttl),
+            )
+            async with async_session() as session:
+                await session.execute(delete(PromptRecord).where(PromptRecord.expires_at < now))
+                await session.execute(stmt.on_conflict_do_update(
+                    index_elements=[PromptRecord.message_id],
+                    set_={
+                        "kind": stmt.excluded.kind,
+                        "ticket_id": stmt.excluded.ticket_id,
+                        "expires_at": stmt.excluded.expires_at,
+                    },
+                ))
+                await session.commit()
+
+    async def pop(self, message_id: int) -> Prompt | None:
+        """Consume the prompt behind ``message_id``, if it is still pending."""
+        self._expire()
+        entry = self._data.pop(message_id, None)
+        prompt = entry[1] if entry is not None else None
+        if self.persist:
+            prompt = await self._pop_persisted(message_id)
+        if prompt is not None:
+            self.consumed += 1
+        return prompt
+
+    async def _pop_persisted(self, message_id: int) -> Prompt | None:
+        now = datetime.utcnow()
+        pending = (
+            PromptRecord.message_id == message_id,
+            PromptRecord.expires_at >= now,
+        )
+        async with async_session() as session:
+            # A plain read first: replies to anything but a prompt never write
+            found = await session.scalar(select(PromptRecord.message_id).where(*pending))
+            if found is None:
+                return None
+            row = (await session.execute(
+                delete(PromptRecord)
+                .where(*pending)
+                .returning(PromptRecord.kind, PromptRecord.ticket_id)
+            )).first()
+            await session.commit()
+        return Prompt(row.kind, row.ticket_id) if row is not None else None
+
+    def describe(self) -> str:
+        return (
+            f"{self.name}: {len(self)}/{self.maxsize}, added {self.added}, "
+            f"consumed {self.consumed}, expired {self.expired}, evicted {self.evicted}"
+        )
+
+
+prompts = PromptRegistry(
+    "prompts",
+    maxsize=settings.PROMPT_MAX_SIZE,
+    ttl=settings.PROMPT_TTL,
+    persist=settings.PROMPT_PERSIST,
+)
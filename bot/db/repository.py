@@ -0,0 +1,301 @@
+"""All ticket / user / admin queries used by handlers and background jobs.
+
+Point lookups by primary key go through ``session.get()`` (identity map
+first, cached loader otherwise). Other fixed-shape queries are lambda
+statements: SQLAlchemy caches both the constructed statement and its
+compiled SQL on the lambda's code location, so a call only binds new
+parameter values.
+"""
+from datetime import datetime
+
+from sqlalchemy import (
+    Row, bindparam, delete as sa_delete, event, lambda_stmt, or_, select, update,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from bot.config import settings
+from bot.db.archive import get_archived_ticket, get_user_tickets_page
+from bot.db.models import TICKET_NUMBER_COUNTER, Admin, Counter, Ticket, TicketMessage, User
+from bot.db.open_tickets import OpenTicket, open_tickets
+from bot.db.search import search_tickets
+from bot.utils.broadcast import broadcast, subscribe
+from bot.utils.cache import LRUCache
+from bot.utils.pagination import OLDER, PAGE_SIZE, Cursor, Page, keyset, make_page
+from bot.utils.ticket import format_ticket_number, parse_ticket_number
+
+_UNSET = object()
+
+# Open tickets as the partial indexes define them (models.OPEN_WHERE), with
+# 'closed' rendered inline so SQLite can match the index WHERE
+_OPEN = Ticket.status != bindparam("closed", "closed", literal_execute=True)
+
+# user_id -> (username, full_name) as last committed to the users table
+user_cache = LRUCache("users", settings.USER_CACHE_SIZE)
+
+_PENDING_USERS = "pending_users"
+
+
+class TicketRepository:
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    # --- Lookups ---
+
+    async def get_by_id(self, ticket_id: int) -> Ticket | None:
+        return await self.session.get(Ticket, ticket_id)
+
+    async def get_by_number(self, ticket_number: str) -> Ticket | None:
+        """Ticket numbers are the primary key, so this is an identity lookup."""
+        ticket_id = parse_ticket_number(ticket_number)
+        if ticket_id is None:
+            return None
+        return await self.get_by_id(ticket_id)
+
+    async def get_any(self, ticket_id: int) -> Ticket | Row | None:
+        """Hot ticket, or a read-only row from the archive."""
+        return await self.get_by_id(ticket_id) or await get_archived_ticket(self.session, ticket_id)
+
+    async def get_by_admin_message(self, message_id: int) -> Ticket | None:
+        result = await self.session.execute(
+            lambda_stmt(lambda: select(Ticket).where(Ticket.message_id == message_id))
+        )
+        return result.scalar_one_or_none()
+
+    # Read-only lookups: open tickets come from the in-memory index, anything
+    # else (closed, or not a ticket at all) falls through to the DB. Load the
+    # ticket with get_by_id() to change it.
+
+    async def lookup(self, ticket_id: int) -> OpenTicket | Ticket | None:
+        return open_tickets.get(ticket_id) or await self.get_by_id(ticket_id)
+
+    async def lookup_by_number(self, ticket_number: str) -> OpenTicket | Ticket | None:
+        return open_tickets.get_by_number(ticket_number) or await self.get_by_number(ticket_number)
+
+    async def lookup_by_admin_message(self, message_id: int) -> OpenTicket | Ticket | None:
+        return (
+            open_tickets.get_by_message(message_id)
+            or await self.get_by_admin_message(message_id)
+        )
+
+    # --- Lists ---
+
+    async def list_open_page(
+        self,
+        status: str | None = None,
+        priority: str | None = None,
+        category: str | None = None,
+        cursor: Cursor | None = None,
+        direction: str = OLDER,
+        page_size: int = PAGE_SIZE,
+    ) -> Page:
+        stmt = select(Ticket)
+        if status:
+            stmt = stmt.where(Ticket.status == status)
+        else:
+            # Not status IN OPEN_STATUSES: SQLite would pick (status, created_at)
+            # and sort the whole open queue in a temp B-tree
+            stmt = stmt.where(_OPEN)
+        if priority:
+            stmt = stmt.where(Ticket.priority == priority)
+        if category:
+            stmt = stmt.where(Ticket.category == category)
+        result = await self.session.execute(
+            keyset(stmt, (Ticket.created_at, Ticket.id), cursor, direction, page_size + 1)
+        )
+        return make_page(list(result.scalars()), cursor, direction, page_size)
+
+    async def list_user_page(
+        self, user_id: int, cursor: Cursor | None = None, direction: str = OLDER
+    ) -> Page:
+        return await get_user_tickets_page(self.session, user_id, cursor, direction)
+
+    async def list_admin_open(self, admin_id: int, limit: int) -> list[Ticket]:
+        result = await self.session.execute(lambda_stmt(
+            lambda: select(Ticket)
+            .where(Ticket.admin_id == admin_id, _OPEN)
+            .order_by(Ticket.created_at.desc())
+            .limit(limit)
+        ))
+        return list(result.scalars())
+
+    async def search(self, query: str, limit: int, offset: int = 0) -> list[Ticket]:
+        return await search_tickets(self.session, query, limit, offset)
+
+    # --- Writes ---
+
+    async def create(
+        self,
+        user_id: int,
+        category: str,
+        priority: str,
+        description: str,
+        file_id: str | None = None,
+    ) -> Ticket:
+        """Allocate the next ticket number and add the ticket with its first message.
+
+        The counter bump takes SQLite's write lock, so concurrent creations are
+        serialized and the number is also the ticket's primary key. Call it before
+        any reads in the transaction (a WAL reader can't upgrade to a writer once
+        another connection has committed). Caller commits.
+        """
+        result = await self.session.execute(
+            sqlite_insert(Counter)
+            .values(name=TICKET_NUMBER_COUNTER, value=1)
+            .on_conflict_do_update(
+                index_elements=[Counter.name], set_={"value": Counter.value + 1}
+            )
+            .returning(Counter.value)
+        )
+        ticket_id = result.scalar_one()
+
+        ticket = Ticket(
+            id=ticket_id,
+            ticket_number=format_ticket_number(ticket_id),
+            user_id=user_id,
+            category=category,
+            priority=priority,
+            status="new",
+            description=description,
+        )
+        self.session.add(ticket)
+        self.session.add(TicketMessage(
+            ticket=ticket,
+            sender_id=user_id,
+            sender_role="user",
+            text=description,
+            file_id=file_id,
+        ))
+        return ticket
+
+    def transition(self, ticket: Ticket, status: str, admin_id: int | None = _UNSET) -> None:
+        """Move ``ticket`` to ``status`` (and optionally reassign it). Caller commits.
+
+        Goes through the ORM object so the stats counters see the change.
+        """
+        ticket.status = status
+        if admin_id is not _UNSET:
+            ticket.admin_id = admin_id
+        if status == "closed":
+            ticket.closed_at = datetime.utcnow()
+        # Reminders start over in the new status
+        ticket.reminder_level = 0
+
+    async def take(self, ticket: Ticket, admin_id: int) -> bool:
+        """Take a new ticket into work. Caller commits. False if it is no
+        longer new.
+
+        The status check is an UPDATE, so it holds the write lock until the
+        commit: a stale open ticket view or loaded row can't let two admins
+        take the same ticket, or reopen a closed one. The transition itself
+        goes through transition() for the stats counters.
+        """
+        result = await self.session.execute(
+            update(Ticket)
+            .where(Ticket.id == ticket.id, Ticket.status == "new")
+            .values(updated_at=Ticket.updated_at)
+        )
+        if result.rowcount != 1:
+            return False
+        await self.session.refresh(ticket)
+        self.transition(ticket, "in_progress", admin_id=admin_id)
+        return True
+
+    async def claim_reminder(self, ticket_id: int, status: str, level: int) -> bool:
+        """Record that reminder ``level`` is being sent. False if the ticket has
+        moved on or the reminder was already claimed.
+
+        A Core UPDATE that keeps updated_at: a reminder must not age the
+        ticket, and none of these columns are in the open ticket index.
+        """
+        result = await self.session.execute(
+            update(Ticket)
+            .where(Ticket.id == ticket_id, Ticket.status == status, Ticket.reminder_level == level)
+            .values(
+                reminder_level=level + 1,
+                last_reminded_at=datetime.utcnow(),
+                updated_at=Ticket.updated_at,
+            )
+        )
+        return result.rowcount == 1
+
+    async def clear_history(self, ticket_id: int) -> None:
+        await self.session.execute(
+            sa_delete(TicketMessage).where(TicketMessage.ticket_id == ticket_id)
+        )
+
+    async def delete(self, ticket: Ticket) -> None:
+        await self.session.delete(ticket)
+
+
+class UserRepository:
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def get(self, user_id: int) -> User | None:
+        return await self.session.get(User, user_id)
+
+    async def ensure(self, user_id: int, username: str | None, full_name: str) -> None:
+        """Store the user's current profile: no statement at all if it is cached
+        unchanged, otherwise a single upsert that only writes a row that differs.
+        """
+        profile = (username, full_name)
+        if user_cache.get(user_id) == profile:
+            return
+        stmt = sqlite_insert(User).values(id=user_id, username=username, full_name=full_name)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.id],
+            set_={"username": stmt.excluded.username, "full_name": stmt.excluded.full_name},
+            where=or_(
+                User.username.is_distinct_from(stmt.excluded.username),
+                User.full_name != stmt.excluded.full_name,
+            ),
+        )
+        await self.session.execute(stmt)
+        # Cached once committed, see _remember_committed_users
+        self.session.info.setdefault(_PENDING_USERS, {})[user_id] = profile
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_committed_users(session: Session) -> None:
+    for user_id, profile in session.info.pop(_PENDING_USERS, {}).items():
+        user_cache.put(user_id, profile)
+        broadcast.publish("user", user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending_users(session: Session) -> None:
+    session.info.pop(_PENDING_USERS, None)
+
+
+@subscribe("user")
+def _forget_user(user_id: int) -> None:
+    # Another worker stored a newer profile
+    user_cache.pop(user_id)
+
+
+class AdminRepository:
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def get(self, admin_id: int) -> Admin | None:
+        return await self.session.get(Admin, admin_id)
+
+    async def is_active(self, user_id: int) -> bool:
+        result = await self.session.execute(lambda_stmt(
+            lambda: select(Admin.id).where(Admin.id == user_id, Admin.is_active.is_(True))
+        ))
+        return result.scalar_one_or_none() is not None
+
+    async def active_ids(self) -> list[int]:
+        result = await self.session.execute(
+            lambda_stmt(lambda: select(Admin.id).where(Admin.is_active.is_(True)))
+        )
+        return list(result.scalars())
+
+    async def list_active(self) -> list[Admin]:
+        result = await self.session.execute(
+            lambda_stmt(lambda: select(Admin).where(Admin.is_active.is_(True)))
+        )
+        return list(result.scalars())
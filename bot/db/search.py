@@ -0,0 +1,109 @@
+import re
+
+from sqlalchemy import Row, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from bot.db.models import Ticket, archived_tickets
+
+_TOKENIZE = "unicode61 remove_diacritics 2"
+
+# External-content FTS5 indexes over tickets.description and
+# ticket_messages.text, kept in sync by triggers so every write path
+# (ORM, bulk deletes, archival) is covered. The archive database has the
+# same pair over its own tables, so archived tickets stay searchable.
+_SCHEMAS = ("main", "archive")
+
+# FTS table -> (content table, indexed column)
+_FTS_TABLES = {
+    "tickets_fts": ("tickets", "description"),
+    "ticket_messages_fts": ("ticket_messages", "text"),
+}
+
+_CREATE_FTS = (
+    "CREATE VIRTUAL TABLE {schema}.{fts} USING fts5("
+    "{column}, content='{table}', "
+    f"tokenize='{_TOKENIZE}', prefix='2 3')"
+)
+
+# Rows are keyed by rowid: it is the id of the hot tables, while archived
+# messages keep their ids as plain values that may repeat (a VACUUM may
+# renumber those rowids: rebuild archive.ticket_messages_fts after one).
+# A trigger lives in its table's database, and its body can only refer to it.
+_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS {schema}.{fts}_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {fts}(rowid, {column}) VALUES (new.rowid, new.{column});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {schema}.{fts}_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.rowid, old.{column});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {schema}.{fts}_au AFTER UPDATE OF {column} ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.rowid, old.{column});
+        INSERT INTO {fts}(rowid, {column}) VALUES (new.rowid, new.{column});
+    END""",
+]
+
+_MATCHES = """
+        SELECT rowid AS ticket_id, bm25(tickets_fts) AS score
+        FROM {schema}.tickets_fts WHERE tickets_fts MATCH :query
+        UNION ALL
+        SELECT m.ticket_id, bm25(ticket_messages_fts) AS score
+        FROM {schema}.ticket_messages_fts
+        JOIN {schema}.ticket_messages AS m ON m.rowid = ticket_messages_fts.rowid
+        WHERE ticket_messages_fts MATCH :query"""
+
+# Best bm25 score per ticket over its description and all of its messages,
+# hot and archived
+_SEARCH_SQL = text("""
+    SELECT ticket_id, MIN(score) AS score FROM ({matches}
+    )
+    GROUP BY ticket_id
+    ORDER BY score, ticket_id DESC
+    LIMIT :limit OFFSET :offset
+""".format(matches="\n        UNION ALL".join(_MATCHES.format(schema=schema) for schema in _SCHEMAS)))
+
+
+async def init_search(conn: AsyncConnection) -> None:
+    for schema in _SCHEMAS:
+        existing = set((await conn.execute(text(
+            f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table' AND name LIKE '%_fts'"
+        ))).scalars())
+        for fts, (table, column) in _FTS_TABLES.items():
+            names = {"schema": schema, "fts": fts, "table": table, "column": column}
+            if fts not in existing:
+                await conn.execute(text(_CREATE_FTS.format(**names)))
+                # Index rows written before the FTS table existed
+                await conn.execute(text(f"INSERT INTO {schema}.{fts}({fts}) VALUES ('rebuild')"))
+            for ddl in _TRIGGERS:
+                await conn.execute(text(ddl.format(**names)))
+
+
+def match_expression(query: str) -> str | None:
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+async def search_tickets(
+    session: AsyncSession, query: str, limit: int, offset: int = 0
+) -> list[Ticket | Row]:
+    """Best matches first; archived tickets come as read-only rows."""
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    rows = (await session.execute(
+        _SEARCH_SQL, {"query": expression, "limit": limit, "offset": offset}
+    )).all()
+    if not rows:
+        return []
+    ticket_ids = [row.ticket_id for row in rows]
+    result = await session.execute(select(Ticket).where(Ticket.id.in_(ticket_ids)))
+    by_id = {t.id: t for t in result.scalars()}
+    archived_ids = [i for i in ticket_ids if i not in by_id]
+    if archived_ids:
+        result = await session.execute(
+            select(archived_tickets).where(archived_tickets.c.id.in_(archived_ids))
+        )
+        by_id.update((row.id, row) for row in result)
+    return [by_id[i] for i in ticket_ids if i in by_id]
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from collections import Counter as Tally
+
+from sqlalchemy import delete, event, func, inspect, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.orm import Session
+
+from bot.config import settings
+from bot.db.database import engine
+from bot.db.models import Counter, Ticket, archived_tickets
+
+logger = logging.getLogger(__name__)
+
+STATS_PREFIX = "stats:"
+TOTAL = "stats:total"
+RATING_COUNT = "stats:rating_count"
+RATING_SUM = "stats:rating_sum"
+
+# Names under STATS_PREFIX as a key range (";" follows ":"), so SQLite
+# searches the primary key instead of scanning counters as it does for LIKE
+_STATS_NAMES = (Counter.name >= STATS_PREFIX, Counter.name < "stats;")
+
+
+def status_key(status: str) -> str:
+    return f"stats:status:{status}"
+
+
+def priority_key(priority: str) -> str:
+    return f"stats:priority:{priority}"
+
+
+def _count_ticket(tally: Tally, status, priority, rating, sign: int) -> None:
+    tally[TOTAL] += sign
+    tally[status_key(status)] += sign
+    tally[priority_key(priority)] += sign
+    if rating is not None:
+        tally[RATING_COUNT] += sign
+        tally[RATING_SUM] += sign * rating
+
+
+_COUNTED_ATTRS = ("status", "priority", "rating")
+
+
+def _values(ticket: Ticket, attr: str) -> tuple[object, object]:
+    """(value in the database before this flush, value after it)."""
+    history = inspect(ticket).attrs[attr].history
+    before = (history.deleted or history.unchanged or [None])[0]
+    after = (history.added or history.unchanged or [None])[0]
+    return before, after
+
+
+def _ticket_deltas(session: Session) -> Tally:
+    tally: Tally = Tally()
+    for obj in session.new:
+        if isinstance(obj, Ticket):
+            _count_ticket(tally, obj.status, obj.priority, obj.rating, +1)
+    for obj in session.dirty:
+        if isinstance(obj, Ticket) and session.is_modified(obj):
+            before, after = zip(*(_values(obj, attr) for attr in _COUNTED_ATTRS))
+            _count_ticket(tally, *before, -1)
+            _count_ticket(tally, *after, +1)
+    for obj in session.deleted:
+        if isinstance(obj, Ticket):
+            before = (_values(obj, attr)[0] for attr in _COUNTED_ATTRS)
+            _count_ticket(tally, *before, -1)
+    return tally
+
+
+@event.listens_for(Session, "after_flush")
+def _update_stats_counters(session: Session, flush_context) -> None:
+    """Apply ticket creation/transition/deletion deltas in the flushing transaction."""
+    deltas = {name: value for name, value in _ticket_deltas(session).items() if value}
+    if not deltas:
+        return
+    stmt = sqlite_insert(Counter).values(
+        [{"name": name, "value": value} for name, value in deltas.items()]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Counter.name],
+        set_={"value": Counter.value + stmt.excluded.value},
+    )
+    session.connection().execute(stmt)
+
+
+async def compute_stats(conn: AsyncConnection) -> dict[str, int]:
+    """Recount every stats counter from hot and archived tickets."""
+    tickets = union_all(
+        select(Ticket.status, Ticket.priority, Ticket.rating),
+        select(archived_tickets.c.status, archived_tickets.c.priority, archived_tickets.c.rating),
+    ).subquery()
+    rows = (await conn.execute(
+        select(
+            tickets.c.status,
+            tickets.c.priority,
+            func.count(),
+            func.count(tickets.c.rating),
+            func.coalesce(func.sum(tickets.c.rating), 0),
+        ).group_by(tickets.c.status, tickets.c.priority)
+    )).all()
+
+    tally: Tally = Tally()
+    for status, priority, count, rating_count, rating_sum in rows:
+        tally[TOTAL] += count
+        tally[status_key(status)] += count
+        tally[priority_key(priority)] += count
+        tally[RATING_COUNT] += rating_count
+        tally[RATING_SUM] += rating_sum
+    return dict(tally)
+
+
+async def reconcile_stats(conn: AsyncConnection) -> None:
+    """Rewrite the stats counters from a full recount, logging any drift."""
+    # Take the write lock first so no ticket write lands between count and store
+    current = dict((await conn.execute(
+        delete(Counter)
+        .where(*_STATS_NAMES)
+        .returning(Counter.name, Counter.value)
+    )).all())
+    expected = await compute_stats(conn)
+    if expected:
+        await conn.execute(
+            sqlite_insert(Counter),
+            [{"name": name, "value": value} for name, value in expected.items()],
+        )
+
+    drift = {
+        name: (current.get(name, 0), expected.get(name, 0))
+        for name in current.keys() | expected.keys()
+        if current.get(name, 0) != expected.get(name, 0)
+    }
+    if drift and current:
+        logger.warning("Stats counters drifted, repaired: %s", drift)
+
+
+async def read_stats(conn: AsyncConnection) -> dict[str, int]:
+    rows = await conn.execute(
+        select(Counter.name, Counter.value).where(*_STATS_NAMES)
+    )
+    return dict(rows.all())
+
+
+async def stats_reconcile_loop() -> None:
+    """Recount at startup (this also seeds the counters), then periodically."""
+    logger.info(
+        "Stats reconcile loop started (interval: %ds)", settings.STATS_RECONCILE_INTERVAL
+    )
+    while True:
+        try:
+            async with engine.begin() as conn:
+                await reconcile_stats(conn)
+        except Exception:
+            logger.exception("Error in stats reconciliation")
+        await asyncio.sleep(settings.STATS_RECONCILE_INTERVAL)
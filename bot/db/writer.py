@@ -0,0 +1,90 @@
+import asyncio
+import logging
+
+from bot.config import settings
+from bot.db.database import async_session
+from bot.db.models import Base
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """Group-commits append-only inserts coming from concurrent handlers.
+
+    Rows queued within ``max_delay`` seconds of each other (up to ``max_batch``)
+    share one transaction and one fsync. ``add()`` returns only after the
+    transaction holding the row has committed.
+    """
+
+    def __init__(self, max_batch: int, max_delay: float) -> None:
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._queue: asyncio.Queue[tuple[Base, asyncio.Future] | None] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    async def add(self, obj: Base) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((obj, future))
+        await future
+
+    async def close(self) -> None:
+        """Commit everything still queued and stop the writer task."""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(None)
+        await self._task
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = loop.time() + self._max_delay
+            closing = False
+            while len(batch) < self._max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if closing:
+                return
+
+    async def _flush(self, batch: list[tuple[Base, asyncio.Future]]) -> None:
+        try:
+            async with async_session() as session:
+                session.add_all(obj for obj, _ in batch)
+                await session.commit()
+        except Exception:
+            if len(batch) == 1:
+                obj, future = batch[0]
+                logger.exception("Failed to write %r", obj)
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Failed to write {obj!r}"))
+                return
+            # Retry row by row so one bad row doesn't fail its neighbours
+            logger.warning("Batch of %d rows failed, retrying one by one", len(batch))
+            for entry in batch:
+                await self._flush([entry])
+            return
+
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+
+batch_writer = BatchWriter(
+    max_batch=settings.WRITE_BATCH_SIZE,
+    max_delay=settings.WRITE_BATCH_DELAY_MS / 1000,
+)
@@ -1,16 +1,29 @@
+import html
 import logging
 import re
-from datetime import datetime
 
 from aiogram import F, Router
 from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
-from sqlalchemy import delete as sa_delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.config import settings
-from bot.db.database import async_session
-from bot.db.models import Admin, Ticket, TicketMessage, User
+from bot.db.models import Admin, TicketMessage
+from bot.db.prompts import EDIT, REPLY, prompts
+from bot.db.repository import AdminRepository, TicketRepository, UserRepository
+from bot.db.stats import (
+    RATING_COUNT,
+    RATING_SUM,
+    TOTAL,
+    priority_key,
+    read_stats,
+    status_key,
+)
+from bot.db.writer import batch_writer
 from bot.keyboards.inline import (
+    CATEGORIES,
+    PRIORITIES,
     admin_categories_keyboard,
     admin_confirm_clear_keyboard,
     admin_confirm_delete_keyboard,
@@ -18,14 +31,26 @@ from bot.keyboards.inline import (
     admin_my_tickets_keyboard,
     admin_priorities_keyboard,
     main_menu_keyboard,
+    page_nav_keyboard,
     reply_to_ticket_keyboard,
     take_ticket_keyboard,
     ticket_taken_keyboard,
 )
-from bot.middlewares.access import is_admin
-from bot.utils.ticket import (
+from bot.middlewares.access import admin_roster, is_admin
+from bot.utils.admin_names import admin_names
+from bot.utils.cache import caches
+from bot.utils.notify import fan_out
+from bot.utils.pagination import NEWER, OLDER, Cursor
+from bot.utils.render import (
+    edit_markup,
+    edit_text,
+    format_manage_card,
     format_ticket,
     format_ticket_status,
+)
+from bot.utils.ticket import (
+    OPEN_STATUSES,
+    STATUS_LABELS,
     get_category_label,
     get_priority_label,
 )
@@ -36,7 +61,7 @@ router = Router()
 
 
 @router.callback_query(F.data.startswith("take_ticket:"))
-async def cb_take_ticket(callback: CallbackQuery) -> None:
+async def cb_take_ticket(callback: CallbackQuery, session: AsyncSession) -> None:
     user = callback.from_user
     if not await is_admin(user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
@@ -44,44 +69,51 @@ async def cb_take_ticket(callback: CallbackQuery) -> None:
 
     ticket_id = int(callback.data.split(":")[1])
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        ticket = result.scalar_one_or_none()
+    repo = TicketRepository(session)
+    # Repeated clicks on a taken ticket are answered from memory
+    view = await repo.lookup(ticket_id)
 
-        if ticket is None:
-            await callback.answer("Заявка не найдена.", show_alert=True)
-            return
+    if view is None:
+        await callback.answer("Заявка не найдена.", show_alert=True)
+        return
 
-        if ticket.status != "new":
-            await callback.answer("Заявка уже взята в работу.", show_alert=True)
-            return
+    if view.status != "new":
+        await callback.answer("Заявка уже взята в работу.", show_alert=True)
+        return
 
-        ticket.admin_id = user.id
-        ticket.status = "in_progress"
-        await session.commit()
-        user_id = ticket.user_id
-        ticket_number = ticket.ticket_number
+    ticket = await repo.get_by_id(ticket_id)
+    if ticket is None:
+        await callback.answer("Заявка не найдена.", show_alert=True)
+        return
+    if not await repo.take(ticket, user.id):
+        # Release the write lock before talking to Telegram
+        await session.rollback()
+        await callback.answer("Заявка уже взята в работу.", show_alert=True)
+        return
+    await session.commit()
+    user_id = ticket.user_id
+    ticket_number = ticket.ticket_number
 
     admin_name = f"@{user.username}" if user.username else user.full_name
 
-    await callback.message.edit_reply_markup(
-        reply_markup=ticket_taken_keyboard(admin_name, ticket_id),
-    )
-    await callback.answer("Вы взяли заявку в работу.")
-
-    try:
-        await callback.bot.send_message(
+    await fan_out((
+        callback.bot.send_message(
             user_id,
-            f"🔧 Ваша заявка {ticket_number} взята в работу администратором {admin_name}.",
-        )
-    except Exception:
-        logger.warning("Could not notify user %s about ticket %s", user_id, ticket_number)
+            f"🔧 Ваша заявка {ticket_number} взята в работу администратором {html.escape(admin_name)}.",
+        ),
+        f"Could not notify user {user_id} about ticket {ticket_number}",
+    ), wait=False)
+    await fan_out(
+        (
+            edit_markup(callback.message, ticket_taken_keyboard(admin_name, ticket_id)),
+            f"Could not update admin chat card of ticket {ticket_number}",
+        ),
+        (callback.answer("Вы взяли заявку в работу."), "Could not answer callback"),
+    )
 
 
 @router.callback_query(F.data.startswith("close_ticket:"))
-async def cb_close_ticket(callback: CallbackQuery) -> None:
+async def cb_close_ticket(callback: CallbackQuery, session: AsyncSession) -> None:
     user = callback.from_user
     if not await is_admin(user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
@@ -89,37 +121,33 @@ async def cb_close_ticket(callback: CallbackQuery) -> None:
 
     ticket_id = int(callback.data.split(":")[1])
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket = await TicketRepository(session).get_by_id(ticket_id)
 
-        if ticket is None:
-            await callback.answer("Заявка не найдена.", show_alert=True)
-            return
-
-        if ticket.status == "closed":
-            await callback.answer("Заявка уже закрыта.", show_alert=True)
-            return
+    if ticket is None:
+        await callback.answer("Заявка не найдена.", show_alert=True)
+        return
 
-        ticket.status = "closed"
-        ticket.closed_at = datetime.utcnow()
-        await session.commit()
-        user_id = ticket.user_id
-        ticket_number = ticket.ticket_number
+    if ticket.status == "closed":
+        await callback.answer("Заявка уже закрыта.", show_alert=True)
+        return
 
-    await callback.message.edit_reply_markup(reply_markup=None)
-    await callback.answer("Заявка закрыта.")
+    TicketRepository(session).transition(ticket, "closed")
+    await session.commit()
+    user_id = ticket.user_id
+    ticket_number = ticket.ticket_number
 
-    try:
-        await callback.bot.send_message(
+    await fan_out((
+        callback.bot.send_message(
             user_id,
             f"✅ Ваша заявка {ticket_number} закрыта.\n\nВыберите действие:",
             reply_markup=main_menu_keyboard(),
-        )
-    except Exception:
-        logger.warning("Could not notify user %s about closing ticket %s", user_id, ticket_number)
+        ),
+        f"Could not notify user {user_id} about closing ticket {ticket_number}",
+    ), wait=False)
+    await fan_out(
+        (edit_markup(callback.message, None), f"Could not remove buttons of ticket {ticket_number}"),
+        (callback.answer("Заявка закрыта."), "Could not answer callback"),
+    )
 
 
 @router.callback_query(F.data == "noop")
@@ -128,23 +156,13 @@ async def cb_noop(callback: CallbackQuery) -> None:
 
 
 @router.callback_query(F.data == "admin_my_tickets")
-async def cb_admin_my_tickets(callback: CallbackQuery) -> None:
+async def cb_admin_my_tickets(callback: CallbackQuery, session: AsyncSession) -> None:
     user = callback.from_user
     if not await is_admin(user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket)
-            .where(
-                Ticket.admin_id == user.id,
-                Ticket.status.in_(["new", "in_progress", "on_hold"]),
-            )
-            .order_by(Ticket.created_at.desc())
-            .limit(15)
-        )
-        tickets = result.scalars().all()
+    tickets = await TicketRepository(session).list_admin_open(user.id, limit=15)
 
     if not tickets:
         await callback.answer("У вас нет назначенных заявок.", show_alert=True)
@@ -162,33 +180,86 @@ async def cb_admin_my_tickets(callback: CallbackQuery) -> None:
     await callback.answer()
 
 
+def _parse_ticket_filters(args: list[str]) -> tuple[str | None, str | None, str | None] | None:
+    """'/tickets [status] [priority] [category]' in any order → filters, or None."""
+    status = priority = category = None
+    categories = {code for code, _ in CATEGORIES}
+    priorities = {code for code, _ in PRIORITIES}
+    for arg in args:
+        arg = arg.lower()
+        if arg in OPEN_STATUSES:
+            status = arg
+        elif arg in priorities:
+            priority = arg
+        elif arg in categories:
+            category = arg
+        else:
+            return None
+    return status, priority, category
+
+
+async def _render_open_tickets(
+    session: AsyncSession,
+    status: str | None,
+    priority: str | None,
+    category: str | None,
+    cursor: Cursor | None = None,
+    direction: str = OLDER,
+) -> tuple[str, InlineKeyboardMarkup | None]:
+    page = await TicketRepository(session).list_open_page(
+        status, priority, category, cursor, direction
+    )
+
+    if not page.items:
+        return "Нет открытых заявок.", None
+
+    lines = ["📋 Открытые заявки:\n"]
+    for t in page.items:
+        lines.append(format_ticket_status(t))
+        lines.append("")
+
+    # Callback data must fit in 64 bytes, hence the short "tp" prefix
+    filters = f"{status or '-'}:{priority or '-'}:{category or '-'}"
+    return "\n".join(lines), page_nav_keyboard(
+        f"tp:{NEWER}:{page.newer.encode()}:{filters}" if page.newer else None,
+        f"tp:{OLDER}:{page.older.encode()}:{filters}" if page.older else None,
+    )
+
+
 @router.message(Command("tickets"))
-async def cmd_tickets(message: Message) -> None:
+async def cmd_tickets(message: Message, session: AsyncSession) -> None:
     if not await is_admin(message.from_user.id):
         await message.answer("У вас нет прав администратора.")
         return
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket)
-            .where(Ticket.status.in_(["new", "in_progress", "on_hold"]))
-            .order_by(Ticket.created_at.desc())
+    filters = _parse_ticket_filters(message.text.split()[1:])
+    if filters is None:
+        await message.answer(
+            "Использование: /tickets [new|in_progress|on_hold] [low|medium|high] [категория]"
         )
-        tickets = result.scalars().all()
+        return
 
-    if not tickets:
-        await message.answer("Нет открытых заявок.")
+    text, keyboard = await _render_open_tickets(session, *filters)
+    await message.answer(text, reply_markup=keyboard)
+
+
+@router.callback_query(F.data.startswith("tp:"))
+async def cb_tickets_page(callback: CallbackQuery, session: AsyncSession) -> None:
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
 
-    lines = ["📋 Открытые заявки:\n"]
-    for t in tickets:
-        lines.append(format_ticket_status(t))
-        lines.append("")
-    await message.answer("\n".join(lines))
+    _, direction, raw_cursor, *filters = callback.data.split(":")
+    status, priority, category = (None if f == "-" else f for f in filters)
+    text, keyboard = await _render_open_tickets(
+        session, status, priority, category, Cursor.decode(raw_cursor), direction
+    )
+    await edit_text(callback.message, text, reply_markup=keyboard)
+    await callback.answer()
 
 
 @router.message(Command("close"))
-async def cmd_close(message: Message) -> None:
+async def cmd_close(message: Message, session: AsyncSession) -> None:
     if not await is_admin(message.from_user.id):
         await message.answer("У вас нет прав администратора.")
         return
@@ -202,24 +273,19 @@ async def cmd_close(message: Message) -> None:
     if not ticket_number.startswith("#"):
         ticket_number = f"#{ticket_number}"
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.ticket_number == ticket_number)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket = await TicketRepository(session).get_by_number(ticket_number)
 
-        if ticket is None:
-            await message.answer(f"Заявка {ticket_number} не найдена.")
-            return
+    if ticket is None:
+        await message.answer(f"Заявка {ticket_number} не найдена.")
+        return
 
-        if ticket.status == "closed":
-            await message.answer(f"Заявка {ticket_number} уже закрыта.")
-            return
+    if ticket.status == "closed":
+        await message.answer(f"Заявка {ticket_number} уже закрыта.")
+        return
 
-        ticket.status = "closed"
-        ticket.closed_at = datetime.utcnow()
-        await session.commit()
-        user_id = ticket.user_id
+    TicketRepository(session).transition(ticket, "closed")
+    await session.commit()
+    user_id = ticket.user_id
 
     await message.answer(f"✅ Заявка {ticket_number} закрыта.")
 
@@ -234,7 +300,7 @@ async def cmd_close(message: Message) -> None:
 
 
 @router.message(Command("priority"))
-async def cmd_priority(message: Message) -> None:
+async def cmd_priority(message: Message, session: AsyncSession) -> None:
     if not await is_admin(message.from_user.id):
         await message.answer("У вас нет прав администратора.")
         return
@@ -253,18 +319,14 @@ async def cmd_priority(message: Message) -> None:
         await message.answer("Приоритет должен быть: low, medium или high")
         return
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.ticket_number == ticket_number)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket = await TicketRepository(session).get_by_number(ticket_number)
 
-        if ticket is None:
-            await message.answer(f"Заявка {ticket_number} не найдена.")
-            return
+    if ticket is None:
+        await message.answer(f"Заявка {ticket_number} не найдена.")
+        return
 
-        ticket.priority = new_priority
-        await session.commit()
+    ticket.priority = new_priority
+    await session.commit()
 
     await message.answer(f"Приоритет заявки {ticket_number} изменён на {new_priority}.")
 
@@ -282,7 +344,7 @@ def _parse_reply_args(text: str) -> tuple[str, str] | None:
 
 
 @router.message(Command("reply"))
-async def cmd_reply(message: Message) -> None:
+async def cmd_reply(message: Message, session: AsyncSession) -> None:
     if not await is_admin(message.from_user.id):
         await message.answer("У вас нет прав администратора.")
         return
@@ -312,38 +374,33 @@ async def cmd_reply(message: Message) -> None:
         await message.answer("Укажите текст ответа или приложите фото.")
         return
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.ticket_number == ticket_number)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket = await TicketRepository(session).lookup_by_number(ticket_number)
 
-        if ticket is None:
-            await message.answer(f"Заявка {ticket_number} не найдена.")
-            return
+    if ticket is None:
+        await message.answer(f"Заявка {ticket_number} не найдена.")
+        return
 
-        if ticket.status == "closed":
-            await message.answer(f"Заявка {ticket_number} уже закрыта.")
-            return
+    if ticket.status == "closed":
+        await message.answer(f"Заявка {ticket_number} уже закрыта.")
+        return
 
-        user_id = ticket.user_id
-        ticket_id = ticket.id
+    user_id = ticket.user_id
+    ticket_id = ticket.id
 
-        session.add(TicketMessage(
-            ticket_id=ticket_id,
-            sender_id=message.from_user.id,
-            sender_role="admin",
-            text=reply_text or None,
-            file_id=file_id,
-        ))
-        await session.commit()
+    await batch_writer.add(TicketMessage(
+        ticket_id=ticket_id,
+        sender_id=message.from_user.id,
+        sender_role="admin",
+        text=reply_text or None,
+        file_id=file_id,
+    ))
 
-    admin_name = (
+    admin_name = html.escape(
         f"@{message.from_user.username}"
         if message.from_user.username
         else message.from_user.full_name
     )
-    user_text = f"💬 Ответ по заявке {ticket_number} от {admin_name}:\n\n{reply_text}" if reply_text else f"💬 Ответ по заявке {ticket_number} от {admin_name}:"
+    user_text = f"💬 Ответ по заявке {ticket_number} от {admin_name}:\n\n{html.escape(reply_text)}" if reply_text else f"💬 Ответ по заявке {ticket_number} от {admin_name}:"
 
     try:
         if file_id:
@@ -367,15 +424,8 @@ async def cmd_reply(message: Message) -> None:
 
 # --- Inline button "Ответить" → prompt in admin group chat ---
 
-# Maps prompt message_id → ticket_id for reply matching
-_reply_prompts: dict[int, int] = {}
-
-# Maps prompt message_id → ticket_id for description editing
-_edit_prompts: dict[int, int] = {}
-
-
 @router.callback_query(F.data.startswith("admin_reply_ticket:"))
-async def cb_admin_reply_ticket(callback: CallbackQuery) -> None:
+async def cb_admin_reply_ticket(callback: CallbackQuery, session: AsyncSession) -> None:
     user = callback.from_user
     if not await is_admin(user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
@@ -383,11 +433,7 @@ async def cb_admin_reply_ticket(callback: CallbackQuery) -> None:
 
     ticket_id = int(callback.data.split(":")[1])
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket = await TicketRepository(session).lookup(ticket_id)
 
     if ticket is None:
         await callback.answer("Заявка не найдена.", show_alert=True)
@@ -397,7 +443,7 @@ async def cb_admin_reply_ticket(callback: CallbackQuery) -> None:
         await callback.answer("Заявка уже закрыта.", show_alert=True)
         return
 
-    admin_name = f"@{user.username}" if user.username else user.full_name
+    admin_name = html.escape(f"@{user.username}" if user.username else user.full_name)
     cancel_kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="❌ Отмена", callback_data=f"cancel_reply_prompt")]
     ])
@@ -405,20 +451,20 @@ async def cb_admin_reply_ticket(callback: CallbackQuery) -> None:
         f"✍️ {admin_name}, ответьте на это сообщение, чтобы отправить ответ по заявке {ticket.ticket_number}.",
         reply_markup=cancel_kb,
     )
-    _reply_prompts[prompt_msg.message_id] = ticket_id
+    await prompts.add(prompt_msg.message_id, REPLY, ticket_id)
     await callback.answer()
 
 
 @router.callback_query(F.data == "cancel_reply_prompt")
 async def cb_cancel_reply_prompt(callback: CallbackQuery) -> None:
-    msg_id = callback.message.message_id
-    _reply_prompts.pop(msg_id, None)
+    await prompts.pop(callback.message.message_id)
     await callback.message.delete()
     await callback.answer("Отменено.")
 
 
 async def _send_admin_reply(
     message: Message,
+    session: AsyncSession,
     ticket_id: int,
     ticket_number: str,
     text: str,
@@ -427,30 +473,25 @@ async def _send_admin_reply(
     """Send admin reply to the user and save to DB. Shared by button and reply handler."""
     admin = message.from_user
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket = await TicketRepository(session).lookup(ticket_id)
 
-        if ticket is None or ticket.status == "closed":
-            await message.reply("Заявка не найдена или уже закрыта.")
-            return
+    if ticket is None or ticket.status == "closed":
+        await message.reply("Заявка не найдена или уже закрыта.")
+        return
 
-        user_id = ticket.user_id
+    user_id = ticket.user_id
 
-        session.add(TicketMessage(
-            ticket_id=ticket_id,
-            sender_id=admin.id,
-            sender_role="admin",
-            text=text or None,
-            file_id=file_id,
-        ))
-        await session.commit()
+    await batch_writer.add(TicketMessage(
+        ticket_id=ticket_id,
+        sender_id=admin.id,
+        sender_role="admin",
+        text=text or None,
+        file_id=file_id,
+    ))
 
-    admin_name = f"@{admin.username}" if admin.username else admin.full_name
+    admin_name = html.escape(f"@{admin.username}" if admin.username else admin.full_name)
     user_text = (
-        f"💬 Ответ по заявке {ticket_number} от {admin_name}:\n\n{text}"
+        f"💬 Ответ по заявке {ticket_number} от {admin_name}:\n\n{html.escape(text)}"
         if text
         else f"💬 Ответ по заявке {ticket_number} от {admin_name}:"
     )
@@ -478,77 +519,80 @@ async def _send_admin_reply(
 # --- Admin manage ticket (inline buttons) ---
 
 
-async def _get_ticket(ticket_id: int) -> Ticket | None:
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        return result.scalar_one_or_none()
+@router.callback_query(F.data.startswith("admin_manage_ticket:"))
+async def cb_admin_manage_ticket(callback: CallbackQuery, session: AsyncSession) -> None:
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("У вас нет прав администратора.", show_alert=True)
+        return
+
+    ticket_id = int(callback.data.split(":")[1])
+    ticket = await TicketRepository(session).get_by_id(ticket_id)
+    if ticket is None:
+        await callback.answer("Заявка не найдена.", show_alert=True)
+        return
 
+    text = format_manage_card(ticket)
+    await edit_text(callback.message, text, reply_markup=admin_manage_keyboard(ticket_id))
+    await callback.answer()
 
-@router.callback_query(F.data.startswith("admin_manage_ticket:"))
-async def cb_admin_manage_ticket(callback: CallbackQuery) -> None:
+
+@router.callback_query(F.data.startswith("open_ticket:"))
+async def cb_open_ticket(callback: CallbackQuery, session: AsyncSession) -> None:
+    """Post a ticket's card from a reminder digest as a separate message."""
     if not await is_admin(callback.from_user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
 
     ticket_id = int(callback.data.split(":")[1])
-    ticket = await _get_ticket(ticket_id)
+    ticket = await TicketRepository(session).get_by_id(ticket_id)
     if ticket is None:
         await callback.answer("Заявка не найдена.", show_alert=True)
         return
+    if ticket.status == "closed":
+        await callback.answer("Заявка уже закрыта.", show_alert=True)
+        return
 
-    text = (
-        f"⚙️ Управление заявкой {ticket.ticket_number}\n\n"
-        f"📁 Категория: {get_category_label(ticket.category)}\n"
-        f"⚡ Приоритет: {get_priority_label(ticket.priority)}\n"
-        f"📝 Описание: {ticket.description[:100]}{'...' if len(ticket.description) > 100 else ''}"
+    user = await UserRepository(session).get(ticket.user_id)
+    text = format_ticket(
+        ticket.ticket_number, ticket.category, ticket.priority, ticket.description,
+        user.username if user else None, user.full_name if user else "Unknown",
     )
-    await callback.message.edit_text(text, reply_markup=admin_manage_keyboard(ticket_id))
+    if ticket.status == "new":
+        markup = take_ticket_keyboard(ticket_id)
+    else:
+        admin_name = ""
+        if ticket.admin_id:
+            admin_name = await admin_names.resolve(callback.bot, session, ticket.admin_id)
+        markup = ticket_taken_keyboard(admin_name, ticket_id)
+    await callback.message.answer(text, reply_markup=markup)
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("admin_manage_back:"))
-async def cb_admin_manage_back(callback: CallbackQuery) -> None:
+async def cb_admin_manage_back(callback: CallbackQuery, session: AsyncSession) -> None:
     if not await is_admin(callback.from_user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
 
     ticket_id = int(callback.data.split(":")[1])
-    ticket = await _get_ticket(ticket_id)
+    ticket = await TicketRepository(session).get_by_id(ticket_id)
     if ticket is None:
         await callback.answer("Заявка не найдена.", show_alert=True)
         return
 
     admin_name = ""
     if ticket.admin_id:
-        try:
-            chat_member = await callback.bot.get_chat_member(
-                settings.ADMIN_CHAT_ID, ticket.admin_id
-            )
-            u = chat_member.user
-            admin_name = f"@{u.username}" if u.username else u.full_name
-        except Exception:
-            admin_name = str(ticket.admin_id)
-
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        t = result.scalar_one_or_none()
-    if t is None:
-        await callback.answer("Заявка не найдена.", show_alert=True)
-        return
+        admin_name = await admin_names.resolve(callback.bot, session, ticket.admin_id)
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(User).where(User.id == t.user_id)
-        )
-        user = result.scalar_one_or_none()
+    user = await UserRepository(session).get(ticket.user_id)
     username = user.username if user else None
     full_name = user.full_name if user else "Unknown"
-    text = format_ticket(t.ticket_number, t.category, t.priority, t.description, username, full_name)
-    await callback.message.edit_text(
+    text = format_ticket(
+        ticket.ticket_number, ticket.category, ticket.priority, ticket.description,
+        username, full_name,
+    )
+    await edit_text(
+        callback.message,
         text, reply_markup=ticket_taken_keyboard(admin_name, ticket_id)
     )
     await callback.answer()
@@ -560,7 +604,8 @@ async def cb_admin_edit_cat(callback: CallbackQuery) -> None:
         await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
     ticket_id = int(callback.data.split(":")[1])
-    await callback.message.edit_text(
+    await edit_text(
+        callback.message,
         "📁 Выберите новую категорию:",
         reply_markup=admin_categories_keyboard(ticket_id),
     )
@@ -568,7 +613,7 @@ async def cb_admin_edit_cat(callback: CallbackQuery) -> None:
 
 
 @router.callback_query(F.data.startswith("admin_set_cat:"))
-async def cb_admin_set_cat(callback: CallbackQuery) -> None:
+async def cb_admin_set_cat(callback: CallbackQuery, session: AsyncSession) -> None:
     if not await is_admin(callback.from_user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
@@ -577,27 +622,17 @@ async def cb_admin_set_cat(callback: CallbackQuery) -> None:
     ticket_id = int(parts[1])
     category = parts[2]
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        ticket = result.scalar_one_or_none()
-        if ticket is None:
-            await callback.answer("Заявка не найдена.", show_alert=True)
-            return
-        ticket.category = category
-        await session.commit()
+    ticket = await TicketRepository(session).get_by_id(ticket_id)
+    if ticket is None:
+        await callback.answer("Заявка не найдена.", show_alert=True)
+        return
+    ticket.category = category
+    await session.commit()
 
     await callback.answer(f"Категория изменена: {get_category_label(category)}")
     # Return to manage menu
-    ticket = await _get_ticket(ticket_id)
-    text = (
-        f"⚙️ Управление заявкой {ticket.ticket_number}\n\n"
-        f"📁 Категория: {get_category_label(ticket.category)}\n"
-        f"⚡ Приоритет: {get_priority_label(ticket.priority)}\n"
-        f"📝 Описание: {ticket.description[:100]}{'...' if len(ticket.description) > 100 else ''}"
-    )
-    await callback.message.edit_text(text, reply_markup=admin_manage_keyboard(ticket_id))
+    text = format_manage_card(ticket)
+    await edit_text(callback.message, text, reply_markup=admin_manage_keyboard(ticket_id))
 
 
 @router.callback_query(F.data.startswith("admin_edit_pri:"))
@@ -606,7 +641,8 @@ async def cb_admin_edit_pri(callback: CallbackQuery) -> None:
         await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
     ticket_id = int(callback.data.split(":")[1])
-    await callback.message.edit_text(
+    await edit_text(
+        callback.message,
         "⚡ Выберите новый приоритет:",
         reply_markup=admin_priorities_keyboard(ticket_id),
     )
@@ -614,7 +650,7 @@ async def cb_admin_edit_pri(callback: CallbackQuery) -> None:
 
 
 @router.callback_query(F.data.startswith("admin_set_pri:"))
-async def cb_admin_set_pri(callback: CallbackQuery) -> None:
+async def cb_admin_set_pri(callback: CallbackQuery, session: AsyncSession) -> None:
     if not await is_admin(callback.from_user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
@@ -623,41 +659,31 @@ async def cb_admin_set_pri(callback: CallbackQuery) -> None:
     ticket_id = int(parts[1])
     priority = parts[2]
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        ticket = result.scalar_one_or_none()
-        if ticket is None:
-            await callback.answer("Заявка не найдена.", show_alert=True)
-            return
-        ticket.priority = priority
-        await session.commit()
+    ticket = await TicketRepository(session).get_by_id(ticket_id)
+    if ticket is None:
+        await callback.answer("Заявка не найдена.", show_alert=True)
+        return
+    ticket.priority = priority
+    await session.commit()
 
     await callback.answer(f"Приоритет изменён: {get_priority_label(priority)}")
-    ticket = await _get_ticket(ticket_id)
-    text = (
-        f"⚙️ Управление заявкой {ticket.ticket_number}\n\n"
-        f"📁 Категория: {get_category_label(ticket.category)}\n"
-        f"⚡ Приоритет: {get_priority_label(ticket.priority)}\n"
-        f"📝 Описание: {ticket.description[:100]}{'...' if len(ticket.description) > 100 else ''}"
-    )
-    await callback.message.edit_text(text, reply_markup=admin_manage_keyboard(ticket_id))
+    text = format_manage_card(ticket)
+    await edit_text(callback.message, text, reply_markup=admin_manage_keyboard(ticket_id))
 
 
 @router.callback_query(F.data.startswith("admin_edit_desc:"))
-async def cb_admin_edit_desc(callback: CallbackQuery) -> None:
+async def cb_admin_edit_desc(callback: CallbackQuery, session: AsyncSession) -> None:
     if not await is_admin(callback.from_user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
 
     ticket_id = int(callback.data.split(":")[1])
-    ticket = await _get_ticket(ticket_id)
+    ticket = await TicketRepository(session).get_by_id(ticket_id)
     if ticket is None:
         await callback.answer("Заявка не найдена.", show_alert=True)
         return
 
-    admin_name = (
+    admin_name = html.escape(
         f"@{callback.from_user.username}"
         if callback.from_user.username
         else callback.from_user.full_name
@@ -669,31 +695,31 @@ async def cb_admin_edit_desc(callback: CallbackQuery) -> None:
         f"✏️ {admin_name}, ответьте на это сообщение с новым описанием для заявки {ticket.ticket_number}.",
         reply_markup=cancel_kb,
     )
-    _edit_prompts[prompt_msg.message_id] = ticket_id
+    await prompts.add(prompt_msg.message_id, EDIT, ticket_id)
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("cancel_edit_prompt:"))
 async def cb_cancel_edit_prompt(callback: CallbackQuery) -> None:
-    msg_id = callback.message.message_id
-    _edit_prompts.pop(msg_id, None)
+    await prompts.pop(callback.message.message_id)
     await callback.message.delete()
     await callback.answer("Отменено.")
 
 
 @router.callback_query(F.data.startswith("admin_clear_history:"))
-async def cb_admin_clear_history(callback: CallbackQuery) -> None:
+async def cb_admin_clear_history(callback: CallbackQuery, session: AsyncSession) -> None:
     if not await is_admin(callback.from_user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
 
     ticket_id = int(callback.data.split(":")[1])
-    ticket = await _get_ticket(ticket_id)
+    ticket = await TicketRepository(session).get_by_id(ticket_id)
     if ticket is None:
         await callback.answer("Заявка не найдена.", show_alert=True)
         return
 
-    await callback.message.edit_text(
+    await edit_text(
+        callback.message,
         f"🧹 Очистить всю историю переписки по заявке {ticket.ticket_number}?\n\n"
         "Это действие нельзя отменить. Сама заявка останется.",
         reply_markup=admin_confirm_clear_keyboard(ticket_id),
@@ -702,53 +728,42 @@ async def cb_admin_clear_history(callback: CallbackQuery) -> None:
 
 
 @router.callback_query(F.data.startswith("admin_confirm_clear:"))
-async def cb_admin_confirm_clear(callback: CallbackQuery) -> None:
+async def cb_admin_confirm_clear(callback: CallbackQuery, session: AsyncSession) -> None:
     if not await is_admin(callback.from_user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
 
     ticket_id = int(callback.data.split(":")[1])
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        ticket = result.scalar_one_or_none()
-        if ticket is None:
-            await callback.answer("Заявка не найдена.", show_alert=True)
-            return
+    ticket = await TicketRepository(session).get_by_id(ticket_id)
+    if ticket is None:
+        await callback.answer("Заявка не найдена.", show_alert=True)
+        return
 
-        ticket_number = ticket.ticket_number
+    ticket_number = ticket.ticket_number
 
-        await session.execute(
-            sa_delete(TicketMessage).where(TicketMessage.ticket_id == ticket_id)
-        )
-        await session.commit()
+    await TicketRepository(session).clear_history(ticket_id)
+    await session.commit()
 
     await callback.answer(f"История заявки {ticket_number} очищена.")
-    ticket = await _get_ticket(ticket_id)
-    text = (
-        f"⚙️ Управление заявкой {ticket.ticket_number}\n\n"
-        f"📁 Категория: {get_category_label(ticket.category)}\n"
-        f"⚡ Приоритет: {get_priority_label(ticket.priority)}\n"
-        f"📝 Описание: {ticket.description[:100]}{'...' if len(ticket.description) > 100 else ''}"
-    )
-    await callback.message.edit_text(text, reply_markup=admin_manage_keyboard(ticket_id))
+    text = format_manage_card(ticket)
+    await edit_text(callback.message, text, reply_markup=admin_manage_keyboard(ticket_id))
 
 
 @router.callback_query(F.data.startswith("admin_delete_ticket:"))
-async def cb_admin_delete_ticket(callback: CallbackQuery) -> None:
+async def cb_admin_delete_ticket(callback: CallbackQuery, session: AsyncSession) -> None:
     if not await is_admin(callback.from_user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
 
     ticket_id = int(callback.data.split(":")[1])
-    ticket = await _get_ticket(ticket_id)
+    ticket = await TicketRepository(session).get_by_id(ticket_id)
     if ticket is None:
         await callback.answer("Заявка не найдена.", show_alert=True)
         return
 
-    await callback.message.edit_text(
+    await edit_text(
+        callback.message,
         f"🗑 Удалить заявку {ticket.ticket_number} полностью?\n\n"
         "Будут удалены заявка и вся история переписки. Это действие нельзя отменить.",
         reply_markup=admin_confirm_delete_keyboard(ticket_id),
@@ -757,27 +772,23 @@ async def cb_admin_delete_ticket(callback: CallbackQuery) -> None:
 
 
 @router.callback_query(F.data.startswith("admin_confirm_del:"))
-async def cb_admin_confirm_del(callback: CallbackQuery) -> None:
+async def cb_admin_confirm_del(callback: CallbackQuery, session: AsyncSession) -> None:
     if not await is_admin(callback.from_user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
         return
 
     ticket_id = int(callback.data.split(":")[1])
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        ticket = result.scalar_one_or_none()
-        if ticket is None:
-            await callback.answer("Заявка не найдена.", show_alert=True)
-            return
+    ticket = await TicketRepository(session).get_by_id(ticket_id)
+    if ticket is None:
+        await callback.answer("Заявка не найдена.", show_alert=True)
+        return
 
-        ticket_number = ticket.ticket_number
-        await session.delete(ticket)
-        await session.commit()
+    ticket_number = ticket.ticket_number
+    await TicketRepository(session).delete(ticket)
+    await session.commit()
 
-    await callback.message.edit_text(f"🗑 Заявка {ticket_number} удалена.")
+    await edit_text(callback.message, f"🗑 Заявка {ticket_number} удалена.")
     await callback.answer()
 
 
@@ -785,7 +796,7 @@ async def cb_admin_confirm_del(callback: CallbackQuery) -> None:
 
 
 @router.message(Command("edit"))
-async def cmd_edit(message: Message) -> None:
+async def cmd_edit(message: Message, session: AsyncSession) -> None:
     if not await is_admin(message.from_user.id):
         await message.answer("У вас нет прав администратора.")
         return
@@ -799,27 +810,18 @@ async def cmd_edit(message: Message) -> None:
     if not ticket_number.startswith("#"):
         ticket_number = f"#{ticket_number}"
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.ticket_number == ticket_number)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket = await TicketRepository(session).get_by_number(ticket_number)
 
     if ticket is None:
         await message.answer(f"Заявка {ticket_number} не найдена.")
         return
 
-    text = (
-        f"⚙️ Управление заявкой {ticket.ticket_number}\n\n"
-        f"📁 Категория: {get_category_label(ticket.category)}\n"
-        f"⚡ Приоритет: {get_priority_label(ticket.priority)}\n"
-        f"📝 Описание: {ticket.description[:100]}{'...' if len(ticket.description) > 100 else ''}"
-    )
+    text = format_manage_card(ticket)
     await message.answer(text, reply_markup=admin_manage_keyboard(ticket.id))
 
 
 @router.message(Command("delete"))
-async def cmd_delete(message: Message) -> None:
+async def cmd_delete(message: Message, session: AsyncSession) -> None:
     if not await is_admin(message.from_user.id):
         await message.answer("У вас нет прав администратора.")
         return
@@ -833,11 +835,7 @@ async def cmd_delete(message: Message) -> None:
     if not ticket_number.startswith("#"):
         ticket_number = f"#{ticket_number}"
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.ticket_number == ticket_number)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket = await TicketRepository(session).get_by_number(ticket_number)
 
     if ticket is None:
         await message.answer(f"Заявка {ticket_number} не найдена.")
@@ -854,7 +852,7 @@ async def cmd_delete(message: Message) -> None:
 
 
 @router.callback_query(F.data.startswith("hold_ticket:"))
-async def cb_hold_ticket(callback: CallbackQuery) -> None:
+async def cb_hold_ticket(callback: CallbackQuery, session: AsyncSession) -> None:
     user = callback.from_user
     if not await is_admin(user.id):
         await callback.answer("У вас нет прав администратора.", show_alert=True)
@@ -862,24 +860,20 @@ async def cb_hold_ticket(callback: CallbackQuery) -> None:
 
     ticket_id = int(callback.data.split(":")[1])
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket = await TicketRepository(session).get_by_id(ticket_id)
 
-        if ticket is None:
-            await callback.answer("Заявка не найдена.", show_alert=True)
-            return
+    if ticket is None:
+        await callback.answer("Заявка не найдена.", show_alert=True)
+        return
 
-        if ticket.status == "closed":
-            await callback.answer("Заявка уже закрыта.", show_alert=True)
-            return
+    if ticket.status == "closed":
+        await callback.answer("Заявка уже закрыта.", show_alert=True)
+        return
 
-        ticket.status = "on_hold"
-        await session.commit()
-        user_id = ticket.user_id
-        ticket_number = ticket.ticket_number
+    TicketRepository(session).transition(ticket, "on_hold")
+    await session.commit()
+    user_id = ticket.user_id
+    ticket_number = ticket.ticket_number
 
     await callback.answer("Заявка переведена в ожидание.")
 
@@ -897,7 +891,7 @@ async def cb_hold_ticket(callback: CallbackQuery) -> None:
 
 
 @router.message(Command("transfer"))
-async def cmd_transfer(message: Message) -> None:
+async def cmd_transfer(message: Message, session: AsyncSession) -> None:
     if not await is_admin(message.from_user.id):
         await message.answer("У вас нет прав администратора.")
         return
@@ -911,41 +905,38 @@ async def cmd_transfer(message: Message) -> None:
     if not ticket_number.startswith("#"):
         ticket_number = f"#{ticket_number}"
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.ticket_number == ticket_number)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket = await TicketRepository(session).get_by_number(ticket_number)
 
-        if ticket is None:
-            await message.answer(f"Заявка {ticket_number} не найдена.")
-            return
+    if ticket is None:
+        await message.answer(f"Заявка {ticket_number} не найдена.")
+        return
 
-        if ticket.status == "closed":
-            await message.answer(f"Заявка {ticket_number} уже закрыта.")
-            return
+    if ticket.status == "closed":
+        await message.answer(f"Заявка {ticket_number} уже закрыта.")
+        return
 
-        ticket.admin_id = None
-        ticket.status = "new"
-        await session.commit()
-        user_id = ticket.user_id
-        ticket_id = ticket.id
+    previous_admin_id = ticket.admin_id
+    TicketRepository(session).transition(ticket, "new", admin_id=None)
+    await session.commit()
+    user_id = ticket.user_id
+    ticket_id = ticket.id
 
-    await message.answer(f"🔄 Заявка {ticket_number} возвращена в очередь.")
+    await fan_out((
+        message.bot.send_message(
+            user_id,
+            f"🔄 Ваша заявка {ticket_number} передана другому администратору.",
+        ),
+        f"Could not notify user {user_id} about transfer of ticket {ticket_number}",
+    ), wait=False)
 
     # Re-post to admin chat with "Take" button
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        ticket = result.scalar_one_or_none()
-        result2 = await session.execute(
-            select(User).where(User.id == user_id)
-        )
-        user = result2.scalar_one_or_none()
+    user = await UserRepository(session).get(user_id)
+    sends = [(
+        message.answer(f"🔄 Заявка {ticket_number} возвращена в очередь."),
+        "Could not answer /transfer",
+    )]
 
-    if ticket and user:
-        from bot.utils.ticket import format_ticket
+    if user:
         text = format_ticket(
             ticket_number=ticket.ticket_number,
             category=ticket.category,
@@ -954,70 +945,125 @@ async def cmd_transfer(message: Message) -> None:
             username=user.username,
             full_name=user.full_name,
         )
-        try:
-            admin_msg = await message.bot.send_message(
+        header = "🔄 Заявка передана"
+        if previous_admin_id:
+            previous = await admin_names.resolve(message.bot, session, previous_admin_id)
+            header += f" (была у {previous})"
+        sends.append((
+            message.bot.send_message(
                 settings.ADMIN_CHAT_ID,
-                f"🔄 Заявка передана:\n\n{text}",
+                f"{header}:\n\n{text}",
                 reply_markup=take_ticket_keyboard(ticket_id),
-            )
-            async with async_session() as session:
-                result = await session.execute(
-                    select(Ticket).where(Ticket.id == ticket_id)
-                )
-                t = result.scalar_one()
-                t.message_id = admin_msg.message_id
-                await session.commit()
-        except Exception:
-            logger.warning("Could not re-post ticket %s to admin chat", ticket_number)
+            ),
+            f"Could not re-post ticket {ticket_number} to admin chat",
+        ))
 
-    try:
-        await message.bot.send_message(
-            user_id,
-            f"🔄 Ваша заявка {ticket_number} передана другому администратору.",
-        )
-    except Exception:
-        logger.warning("Could not notify user %s about transfer of ticket %s", user_id, ticket_number)
+    _, *reposted = await fan_out(*sends)
+    if reposted and reposted[0] is not None:
+        ticket.message_id = reposted[0].message_id
+        await session.commit()
 
 
-# --- Stats ---
+# --- Search ---
 
+SEARCH_PAGE_SIZE = 5
 
-@router.message(Command("stats"))
-async def cmd_stats(message: Message) -> None:
+
+async def _render_search_page(
+    session: AsyncSession, query: str, page: int
+) -> tuple[str, InlineKeyboardMarkup | None]:
+    # One extra row tells whether there is a next page
+    tickets = await TicketRepository(session).search(
+        query, limit=SEARCH_PAGE_SIZE + 1, offset=page * SEARCH_PAGE_SIZE
+    )
+    has_next = len(tickets) > SEARCH_PAGE_SIZE
+    tickets = tickets[:SEARCH_PAGE_SIZE]
+
+    if not tickets:
+        return f"🔎 По запросу «{html.escape(query)}» ничего не найдено.", None
+
+    lines = [f"🔎 Результаты по запросу «{html.escape(query)}» (стр. {page + 1}):\n"]
+    for t in tickets:
+        lines.append(format_ticket_status(t))
+        lines.append("")
+    return "\n".join(lines), page_nav_keyboard(
+        f"search_page:{page - 1}" if page > 0 else None,
+        f"search_page:{page + 1}" if has_next else None,
+    )
+
+
+@router.message(Command("search"))
+async def cmd_search(message: Message, state: FSMContext, session: AsyncSession) -> None:
     if not await is_admin(message.from_user.id):
         await message.answer("У вас нет прав администратора.")
         return
 
-    async with async_session() as session:
-        # Total tickets
-        total = (await session.execute(select(func.count(Ticket.id)))).scalar_one()
+    args = message.text.split(maxsplit=1)
+    if len(args) < 2 or not args[1].strip():
+        await message.answer("Использование: /search <текст>")
+        return
+
+    query = args[1].strip()
+    await state.update_data(search_query=query)
+    text, keyboard = await _render_search_page(session, query, page=0)
+    await message.answer(text, reply_markup=keyboard)
 
-        # By status
-        status_rows = (await session.execute(
-            select(Ticket.status, func.count(Ticket.id)).group_by(Ticket.status)
-        )).all()
 
-        # By priority
-        priority_rows = (await session.execute(
-            select(Ticket.priority, func.count(Ticket.id)).group_by(Ticket.priority)
-        )).all()
+@router.callback_query(F.data.startswith("search_page:"))
+async def cb_search_page(
+    callback: CallbackQuery, state: FSMContext, session: AsyncSession
+) -> None:
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("У вас нет прав администратора.", show_alert=True)
+        return
+
+    query = (await state.get_data()).get("search_query")
+    if not query:
+        await callback.answer("Поиск устарел, повторите /search.", show_alert=True)
+        return
+
+    page = int(callback.data.split(":")[1])
+    text, keyboard = await _render_search_page(session, query, page)
+    await edit_text(callback.message, text, reply_markup=keyboard)
+    await callback.answer()
+
+
+# --- Stats ---
+
+
+def _stats_lines(stats: dict[str, int], prefix: str, known, label) -> list[str]:
+    """Non-zero counters under ``prefix``: known codes in their order, then
+    any others (e.g. left by an older version), so the lines add up to the total."""
+    counts = {
+        name.removeprefix(prefix): value
+        for name, value in stats.items()
+        if name.startswith(prefix) and value
+    }
+    codes = [code for code in known if code in counts]
+    codes += sorted(counts.keys() - set(codes))
+    return [f"  {label(code)}: {counts[code]}" for code in codes]
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message, session: AsyncSession) -> None:
+    if not await is_admin(message.from_user.id):
+        await message.answer("У вас нет прав администратора.")
+        return
 
-        # Average rating
-        avg_rating = (await session.execute(
-            select(func.avg(Ticket.rating)).where(Ticket.rating.isnot(None))
-        )).scalar_one()
+    # Counters are maintained on every ticket write, see bot.db.stats
+    stats = await read_stats(await session.connection())
 
-    from bot.utils.ticket import STATUS_LABELS, get_priority_label
+    total = stats.get(TOTAL, 0)
 
-    status_lines = []
-    for status, count in status_rows:
-        label = STATUS_LABELS.get(status, status)
-        status_lines.append(f"  {label}: {count}")
+    status_lines = _stats_lines(
+        stats, status_key(""), STATUS_LABELS, lambda code: STATUS_LABELS.get(code, code)
+    )
+    priority_lines = _stats_lines(
+        stats, priority_key(""), [code for code, _ in PRIORITIES], get_priority_label
+    )
 
-    priority_lines = []
-    for priority, count in priority_rows:
-        label = get_priority_label(priority)
-        priority_lines.append(f"  {label}: {count}")
+    rating_count = stats.get(RATING_COUNT, 0)
+    avg_rating = stats.get(RATING_SUM, 0) / rating_count if rating_count else None
 
     avg_str = f"{avg_rating:.1f}" if avg_rating else "—"
 
@@ -1039,7 +1085,7 @@ def _is_senior(user_id: int) -> bool:
 
 
 @router.message(Command("addadmin"))
-async def cmd_addadmin(message: Message) -> None:
+async def cmd_addadmin(message: Message, session: AsyncSession) -> None:
     if not _is_senior(message.from_user.id):
         await message.answer("Только старший администратор может добавлять админов.")
         return
@@ -1055,44 +1101,42 @@ async def cmd_addadmin(message: Message) -> None:
         await message.answer("user_id должен быть числом.")
         return
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Admin).where(Admin.id == new_admin_id)
-        )
-        admin = result.scalar_one_or_none()
-
-        if admin is not None:
-            if admin.is_active:
-                await message.answer(f"Пользователь {new_admin_id} уже является админом.")
-                return
-            admin.is_active = True
-            await session.commit()
-            await message.answer(f"✅ Админ {new_admin_id} восстановлен.")
-            return
+    admin = await AdminRepository(session).get(new_admin_id)
 
-        # Try to get user info from Telegram
-        try:
-            chat = await message.bot.get_chat(new_admin_id)
-            username = chat.username
-            full_name = chat.full_name or str(new_admin_id)
-        except Exception:
-            username = None
-            full_name = str(new_admin_id)
-
-        session.add(Admin(
-            id=new_admin_id,
-            username=username,
-            full_name=full_name,
-            is_senior=new_admin_id in settings.SENIOR_ADMIN_IDS,
-            is_active=True,
-        ))
+    if admin is not None:
+        if admin.is_active:
+            await message.answer(f"Пользователь {new_admin_id} уже является админом.")
+            return
+        admin.is_active = True
         await session.commit()
+        admin_roster.add(new_admin_id)
+        await message.answer(f"✅ Админ {new_admin_id} восстановлен.")
+        return
+
+    # Try to get user info from Telegram
+    try:
+        chat = await message.bot.get_chat(new_admin_id)
+        username = chat.username
+        full_name = chat.full_name or str(new_admin_id)
+    except Exception:
+        username = None
+        full_name = str(new_admin_id)
+
+    session.add(Admin(
+        id=new_admin_id,
+        username=username,
+        full_name=full_name,
+        is_senior=new_admin_id in settings.SENIOR_ADMIN_IDS,
+        is_active=True,
+    ))
+    await session.commit()
+    admin_roster.add(new_admin_id)
 
     await message.answer(f"✅ Пользователь {new_admin_id} добавлен как администратор.")
 
 
 @router.message(Command("removeadmin"))
-async def cmd_removeadmin(message: Message) -> None:
+async def cmd_removeadmin(message: Message, session: AsyncSession) -> None:
     if not _is_senior(message.from_user.id):
         await message.answer("Только старший администратор может удалять админов.")
         return
@@ -1108,37 +1152,30 @@ async def cmd_removeadmin(message: Message) -> None:
         await message.answer("user_id должен быть числом.")
         return
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Admin).where(Admin.id == admin_id)
-        )
-        admin = result.scalar_one_or_none()
+    admin = await AdminRepository(session).get(admin_id)
 
-        if admin is None:
-            await message.answer(f"Админ {admin_id} не найден.")
-            return
+    if admin is None:
+        await message.answer(f"Админ {admin_id} не найден.")
+        return
 
-        if not admin.is_active:
-            await message.answer(f"Админ {admin_id} уже деактивирован.")
-            return
+    if not admin.is_active:
+        await message.answer(f"Админ {admin_id} уже деактивирован.")
+        return
 
-        admin.is_active = False
-        await session.commit()
+    admin.is_active = False
+    await session.commit()
+    admin_roster.discard(admin_id)
 
     await message.answer(f"✅ Админ {admin_id} деактивирован.")
 
 
 @router.message(Command("admins"))
-async def cmd_admins(message: Message) -> None:
+async def cmd_admins(message: Message, session: AsyncSession) -> None:
     if not _is_senior(message.from_user.id):
         await message.answer("Только старший администратор может просматривать список админов.")
         return
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Admin).where(Admin.is_active.is_(True))
-        )
-        admins = result.scalars().all()
+    admins = await AdminRepository(session).list_active()
 
     if not admins:
         await message.answer("Нет активных администраторов.")
@@ -1146,13 +1183,24 @@ async def cmd_admins(message: Message) -> None:
 
     lines = ["👥 Активные администраторы:\n"]
     for a in admins:
-        name = f"@{a.username}" if a.username else a.full_name
+        name = html.escape(f"@{a.username}" if a.username else a.full_name)
         senior = " (старший)" if a.is_senior else ""
         lines.append(f"• {a.id} — {name}{senior}")
 
     await message.answer("\n".join(lines))
 
 
+@router.message(Command("caches"))
+async def cmd_caches(message: Message) -> None:
+    if not _is_senior(message.from_user.id):
+        await message.answer("Только старший администратор может просматривать кэши.")
+        return
+
+    lines = ["🗄 Кэши:\n"]
+    lines.extend(f"• {cache.describe()}" for cache in caches.values())
+    await message.answer("\n".join(lines))
+
+
 # --- Reply to bot message in admin chat (lowest priority — registered last) ---
 
 
@@ -1160,51 +1208,39 @@ async def cmd_admins(message: Message) -> None:
     F.chat.id == settings.ADMIN_CHAT_ID,
     F.reply_to_message,
 )
-async def msg_admin_chat_reply(message: Message) -> None:
+async def msg_admin_chat_reply(message: Message, session: AsyncSession) -> None:
     if not await is_admin(message.from_user.id):
         return
 
     replied_msg_id = message.reply_to_message.message_id
 
-    # Check edit description prompts first
-    edit_ticket_id = _edit_prompts.pop(replied_msg_id, None)
-    if edit_ticket_id is not None:
+    prompt = await prompts.pop(replied_msg_id)
+
+    # Edit description prompt
+    if prompt is not None and prompt.kind == EDIT:
         new_desc = (message.text or "").strip()
         if not new_desc:
             await message.reply("Описание не может быть пустым.")
-            _edit_prompts[replied_msg_id] = edit_ticket_id
+            await prompts.add(replied_msg_id, EDIT, prompt.ticket_id)
             return
 
-        async with async_session() as session:
-            result = await session.execute(
-                select(Ticket).where(Ticket.id == edit_ticket_id)
-            )
-            ticket = result.scalar_one_or_none()
-            if ticket is None:
-                await message.reply("Заявка не найдена.")
-                return
-            ticket.description = new_desc
-            await session.commit()
-            ticket_number = ticket.ticket_number
+        ticket = await TicketRepository(session).get_by_id(prompt.ticket_id)
+        if ticket is None:
+            await message.reply("Заявка не найдена.")
+            return
+        ticket.description = new_desc
+        await session.commit()
+        ticket_number = ticket.ticket_number
 
         await message.reply(f"✏️ Описание заявки {ticket_number} обновлено.")
         return
 
-    # Check prompt messages (from "Ответить" button)
-    ticket_id = _reply_prompts.pop(replied_msg_id, None)
-    if ticket_id is not None:
-        async with async_session() as session:
-            result = await session.execute(
-                select(Ticket).where(Ticket.id == ticket_id)
-            )
-            ticket = result.scalar_one_or_none()
+    # Prompt messages (from "Ответить" button)
+    if prompt is not None:
+        ticket = await TicketRepository(session).lookup(prompt.ticket_id)
     else:
         # Check original ticket message
-        async with async_session() as session:
-            result = await session.execute(
-                select(Ticket).where(Ticket.message_id == replied_msg_id)
-            )
-            ticket = result.scalar_one_or_none()
+        ticket = await TicketRepository(session).lookup_by_admin_message(replied_msg_id)
 
     if ticket is None:
         return
@@ -1221,6 +1257,7 @@ async def msg_admin_chat_reply(message: Message) -> None:
 
     await _send_admin_reply(
         message,
+        session,
         ticket_id=ticket.id,
         ticket_number=ticket.ticket_number,
         text=text,
@@ -30,7 +30,8 @@ async def cmd_help(message: Message) -> None:
         "/status <номер> — Статус заявки\n"
         "/cancel — Отменить текущее действие\n\n"
         "👷 Команды администратора:\n"
-        "/tickets — Открытые заявки\n"
+        "/tickets [статус] [приоритет] [категория] — Открытые заявки\n"
+        "/search <текст> — Поиск по заявкам и переписке\n"
         "/close <номер> — Закрыть заявку\n"
         "/priority <номер> <low/medium/high> — Сменить приоритет\n"
         "/reply <номер> <текст> — Ответить пользователю по заявке\n"
@@ -39,7 +40,8 @@ async def cmd_help(message: Message) -> None:
         "👑 Команды старшего админа:\n"
         "/addadmin <user_id> — Добавить администратора\n"
         "/removeadmin <user_id> — Удалить администратора\n"
-        "/admins — Список администраторов"
+        "/admins — Список администраторов\n"
+        "/caches — Статистика кэшей"
     )
     await message.answer(text)
 
@@ -1,4 +1,6 @@
+import html
 import logging
+from typing import Awaitable
 
 from aiogram import F, Router
 from aiogram.filters import Command
@@ -6,20 +8,25 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import CallbackQuery, Message
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.config import settings
-from bot.db.database import async_session
-from bot.db.models import Ticket, TicketMessage, User
+from bot.db.models import TicketMessage
+from bot.db.repository import TicketRepository, UserRepository
+from bot.db.writer import batch_writer
 from bot.keyboards.inline import (
     categories_keyboard,
     confirm_keyboard,
     main_menu_keyboard,
+    page_nav_keyboard,
     priorities_keyboard,
     reply_to_ticket_keyboard,
     take_ticket_keyboard,
 )
-from bot.utils.ticket import format_ticket, format_ticket_status, generate_ticket_number
+from bot.utils.pagination import NEWER, OLDER, Cursor
+from bot.utils.notify import fan_out
+from bot.utils.render import edit_text, format_ticket, format_ticket_status
+from bot.utils.ticket import parse_ticket_number
 
 logger = logging.getLogger(__name__)
 
@@ -37,22 +44,11 @@ class ReplyTicket(StatesGroup):
     text = State()
 
 
-async def _ensure_user(user_id: int, username: str | None, full_name: str) -> None:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
-        if user is None:
-            session.add(User(id=user_id, username=username, full_name=full_name))
-        else:
-            user.username = username
-            user.full_name = full_name
-        await session.commit()
-
-
 @router.callback_query(F.data == "new_ticket")
 async def cb_new_ticket(callback: CallbackQuery, state: FSMContext) -> None:
     await state.set_state(CreateTicket.category)
-    await callback.message.edit_text(
+    await edit_text(
+        callback.message,
         "📁 Выберите категорию проблемы:",
         reply_markup=categories_keyboard(),
     )
@@ -71,7 +67,8 @@ async def cmd_new_ticket(message: Message, state: FSMContext) -> None:
 @router.callback_query(F.data == "cancel")
 async def cb_cancel(callback: CallbackQuery, state: FSMContext) -> None:
     await state.clear()
-    await callback.message.edit_text(
+    await edit_text(
+        callback.message,
         "❌ Действие отменено.\n\nВыберите действие:",
         reply_markup=main_menu_keyboard(),
     )
@@ -83,7 +80,8 @@ async def cb_category(callback: CallbackQuery, state: FSMContext) -> None:
     category = callback.data.split(":")[1]
     await state.update_data(category=category)
     await state.set_state(CreateTicket.priority)
-    await callback.message.edit_text(
+    await edit_text(
+        callback.message,
         "⚡ Выберите приоритет:",
         reply_markup=priorities_keyboard(),
     )
@@ -95,7 +93,8 @@ async def cb_priority(callback: CallbackQuery, state: FSMContext) -> None:
     priority = callback.data.split(":")[1]
     await state.update_data(priority=priority)
     await state.set_state(CreateTicket.description)
-    await callback.message.edit_text(
+    await edit_text(
+        callback.message,
         "📝 Опишите проблему (можно приложить фото):",
     )
     await callback.answer()
@@ -134,36 +133,21 @@ async def _show_confirmation(message: Message, state: FSMContext) -> None:
 
 
 @router.callback_query(CreateTicket.confirm, F.data == "confirm_ticket")
-async def cb_confirm(callback: CallbackQuery, state: FSMContext) -> None:
+async def cb_confirm(callback: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
     data = await state.get_data()
     user = callback.from_user
 
-    await _ensure_user(user.id, user.username, user.full_name)
-
-    ticket_number = await generate_ticket_number()
-
-    async with async_session() as session:
-        ticket = Ticket(
-            ticket_number=ticket_number,
-            user_id=user.id,
-            category=data["category"],
-            priority=data["priority"],
-            status="new",
-            description=data["description"],
-        )
-        session.add(ticket)
-        await session.flush()
-
-        session.add(TicketMessage(
-            ticket_id=ticket.id,
-            sender_id=user.id,
-            sender_role="user",
-            text=data["description"],
-            file_id=data.get("file_id"),
-        ))
-
-        ticket_id = ticket.id
-        await session.commit()
+    ticket = await TicketRepository(session).create(
+        user_id=user.id,
+        category=data["category"],
+        priority=data["priority"],
+        description=data["description"],
+        file_id=data.get("file_id"),
+    )
+    await UserRepository(session).ensure(user.id, user.username, user.full_name)
+    await session.commit()
+    ticket_id = ticket.id
+    ticket_number = ticket.ticket_number
 
     logger.info("Ticket %s created by user %s", ticket_number, user.id)
 
@@ -194,18 +178,14 @@ async def cb_confirm(callback: CallbackQuery, state: FSMContext) -> None:
             )
 
         # Save admin message_id for later editing
-        async with async_session() as session:
-            result = await session.execute(
-                select(Ticket).where(Ticket.id == ticket_id)
-            )
-            t = result.scalar_one()
-            t.message_id = admin_msg.message_id
-            await session.commit()
+        ticket.message_id = admin_msg.message_id
+        await session.commit()
     except Exception:
         logger.exception("Failed to send ticket %s to admin chat", ticket_number)
 
     await state.clear()
-    await callback.message.edit_text(
+    await edit_text(
+        callback.message,
         f"✅ Заявка {ticket_number} создана!\n\n"
         "Мы уведомим вас, когда администратор возьмёт её в работу.",
         reply_markup=main_menu_keyboard(),
@@ -214,50 +194,64 @@ async def cb_confirm(callback: CallbackQuery, state: FSMContext) -> None:
 
 
 @router.callback_query(F.data == "my_tickets")
-async def cb_my_tickets(callback: CallbackQuery) -> None:
-    await _show_user_tickets(callback.from_user.id, callback=callback)
+async def cb_my_tickets(callback: CallbackQuery, session: AsyncSession) -> None:
+    await _show_user_tickets(session, callback.from_user.id, callback=callback)
+
+
+@router.callback_query(F.data.startswith("my_page:"))
+async def cb_my_tickets_page(callback: CallbackQuery, session: AsyncSession) -> None:
+    _, direction, raw_cursor = callback.data.split(":")
+    await _show_user_tickets(
+        session,
+        callback.from_user.id,
+        callback=callback,
+        cursor=Cursor.decode(raw_cursor),
+        direction=direction,
+    )
 
 
 @router.message(Command("my"))
-async def cmd_my_tickets(message: Message) -> None:
-    await _show_user_tickets(message.from_user.id, message=message)
+async def cmd_my_tickets(message: Message, session: AsyncSession) -> None:
+    await _show_user_tickets(session, message.from_user.id, message=message)
 
 
 async def _show_user_tickets(
+    session: AsyncSession,
     user_id: int,
     message: Message | None = None,
     callback: CallbackQuery | None = None,
+    cursor: Cursor | None = None,
+    direction: str = OLDER,
 ) -> None:
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket)
-            .where(Ticket.user_id == user_id)
-            .order_by(Ticket.created_at.desc())
-            .limit(10)
-        )
-        tickets = result.scalars().all()
+    page = await TicketRepository(session).list_user_page(user_id, cursor, direction)
 
-    if not tickets:
+    if not page.items:
         text = "У вас пока нет заявок."
     else:
         lines = ["📋 Ваши заявки:\n"]
-        for t in tickets:
+        for t in page.items:
             lines.append(format_ticket_status(t))
             lines.append("")
         text = "\n".join(lines)
 
+    keyboard = page_nav_keyboard(
+        f"my_page:{NEWER}:{page.newer.encode()}" if page.newer else None,
+        f"my_page:{OLDER}:{page.older.encode()}" if page.older else None,
+        extra=main_menu_keyboard(),
+    )
+
     if callback:
         try:
-            await callback.message.edit_text(text, reply_markup=main_menu_keyboard())
+            await edit_text(callback.message, text, reply_markup=keyboard)
         except TelegramBadRequest:
             pass
         await callback.answer()
     elif message:
-        await message.answer(text, reply_markup=main_menu_keyboard())
+        await message.answer(text, reply_markup=keyboard)
 
 
 @router.message(Command("status"))
-async def cmd_status(message: Message) -> None:
+async def cmd_status(message: Message, session: AsyncSession) -> None:
     args = message.text.split(maxsplit=1)
     if len(args) < 2:
         await message.answer("Использование: /status #00001")
@@ -267,11 +261,10 @@ async def cmd_status(message: Message) -> None:
     if not ticket_number.startswith("#"):
         ticket_number = f"#{ticket_number}"
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.ticket_number == ticket_number)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket_id = parse_ticket_number(ticket_number)
+    ticket = None
+    if ticket_id is not None:
+        ticket = await TicketRepository(session).get_any(ticket_id)
 
     if ticket is None:
         await message.answer(f"Заявка {ticket_number} не найдена.")
@@ -281,14 +274,12 @@ async def cmd_status(message: Message) -> None:
 
 
 @router.callback_query(F.data.startswith("reply_ticket:"))
-async def cb_reply_ticket(callback: CallbackQuery, state: FSMContext) -> None:
+async def cb_reply_ticket(
+    callback: CallbackQuery, state: FSMContext, session: AsyncSession
+) -> None:
     ticket_id = int(callback.data.split(":")[1])
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket = await TicketRepository(session).lookup(ticket_id)
 
     if ticket is None:
         await callback.answer("Заявка не найдена.", show_alert=True)
@@ -308,7 +299,7 @@ async def cb_reply_ticket(callback: CallbackQuery, state: FSMContext) -> None:
 
 
 @router.message(ReplyTicket.text, F.photo)
-async def msg_reply_photo(message: Message, state: FSMContext) -> None:
+async def msg_reply_photo(message: Message, state: FSMContext, session: AsyncSession) -> None:
     data = await state.get_data()
     ticket_id = data["ticket_id"]
     ticket_number = data["ticket_number"]
@@ -316,19 +307,19 @@ async def msg_reply_photo(message: Message, state: FSMContext) -> None:
     caption = message.caption or ""
 
     await _send_user_reply(
-        message, state, ticket_id, ticket_number,
+        message, state, session, ticket_id, ticket_number,
         text=caption, file_id=photo.file_id,
     )
 
 
 @router.message(ReplyTicket.text, F.text)
-async def msg_reply_text(message: Message, state: FSMContext) -> None:
+async def msg_reply_text(message: Message, state: FSMContext, session: AsyncSession) -> None:
     data = await state.get_data()
     ticket_id = data["ticket_id"]
     ticket_number = data["ticket_number"]
 
     await _send_user_reply(
-        message, state, ticket_id, ticket_number,
+        message, state, session, ticket_id, ticket_number,
         text=message.text, file_id=None,
     )
 
@@ -336,6 +327,7 @@ async def msg_reply_text(message: Message, state: FSMContext) -> None:
 async def _send_user_reply(
     message: Message,
     state: FSMContext,
+    session: AsyncSession,
     ticket_id: int,
     ticket_number: str,
     text: str,
@@ -343,55 +335,47 @@ async def _send_user_reply(
 ) -> None:
     user = message.from_user
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Ticket).where(Ticket.id == ticket_id)
-        )
-        ticket = result.scalar_one_or_none()
+    ticket = await TicketRepository(session).lookup(ticket_id)
 
-        if ticket is None or ticket.status == "closed":
-            await message.answer("Заявка не найдена или уже закрыта.")
-            await state.clear()
-            return
+    if ticket is None or ticket.status == "closed":
+        await message.answer("Заявка не найдена или уже закрыта.")
+        await state.clear()
+        return
 
-        admin_id = ticket.admin_id
+    admin_id = ticket.admin_id
 
-        session.add(TicketMessage(
-            ticket_id=ticket_id,
-            sender_id=user.id,
-            sender_role="user",
-            text=text or None,
-            file_id=file_id,
-        ))
-        await session.commit()
+    await batch_writer.add(TicketMessage(
+        ticket_id=ticket_id,
+        sender_id=user.id,
+        sender_role="user",
+        text=text or None,
+        file_id=file_id,
+    ))
 
-    username = f"@{user.username}" if user.username else user.full_name
+    username = html.escape(f"@{user.username}" if user.username else user.full_name)
     admin_text = (
-        f"💬 Сообщение от пользователя {username} по заявке {ticket_number}:\n\n{text}"
+        f"💬 Сообщение от пользователя {username} по заявке {ticket_number}:\n\n{html.escape(text)}"
         if text
         else f"💬 Сообщение от пользователя {username} по заявке {ticket_number}:"
     )
 
-    # Send to admin's DM if ticket is assigned
-    if admin_id:
-        try:
-            if file_id:
-                await message.bot.send_photo(admin_id, photo=file_id, caption=admin_text)
-            else:
-                await message.bot.send_message(admin_id, admin_text)
-        except Exception:
-            logger.warning("Could not send reply to admin %s for ticket %s", admin_id, ticket_number)
-
-    # Send to admin chat
-    try:
+    def forward(chat_id: int) -> Awaitable:
         if file_id:
-            await message.bot.send_photo(
-                settings.ADMIN_CHAT_ID, photo=file_id, caption=admin_text,
-            )
-        else:
-            await message.bot.send_message(settings.ADMIN_CHAT_ID, admin_text)
-    except Exception:
-        logger.warning("Could not send reply to admin chat for ticket %s", ticket_number)
+            return message.bot.send_photo(chat_id, photo=file_id, caption=admin_text)
+        return message.bot.send_message(chat_id, admin_text)
+
+    # Admin chat, plus the admin's DM if the ticket is assigned; the user
+    # is answered without waiting for them
+    sends = [(
+        forward(settings.ADMIN_CHAT_ID),
+        f"Could not send reply to admin chat for ticket {ticket_number}",
+    )]
+    if admin_id:
+        sends.append((
+            forward(admin_id),
+            f"Could not send reply to admin {admin_id} for ticket {ticket_number}",
+        ))
+    await fan_out(*sends, wait=False)
 
     await state.clear()
     await message.answer(
@@ -405,7 +389,7 @@ async def _send_user_reply(
 
 
 @router.message(Command("ticket"))
-async def cmd_ticket(message: Message) -> None:
+async def cmd_ticket(message: Message, session: AsyncSession) -> None:
     args = message.text.split(maxsplit=1)
     if len(args) < 2 or not args[1].strip():
         await message.reply("Использование: /ticket <описание проблемы>")
@@ -414,31 +398,16 @@ async def cmd_ticket(message: Message) -> None:
     description = args[1].strip()
     user = message.from_user
 
-    await _ensure_user(user.id, user.username, user.full_name)
-
-    ticket_number = await generate_ticket_number()
-
-    async with async_session() as session:
-        ticket = Ticket(
-            ticket_number=ticket_number,
-            user_id=user.id,
-            category="other",
-            priority="medium",
-            status="new",
-            description=description,
-        )
-        session.add(ticket)
-        await session.flush()
-
-        session.add(TicketMessage(
-            ticket_id=ticket.id,
-            sender_id=user.id,
-            sender_role="user",
-            text=description,
-        ))
-
-        ticket_id = ticket.id
-        await session.commit()
+    ticket = await TicketRepository(session).create(
+        user_id=user.id,
+        category="other",
+        priority="medium",
+        description=description,
+    )
+    await UserRepository(session).ensure(user.id, user.username, user.full_name)
+    await session.commit()
+    ticket_id = ticket.id
+    ticket_number = ticket.ticket_number
 
     logger.info("Ticket %s created from group chat by user %s", ticket_number, user.id)
 
@@ -458,13 +427,8 @@ async def cmd_ticket(message: Message) -> None:
             admin_text,
             reply_markup=take_ticket_keyboard(ticket_id),
         )
-        async with async_session() as session:
-            result = await session.execute(
-                select(Ticket).where(Ticket.id == ticket_id)
-            )
-            t = result.scalar_one()
-            t.message_id = admin_msg.message_id
-            await session.commit()
+        ticket.message_id = admin_msg.message_id
+        await session.commit()
     except Exception:
         logger.exception("Failed to send ticket %s to admin chat", ticket_number)
 
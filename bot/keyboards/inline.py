@@ -1,6 +1,8 @@
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from bot.utils.cache import memoize
+
 CATEGORIES = [
     ("network", "Сеть / Интернет"),
     ("software", "Программное обеспечение"),
@@ -15,186 +17,157 @@ PRIORITIES = [
     ("high", "🔴 Высокий — работа остановлена"),
 ]
 
+# Per-ticket markups are memoized: a ticket's card is re-rendered many times
+# over its life, and only recent tickets are being clicked on.
+KEYBOARD_CACHE_SIZE = 1024
+
+# Markups below are shared between calls and must not be modified by callers.
+
+
+def _markup(template, **values) -> InlineKeyboardMarkup:
+    """Build a markup from rows of (text, callback_data) format strings."""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text=text.format(**values), callback_data=data.format(**values))
+            for text, data in row
+        ]
+        for row in template
+    ])
+
+
+_MAIN_MENU = _markup([
+    [("📝 Создать заявку", "new_ticket")],
+    [("📋 Мои заявки", "my_tickets")],
+])
+
+_CATEGORIES = _markup(
+    [[(label, f"cat:{code}")] for code, label in CATEGORIES]
+    + [[("❌ Отмена", "cancel")]]
+)
+
+_PRIORITIES = _markup(
+    [[(label, f"pri:{code}")] for code, label in PRIORITIES]
+    + [[("❌ Отмена", "cancel")]]
+)
+
+_CONFIRM = _markup([
+    [("✅ Отправить", "confirm_ticket"), ("❌ Отмена", "cancel")],
+])
+
 
 def main_menu_keyboard() -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(text="📝 Создать заявку", callback_data="new_ticket")
-    )
-    builder.row(
-        InlineKeyboardButton(text="📋 Мои заявки", callback_data="my_tickets")
-    )
-    return builder.as_markup()
+    return _MAIN_MENU
 
 
 def categories_keyboard() -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    for code, label in CATEGORIES:
-        builder.row(
-            InlineKeyboardButton(text=label, callback_data=f"cat:{code}")
-        )
-    builder.row(
-        InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")
-    )
-    return builder.as_markup()
+    return _CATEGORIES
 
 
 def priorities_keyboard() -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    for code, label in PRIORITIES:
-        builder.row(
-            InlineKeyboardButton(text=label, callback_data=f"pri:{code}")
-        )
-    builder.row(
-        InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")
-    )
-    return builder.as_markup()
+    return _PRIORITIES
 
 
 def confirm_keyboard() -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(text="✅ Отправить", callback_data="confirm_ticket"),
-        InlineKeyboardButton(text="❌ Отмена", callback_data="cancel"),
-    )
-    return builder.as_markup()
+    return _CONFIRM
+
+
+# --- Per-ticket keyboards ---
+# Button texts may contain braces (admin names), so they are passed as values.
+
+_TAKE_TICKET = [
+    [("🔧 Взять в работу", "take_ticket:{id}")],
+]
+
+_TICKET_TAKEN = [
+    [("👷 Заявку взял: {admin_name}", "noop")],
+    [("✍️ Ответить", "admin_reply_ticket:{id}"), ("✅ Закрыть заявку", "close_ticket:{id}")],
+    [("⏸ Ожидание", "hold_ticket:{id}"), ("⚙️ Управление", "admin_manage_ticket:{id}")],
+    [("📋 Мои заявки", "admin_my_tickets")],
+]
+
+_REPLY_TO_TICKET = [
+    [("✍️ Ответить", "reply_ticket:{id}")],
+]
+
+_CLOSE_TICKET = [
+    [("✅ Закрыть заявку", "close_ticket:{id}")],
+]
+
+_ADMIN_MANAGE = [
+    [("📁 Категория", "admin_edit_cat:{id}"), ("⚡ Приоритет", "admin_edit_pri:{id}")],
+    [("✏️ Описание", "admin_edit_desc:{id}")],
+    [
+        ("🧹 Очистить историю", "admin_clear_history:{id}"),
+        ("🗑 Удалить заявку", "admin_delete_ticket:{id}"),
+    ],
+    [("◀️ Назад", "admin_manage_back:{id}")],
+]
+
+_ADMIN_CATEGORIES = (
+    [[(label, "admin_set_cat:{id}:" + code)] for code, label in CATEGORIES]
+    + [[("◀️ Назад", "admin_manage_ticket:{id}")]]
+)
+
+_ADMIN_PRIORITIES = (
+    [[(label, "admin_set_pri:{id}:" + code)] for code, label in PRIORITIES]
+    + [[("◀️ Назад", "admin_manage_ticket:{id}")]]
+)
 
+_ADMIN_CONFIRM_DELETE = [
+    [("🗑 Да, удалить", "admin_confirm_del:{id}"), ("◀️ Отмена", "admin_manage_ticket:{id}")],
+]
+
+_ADMIN_CONFIRM_CLEAR = [
+    [("🧹 Да, очистить", "admin_confirm_clear:{id}"), ("◀️ Отмена", "admin_manage_ticket:{id}")],
+]
 
+
+@memoize("kb:take_ticket", KEYBOARD_CACHE_SIZE)
 def take_ticket_keyboard(ticket_id: int) -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(
-            text="🔧 Взять в работу", callback_data=f"take_ticket:{ticket_id}"
-        )
-    )
-    return builder.as_markup()
+    return _markup(_TAKE_TICKET, id=ticket_id)
 
 
+@memoize("kb:ticket_taken", KEYBOARD_CACHE_SIZE)
 def ticket_taken_keyboard(admin_name: str, ticket_id: int) -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(
-            text=f"👷 Заявку взял: {admin_name}", callback_data="noop"
-        )
-    )
-    builder.row(
-        InlineKeyboardButton(
-            text="✍️ Ответить", callback_data=f"admin_reply_ticket:{ticket_id}"
-        ),
-        InlineKeyboardButton(
-            text="✅ Закрыть заявку", callback_data=f"close_ticket:{ticket_id}"
-        ),
-    )
-    builder.row(
-        InlineKeyboardButton(
-            text="⏸ Ожидание", callback_data=f"hold_ticket:{ticket_id}"
-        ),
-        InlineKeyboardButton(
-            text="⚙️ Управление", callback_data=f"admin_manage_ticket:{ticket_id}"
-        ),
-    )
-    builder.row(
-        InlineKeyboardButton(
-            text="📋 Мои заявки", callback_data="admin_my_tickets"
-        )
-    )
-    return builder.as_markup()
+    return _markup(_TICKET_TAKEN, id=ticket_id, admin_name=admin_name)
 
 
+@memoize("kb:reply_to_ticket", KEYBOARD_CACHE_SIZE)
 def reply_to_ticket_keyboard(ticket_id: int) -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(
-            text="✍️ Ответить", callback_data=f"reply_ticket:{ticket_id}"
-        )
-    )
-    return builder.as_markup()
+    return _markup(_REPLY_TO_TICKET, id=ticket_id)
 
 
+@memoize("kb:close_ticket", KEYBOARD_CACHE_SIZE)
 def close_ticket_keyboard(ticket_id: int) -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(
-            text="✅ Закрыть заявку", callback_data=f"close_ticket:{ticket_id}"
-        )
-    )
-    return builder.as_markup()
+    return _markup(_CLOSE_TICKET, id=ticket_id)
 
 
+@memoize("kb:admin_manage", KEYBOARD_CACHE_SIZE)
 def admin_manage_keyboard(ticket_id: int) -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(
-            text="📁 Категория", callback_data=f"admin_edit_cat:{ticket_id}"
-        ),
-        InlineKeyboardButton(
-            text="⚡ Приоритет", callback_data=f"admin_edit_pri:{ticket_id}"
-        ),
-    )
-    builder.row(
-        InlineKeyboardButton(
-            text="✏️ Описание", callback_data=f"admin_edit_desc:{ticket_id}"
-        )
-    )
-    builder.row(
-        InlineKeyboardButton(
-            text="🧹 Очистить историю", callback_data=f"admin_clear_history:{ticket_id}"
-        ),
-        InlineKeyboardButton(
-            text="🗑 Удалить заявку", callback_data=f"admin_delete_ticket:{ticket_id}"
-        ),
-    )
-    builder.row(
-        InlineKeyboardButton(
-            text="◀️ Назад", callback_data=f"admin_manage_back:{ticket_id}"
-        )
-    )
-    return builder.as_markup()
+    return _markup(_ADMIN_MANAGE, id=ticket_id)
 
 
+@memoize("kb:admin_categories", KEYBOARD_CACHE_SIZE)
 def admin_categories_keyboard(ticket_id: int) -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    for code, label in CATEGORIES:
-        builder.row(
-            InlineKeyboardButton(
-                text=label, callback_data=f"admin_set_cat:{ticket_id}:{code}"
-            )
-        )
-    builder.row(
-        InlineKeyboardButton(
-            text="◀️ Назад", callback_data=f"admin_manage_ticket:{ticket_id}"
-        )
-    )
-    return builder.as_markup()
+    return _markup(_ADMIN_CATEGORIES, id=ticket_id)
 
 
+@memoize("kb:admin_priorities", KEYBOARD_CACHE_SIZE)
 def admin_priorities_keyboard(ticket_id: int) -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    for code, label in PRIORITIES:
-        builder.row(
-            InlineKeyboardButton(
-                text=label, callback_data=f"admin_set_pri:{ticket_id}:{code}"
-            )
-        )
-    builder.row(
-        InlineKeyboardButton(
-            text="◀️ Назад", callback_data=f"admin_manage_ticket:{ticket_id}"
-        )
-    )
-    return builder.as_markup()
+    return _markup(_ADMIN_PRIORITIES, id=ticket_id)
 
 
+@memoize("kb:admin_confirm_delete", KEYBOARD_CACHE_SIZE)
 def admin_confirm_delete_keyboard(ticket_id: int) -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(
-            text="🗑 Да, удалить", callback_data=f"admin_confirm_del:{ticket_id}"
-        ),
-        InlineKeyboardButton(
-            text="◀️ Отмена", callback_data=f"admin_manage_ticket:{ticket_id}"
-        ),
-    )
-    return builder.as_markup()
+    return _markup(_ADMIN_CONFIRM_DELETE, id=ticket_id)
+
+
+@memoize("kb:admin_confirm_clear", KEYBOARD_CACHE_SIZE)
+def admin_confirm_clear_keyboard(ticket_id: int) -> InlineKeyboardMarkup:
+    return _markup(_ADMIN_CONFIRM_CLEAR, id=ticket_id)
+
+
+# --- Keyboards built from query results ---
 
 
 def admin_my_tickets_keyboard(tickets) -> InlineKeyboardMarkup:
@@ -211,14 +184,30 @@ def admin_my_tickets_keyboard(tickets) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def admin_confirm_clear_keyboard(ticket_id: int) -> InlineKeyboardMarkup:
+def ticket_buttons_keyboard(buttons: list[tuple[str, str]]) -> InlineKeyboardMarkup:
+    """One button per ticket, two per row, e.g. under a reminder digest."""
     builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(
-            text="🧹 Да, очистить", callback_data=f"admin_confirm_clear:{ticket_id}"
-        ),
-        InlineKeyboardButton(
-            text="◀️ Отмена", callback_data=f"admin_manage_ticket:{ticket_id}"
-        ),
-    )
+    for text, data in buttons:
+        builder.button(text=text, callback_data=data)
+    builder.adjust(2)
     return builder.as_markup()
+
+
+def page_nav_keyboard(
+    prev_data: str | None,
+    next_data: str | None,
+    extra: InlineKeyboardMarkup | None = None,
+) -> InlineKeyboardMarkup:
+    """◀️ / ▶️ row (only the buttons that lead somewhere), then ``extra``'s rows."""
+    rows = []
+    buttons = []
+    if prev_data:
+        buttons.append(InlineKeyboardButton(text="◀️", callback_data=prev_data))
+    if next_data:
+        buttons.append(InlineKeyboardButton(text="▶️", callback_data=next_data))
+    if buttons:
+        rows.append(buttons)
+    if extra is not None:
+        # Reuse extra's (shared, unmodified) rows instead of copying them
+        rows.extend(extra.inline_keyboard)
+    return InlineKeyboardMarkup(inline_keyboard=rows)
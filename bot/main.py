@@ -1,15 +1,120 @@
 import asyncio
 import logging
+import signal
+from contextlib import suppress
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+from aiogram.utils.backoff import Backoff, BackoffConfig
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
 
 from bot.config import settings
-from bot.db.database import init_db
+from bot.db.archive import archive_loop
+from bot.db.database import async_session, checkpoint_loop, init_db
+from bot.db.fsm_storage import create_fsm_storage
+from bot.db.lease import LeaderLease, run_as_leader
+from bot.db.open_tickets import open_tickets_check_loop, warm_open_tickets
+from bot.db.stats import stats_reconcile_loop
+from bot.db.writer import batch_writer
 from bot.handlers import get_all_routers
-from bot.utils.reminders import reminder_loop
+from bot.middlewares.access import admin_roster
+from bot.middlewares.admin_names import AdminNameMiddleware
+from bot.middlewares.db import DbSessionMiddleware
+from bot.utils.broadcast import broadcast
+from bot.utils.executor import UpdateExecutor
+from bot.utils.notify import drain_notifications
+from bot.utils.outbound import outbound
+from bot.utils.reminders import reminder_loop, reminder_scheduler
+from bot.utils.webhook import serve_webhook
+
+
+def create_bot() -> Bot:
+    session = None
+    if settings.TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL))
+    return Bot(
+        token=settings.BOT_TOKEN,
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+
+
+def cluster_ports() -> list[int]:
+    return [settings.CLUSTER_BASE_PORT + i for i in range(settings.CLUSTER_WORKERS)]
+
+
+async def run_polling(dp: Dispatcher, bot: Bot, executor: UpdateExecutor) -> None:
+    """Long polling through ``executor``. The next getUpdates is sent only
+    once the previous batch has been accepted, so a full executor pauses
+    polling and the backlog waits on Telegram's side."""
+    logger = logging.getLogger(__name__)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    async def poll() -> None:
+        backoff = Backoff(BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1))
+        get_updates = GetUpdates(timeout=30, allowed_updates=dp.resolve_used_update_types())
+        while True:
+            try:
+                updates = await bot(get_updates, request_timeout=int(bot.session.timeout + 30))
+            except Exception as e:
+                logger.error("Failed to fetch updates - %s: %s", type(e).__name__, e)
+                await backoff.asleep()
+                continue
+            backoff.reset()
+            for update in updates:
+                await executor.submit(update)
+                get_updates.offset = update.update_id + 1
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    logger.info("Start polling")
+    polling = asyncio.create_task(poll())
+    stopping = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait([polling, stopping], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        polling.cancel()
+        stopping.cancel()
+        logger.info("Polling stopped")
+        await executor.close()
+        try:
+            # Flushes the FSM storage
+            await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        finally:
+            await bot.session.close()
+
+
+async def run_webhook(
+    dp: Dispatcher, bot: Bot, executor: UpdateExecutor, wait: bool = False
+) -> None:
+    """Serve updates over HTTP through ``executor``. The response is held
+    while the executor is full. Cluster workers also wait for the update to
+    be handled (``wait=True``), so the supervisor can keep a chat's updates
+    in order."""
+    async def handle(data: dict) -> None:
+        update = Update.model_validate(data, context={"bot": bot})
+        handled = await executor.submit(update)
+        if wait:
+            await handled
+
+    async def close_executor(app: web.Application) -> None:
+        await executor.close()
+
+    def setup(app: web.Application) -> None:
+        # Before the dispatcher shutdown (FSM storage flush, bot session close)
+        app.on_shutdown.append(close_executor)
+        setup_application(app, dp, bot=bot)
+
+    await serve_webhook(bot, handle, dp.resolve_used_update_types(), setup)
 
 
 async def main() -> None:
@@ -19,21 +124,56 @@ async def main() -> None:
     )
     logger = logging.getLogger(__name__)
 
-    logger.info("Initializing database...")
-    await init_db()
+    if settings.BOT_MODE != "worker":
+        # Cluster workers start after the supervisor has migrated the DB
+        logger.info("Initializing database...")
+        await init_db()
+    await admin_roster.refresh()
+    await warm_open_tickets()
+    await reminder_scheduler.load()
+    storage = create_fsm_storage()
+    await storage.load()
 
-    bot = Bot(
-        token=settings.BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
-    )
-    dp = Dispatcher(storage=MemoryStorage())
+    bot = create_bot()
+    bot.session.middleware(outbound)
+    dp = Dispatcher(storage=storage)
+    dp.update.middleware(DbSessionMiddleware(async_session))
+    dp.update.middleware(AdminNameMiddleware())
 
     for router in get_all_routers():
         dp.include_router(router)
 
     logger.info("Starting bot...")
-    asyncio.create_task(reminder_loop(bot))
-    await dp.start_polling(bot)
+    outbound.start()
+    executor = UpdateExecutor(settings.UPDATE_CONCURRENCY, settings.UPDATE_QUEUE_LIMIT)
+    executor.start(dp, bot)
+    # Jobs that must run in one process only
+    singletons = [
+        lambda: reminder_loop(bot),
+        checkpoint_loop,
+        archive_loop,
+        stats_reconcile_loop,
+    ]
+    asyncio.create_task(open_tickets_check_loop())
+    try:
+        if settings.BOT_MODE == "worker":
+            ports = cluster_ports()
+            await broadcast.start(ports[settings.WORKER_ID], ports)
+            lease = LeaderLease("jobs", f"worker-{settings.WORKER_ID}", settings.LEASE_TTL)
+            asyncio.create_task(run_as_leader(lease, singletons))
+            await run_webhook(dp, bot, executor, wait=True)
+        else:
+            for job in singletons:
+                asyncio.create_task(job())
+            if settings.BOT_MODE == "webhook":
+                await run_webhook(dp, bot, executor)
+            else:
+                await run_polling(dp, bot, executor)
+    finally:
+        broadcast.close()
+        await drain_notifications()
+        await outbound.close()
+        await batch_writer.close()
 
 
 if __name__ == "__main__":
@@ -1,15 +1,63 @@
-from sqlalchemy import select
+import asyncio
+import logging
+import time
 
 from bot.config import settings
 from bot.db.database import async_session
-from bot.db.models import Admin
+from bot.db.repository import AdminRepository
+from bot.utils.broadcast import broadcast, subscribe
+
+logger = logging.getLogger(__name__)
+
+
+class AdminRoster:
+    """Active admin IDs plus SENIOR_ADMIN_IDS, kept in memory.
+
+    /addadmin and /removeadmin update it in place; the TTL reload picks up
+    changes made to the admins table outside the bot.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._ids: frozenset[int] = frozenset(settings.SENIOR_ADMIN_IDS)
+        self._loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    def _stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    async def refresh(self) -> None:
+        async with async_session() as session:
+            ids = await AdminRepository(session).active_ids()
+        self._ids = frozenset(ids) | frozenset(settings.SENIOR_ADMIN_IDS)
+        self._loaded_at = time.monotonic()
+        logger.debug("Admin roster loaded: %d admins", len(self._ids))
+
+    async def contains(self, user_id: int) -> bool:
+        if self._stale():
+            async with self._lock:
+                # Another caller may have reloaded while we waited
+                if self._stale():
+                    await self.refresh()
+        return user_id in self._ids
+
+    def add(self, user_id: int) -> None:
+        self._ids = self._ids | {user_id}
+        broadcast.publish("admins")
+
+    def discard(self, user_id: int) -> None:
+        if user_id not in settings.SENIOR_ADMIN_IDS:
+            self._ids = self._ids - {user_id}
+        broadcast.publish("admins")
+
+
+admin_roster = AdminRoster(settings.ADMIN_ROSTER_TTL)
+
+
+@subscribe("admins")
+async def _reload_roster(_) -> None:
+    await admin_roster.refresh()
 
 
 async def is_admin(user_id: int) -> bool:
-    if user_id in settings.SENIOR_ADMIN_IDS:
-        return True
-    async with async_session() as session:
-        result = await session.execute(
-            select(Admin).where(Admin.id == user_id, Admin.is_active.is_(True))
-        )
-        return result.scalar_one_or_none() is not None
+    return await admin_roster.contains(user_id)
@@ -0,0 +1,25 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.middlewares.access import is_admin
+from bot.utils.admin_names import admin_names
+
+
+class AdminNameMiddleware(BaseMiddleware):
+    """Refresh the cached display name of the admin behind each update.
+
+    Registered after DbSessionMiddleware, whose session it reuses.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and await is_admin(user.id):
+            await admin_names.observe(data["session"], user)
+        return await handler(event, data)
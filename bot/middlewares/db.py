@@ -0,0 +1,35 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """One AsyncSession per update, passed to handlers as ``session``.
+
+    The session only checks out a connection on its first query, so updates
+    that never touch the database cost nothing. Whatever is still pending when
+    the handler returns is committed; an exception rolls it back. Handlers may
+    commit earlier themselves, e.g. to release the write lock before calling
+    Telegram.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker) -> None:
+        self.session_pool = session_pool
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async with self.session_pool() as session:
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+            except Exception:
+                await session.rollback()
+                raise
+            await session.commit()
+            return result
@@ -0,0 +1,75 @@
+import logging
+
+from aiogram import Bot
+from aiogram.types import User as TelegramUser
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import settings
+from bot.db.repository import AdminRepository
+from bot.utils.broadcast import broadcast, subscribe
+from bot.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def display_name(username: str | None, full_name: str) -> str:
+    return f"@{username}" if username else full_name
+
+
+class AdminNames:
+    """Display names of admins for ticket cards and notices.
+
+    Looked up in memory, then in the admins table, and only then via
+    get_chat_member. Admins' own updates keep both the memory entry and
+    their admins row current (see AdminNameMiddleware).
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._cache = LRUCache("admin_names", maxsize, ttl)
+
+    async def resolve(self, bot: Bot, session: AsyncSession, admin_id: int) -> str:
+        name = self._cache.get(admin_id)
+        if name is not None:
+            return name
+
+        admin = await AdminRepository(session).get(admin_id)
+        if admin is not None:
+            name = display_name(admin.username, admin.full_name)
+        else:
+            # Senior admins from the config have no admins row
+            try:
+                member = await bot.get_chat_member(settings.ADMIN_CHAT_ID, admin_id)
+            except Exception:
+                logger.warning("Could not resolve name of admin %s", admin_id)
+                return str(admin_id)
+            name = display_name(member.user.username, member.user.full_name)
+
+        self._cache.put(admin_id, name)
+        return name
+
+    def forget(self, admin_id: int) -> None:
+        self._cache.pop(admin_id)
+
+    async def observe(self, session: AsyncSession, user: TelegramUser) -> None:
+        """Record the name an admin currently has, writing their row only if it changed."""
+        name = display_name(user.username, user.full_name)
+        if self._cache.get(user.id) == name:
+            return
+        admin = await AdminRepository(session).get(user.id)
+        if admin is not None and (admin.username, admin.full_name) != (user.username, user.full_name):
+            admin.username = user.username
+            admin.full_name = user.full_name
+            # Commit now rather than holding the write lock through the handler
+            await session.commit()
+            broadcast.publish("admin_name", user.id)
+        self._cache.put(user.id, name)
+
+
+admin_names = AdminNames(
+    maxsize=settings.ADMIN_NAME_CACHE_SIZE, ttl=settings.ADMIN_NAME_TTL
+)
+
+
+@subscribe("admin_name")
+def _forget_admin_name(admin_id: int) -> None:
+    admin_names.forget(admin_id)
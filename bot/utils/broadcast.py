@@ -0,0 +1,90 @@
+"""Cache invalidation between cluster workers.
+
+Every worker keeps in-memory state current from its own commits: the open
+ticket index, reminder deadlines, the user and admin caches. In cluster
+mode (see bot.cluster) publish() also sends a small UDP datagram over the
+loopback to every other worker, whose subscribers then reload the entry
+from the DB. Outside cluster mode publish() does nothing.
+
+Delivery is best effort. The TTLs and periodic checks of each cache stay
+in place as the fallback.
+"""
+import asyncio
+import inspect
+import json
+import logging
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+_HOST = "127.0.0.1"
+
+_subscribers: dict[str, list[Callable[[Any], Any]]] = {}
+
+
+def subscribe(kind: str) -> Callable:
+    """Register ``handler(key)`` (sync or async) for events of ``kind``."""
+    def decorator(handler: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        _subscribers.setdefault(kind, []).append(handler)
+        return handler
+    return decorator
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, channel: "Broadcast") -> None:
+        self.channel = channel
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.channel._dispatch(data)
+
+
+class Broadcast:
+    def __init__(self) -> None:
+        self._transport: asyncio.DatagramTransport | None = None
+        self._peers: list[int] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    async def start(self, port: int, peers: list[int]) -> None:
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _Protocol(self), local_addr=(_HOST, port)
+        )
+        self._peers = [peer for peer in peers if peer != port]
+        logger.info("Broadcast channel on udp/%d, %d peers", port, len(self._peers))
+
+    def close(self) -> None:
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def publish(self, kind: str, key: Any = None) -> None:
+        if self._transport is None:
+            return
+        data = json.dumps([kind, key]).encode()
+        for peer in self._peers:
+            self._transport.sendto(data, (_HOST, peer))
+
+    def _dispatch(self, data: bytes) -> None:
+        try:
+            kind, key = json.loads(data)
+        except ValueError:
+            logger.warning("Malformed broadcast datagram: %r", data[:100])
+            return
+        for handler in _subscribers.get(kind, ()):
+            try:
+                result = handler(key)
+            except Exception:
+                logger.exception("Error handling %s broadcast", kind)
+                continue
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._tasks.add(task)
+                task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Error handling broadcast", exc_info=task.exception())
+
+
+broadcast = Broadcast()
@@ -0,0 +1,80 @@
+import functools
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+# Every LRUCache (and other bounded store with describe()) by name,
+# for the senior admin /caches command
+caches: dict[str, Any] = {}
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key.
+
+    With ``ttl`` (seconds) an entry also expires that long after it was put.
+    Counts hits and misses so the size can be tuned from /caches.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float | None = None) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        caches[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+            self._data.pop(key, None)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def describe(self) -> str:
+        lookups = self.hits + self.misses
+        rate = f"{self.hits / lookups:.0%}" if lookups else "—"
+        return (
+            f"{self.name}: {len(self)}/{self.maxsize}, "
+            f"hits {self.hits}, misses {self.misses}, hit rate {rate}"
+        )
+
+
+_MISSING = object()
+
+
+def memoize(name: str, maxsize: int) -> Callable:
+    """Like functools.lru_cache (positional arguments only), but reported in /caches."""
+    def decorator(func: Callable) -> Callable:
+        cache = LRUCache(name, maxsize)
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            value = cache.get(args, _MISSING)
+            if value is _MISSING:
+                value = func(*args)
+                cache.put(args, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,186 @@
+"""Per-chat ordered, cross-chat parallel update processing.
+
+Every update goes to the lane of its chat (the user for updates without a
+chat). A lane is served by at most one worker at a time, so a chat's
+updates - e.g. a photo followed by its caption while replying to a
+ticket - are handled in the order Telegram sent them, while different
+chats run in parallel on ``workers`` tasks. A busy lane goes to the back
+of the ready queue after each update, so one chatty user can't hold a
+worker.
+
+submit() returns once the update is accepted. Updates accepted but not
+yet handled are capped at ``max_in_flight``: when handlers fall behind
+(usually the DB), submit() waits, which stops the polling loop or holds
+the webhook response until lanes drain.
+
+Shown in /caches: lanes and their depth, average and max wait in a lane
+and handling time, and for messages the delivery lag (message date to the
+start of handling, whole seconds as Telegram gives them), to compare
+polling and webhook mode.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+from bot.utils.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# Lanes listed in /caches
+_TOP_LANES = 3
+
+
+def lane_key(update: Update) -> int:
+    context = UserContextMiddleware.resolve_event_context(update)
+    if context.chat_id is not None:
+        return context.chat_id
+    if context.user_id is not None:
+        return context.user_id
+    # Nothing to order against: a lane of its own
+    return -update.update_id
+
+
+class UpdateExecutor:
+    def __init__(self, workers: int, max_in_flight: int) -> None:
+        self.name = "lanes"
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        # Chat -> (update, future, accepted at); the head is the one being handled
+        self._lanes: dict[int, deque[tuple[Update, asyncio.Future, float]]] = {}
+        self._ready: asyncio.Queue[int] | None = None
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: list[asyncio.Task] = []
+        self.in_flight = 0
+        self.handled = 0
+        self.failed = 0
+        self.depth_max = 0
+        self.paused = 0
+        self.paused_total = 0.0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.handle_total = 0.0
+        self.handle_max = 0.0
+        self.lag_total = 0.0
+        self.lag_count = 0
+        caches[self.name] = self
+
+    def start(self, dp: Dispatcher, bot: Bot) -> None:
+        self._ready = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(dp, bot)) for _ in range(self.workers)
+        ]
+        logger.info(
+            "Update executor started (%d workers, %d in flight max)",
+            self.workers, self.max_in_flight,
+        )
+
+    async def close(self, timeout: float = 10) -> None:
+        """Let accepted updates finish, then stop the workers. Updates still
+        pending after ``timeout`` have their futures cancelled, so whoever
+        awaits one (a cluster worker's webhook response) doesn't hang."""
+        if self.in_flight:
+            deadline = time.monotonic() + timeout
+            while self.in_flight and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+            if self.in_flight:
+                logger.warning("Dropping %d unhandled updates", self.in_flight)
+        for lane in self._lanes.values():
+            for _, future, _ in lane:
+                future.cancel()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def submit(self, update: Update) -> asyncio.Future:
+        """Queue ``update`` on its lane. The returned future resolves with
+        the handler's result (None if it failed, the error is logged here)."""
+        if self._slots.locked():
+            self.paused += 1
+            started = time.monotonic()
+            await self._slots.acquire()
+            self.paused_total += time.monotonic() - started
+        else:
+            await self._slots.acquire()
+        self.in_flight += 1
+        future = asyncio.get_running_loop().create_future()
+        key = lane_key(update)
+        lane = self._lanes.get(key)
+        item = (update, future, time.monotonic())
+        if lane is None:
+            self._lanes[key] = deque([item])
+            self._ready.put_nowait(key)
+        else:
+            # The lane is queued or running; the worker picks this up after the head
+            lane.append(item)
+            self.depth_max = max(self.depth_max, len(lane))
+        return future
+
+    async def _worker(self, dp: Dispatcher, bot: Bot) -> None:
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            update, future, accepted_at = lane[0]
+            started_at = time.monotonic()
+            if update.message is not None:
+                lag = datetime.now(timezone.utc) - update.message.date
+                self.lag_total += max(lag.total_seconds(), 0)
+                self.lag_count += 1
+            result = None
+            try:
+                result = await dp.feed_update(bot, update)
+            except Exception:
+                self.failed += 1
+                logger.exception("Error handling update %d", update.update_id)
+            else:
+                self.handled += 1
+            finally:
+                self._record(started_at - accepted_at, time.monotonic() - started_at)
+                if not future.done():
+                    future.set_result(result)
+                lane.popleft()
+                if lane:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._lanes[key]
+                self.in_flight -= 1
+                self._slots.release()
+
+    def _record(self, wait: float, handle: float) -> None:
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.handle_total += handle
+        self.handle_max = max(self.handle_max, handle)
+
+    def depths(self, limit: int | None = None) -> list[tuple[int, int]]:
+        """(chat, queued updates) of the deepest lanes first."""
+        depths = sorted(
+            ((key, len(lane)) for key, lane in self._lanes.items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        return depths[:limit]
+
+    def describe(self) -> str:
+        top = ", ".join(f"{key}: {depth}" for key, depth in self.depths(_TOP_LANES))
+        line = (
+            f"{self.name}: {len(self._lanes)} chats, in flight "
+            f"{self.in_flight}/{self.max_in_flight}, handled {self.handled}, "
+            f"failed {self.failed}, deepest [{top or '—'}], max depth {self.depth_max}, "
+            f"intake paused {self.paused} times ({self.paused_total:.1f} s)"
+        )
+        done = self.handled + self.failed
+        if not done:
+            return line
+        lag = f"{self.lag_total / self.lag_count:.1f} s" if self.lag_count else "—"
+        return (
+            f"{line}, wait avg {self.wait_total / done * 1000:.0f} ms "
+            f"(max {self.wait_max * 1000:.0f}), "
+            f"handling avg {self.handle_total / done * 1000:.0f} ms "
+            f"(max {self.handle_max * 1000:.0f}), delivery lag avg {lag}"
+        )
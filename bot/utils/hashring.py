@@ -0,0 +1,42 @@
+import bisect
+import hashlib
+from typing import Hashable
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of keys onto nodes.
+
+    Each node owns ``replicas`` points on a ring; a key belongs to the first
+    point at or after its hash. Adding or removing a node only moves the keys
+    that node gains or loses (about 1/N of them).
+    """
+
+    def __init__(self, nodes: list[Hashable] = (), replicas: int = 64) -> None:
+        self.replicas = replicas
+        self._points: list[int] = []
+        self._owners: dict[int, Hashable] = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: Hashable) -> None:
+        for i in range(self.replicas):
+            point = _hash(f"{node}:{i}")
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node: Hashable) -> None:
+        for i in range(self.replicas):
+            point = _hash(f"{node}:{i}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._points.remove(point)
+
+    def get(self, key: Hashable) -> Hashable:
+        if not self._points:
+            raise LookupError("hash ring is empty")
+        index = bisect.bisect_left(self._points, _hash(str(key))) % len(self._points)
+        return self._owners[self._points[index]]
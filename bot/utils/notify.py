@@ -0,0 +1,51 @@
+"""Concurrent notification fan-out.
+
+A handler that tells several chats about one event used to await each send
+in turn, so it took the sum of the round trips. fan_out() runs the sends
+concurrently (at most MAX_CONCURRENT_SENDS across the bot) and logs each
+failure without affecting the others. With ``wait=False`` it returns at
+once and the sends finish in the background, so the user gets their answer
+before a slow recipient is done.
+
+Background sends must not use the handler's DB session: it is closed when
+the handler returns.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_SENDS = 16
+
+_semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+_background: set[asyncio.Task] = set()
+
+
+async def _send(call: Awaitable, failure: str) -> Any:
+    async with _semaphore:
+        try:
+            return await call
+        except Exception:
+            logger.warning(failure)
+            return None
+
+
+async def fan_out(*sends: tuple[Awaitable, str], wait: bool = True) -> list[Any]:
+    """Run ``(call, failure log message)`` pairs concurrently.
+
+    With ``wait`` returns the results in order, None for a failed send;
+    otherwise schedules them and returns an empty list.
+    """
+    gathered = asyncio.gather(*(_send(call, failure) for call, failure in sends))
+    if wait:
+        return await gathered
+    _background.add(gathered)
+    gathered.add_done_callback(_background.discard)
+    return []
+
+
+async def drain_notifications(timeout: float = 10) -> None:
+    """Give background sends a chance to finish on shutdown."""
+    if _background:
+        await asyncio.wait(list(_background), timeout=timeout)
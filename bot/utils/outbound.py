@@ -0,0 +1,264 @@
+"""Rate-limited outbound queue for Telegram sends.
+
+Installed as a bot session middleware, so every send_message/send_photo/
+edit call in the code goes through it without changes at the call site:
+the call is queued and the caller awaits a future resolved with the
+resulting Message. Workers take the highest-priority job, wait for a token
+from the chat's bucket and the global one, and send. On TelegramRetryAfter
+the chat is paused for the time Telegram asks and the job is queued again.
+
+A chat has at most one job in the queue: its later sends wait in a FIFO
+behind it, so a message and its follow-up (e.g. a user's text and photo
+reposted to the admin chat) can't overtake each other on parallel workers,
+even when the caller didn't await the first one.
+
+User-facing traffic goes first (across chats; within a chat, order wins).
+Background senders (reminders) lower their priority with
+``outbound_priority.set(LOW)`` at the top of their task.
+"""
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from collections import deque
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+from bot.config import settings
+from bot.utils.cache import LRUCache, caches
+
+logger = logging.getLogger(__name__)
+
+HIGH = 0
+LOW = 1
+
+outbound_priority: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "outbound_priority", default=HIGH
+)
+
+# Methods that count against Telegram's flood limits
+_QUEUED_PREFIXES = ("Send", "Copy", "Forward", "EditMessage")
+
+# Give up on a job after this many RetryAfter answers
+_MAX_RETRIES = 5
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "stamp", "paused_until")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self) -> float:
+        """Seconds until a token is available (0 = now)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class _Job:
+    __slots__ = (
+        "bot", "method", "chat_id", "make_request", "future", "queued_at", "retries", "timer",
+    )
+
+    def __init__(self, bot, method, make_request, future) -> None:
+        self.bot = bot
+        self.method = method
+        self.chat_id = getattr(method, "chat_id", None)
+        self.make_request = make_request
+        self.future = future
+        self.queued_at = time.monotonic()
+        self.retries = 0
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class OutboundQueue(BaseRequestMiddleware):
+    def __init__(
+        self, workers: int, global_rate: float, private_rate: float, group_rate: float
+    ) -> None:
+        self.name = "outbound"
+        self.workers = workers
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self._global = TokenBucket(global_rate, global_rate)
+        # Idle buckets refill anyway, so forgetting one is harmless
+        self._buckets = LRUCache("outbound:buckets", 10000)
+        self._queue: asyncio.PriorityQueue | None = None
+        self._seq = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+        # Every job whose caller is still waiting: queued, sleeping or being sent
+        self._jobs: set[_Job] = set()
+        # Chat -> (priority, job) waiting for the chat's current job to finish;
+        # a chat is a key here while it has a job queued or in flight
+        self._chats: dict[int | str, deque[tuple[int, _Job]]] = {}
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        caches[self.name] = self
+
+    def start(self) -> None:
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(
+            "Outbound queue started (%d workers, %g msg/s)", self.workers, self._global.rate
+        )
+
+    async def close(self) -> None:
+        """Stop the workers and fail whatever is still pending, so no caller
+        waits for a send that will never happen."""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._queue = None
+        for job in self._jobs:
+            if job.timer is not None:
+                job.timer.cancel()
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Outbound queue closed"))
+        if self._jobs:
+            logger.warning("Outbound queue closed with %d unsent messages", len(self._jobs))
+        self._jobs.clear()
+        self._chats.clear()
+
+    async def __call__(self, make_request, bot: Bot, method: TelegramMethod):
+        if self._queue is None or not type(method).__name__.startswith(_QUEUED_PREFIXES):
+            return await make_request(bot, method)
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(bot, method, make_request, future)
+        self._jobs.add(job)
+        priority = outbound_priority.get()
+        if job.chat_id is None:
+            self._put(priority, job)
+        elif job.chat_id in self._chats:
+            self._chats[job.chat_id].append((priority, job))
+        else:
+            self._chats[job.chat_id] = deque()
+            self._put(priority, job)
+        return await future
+
+    def _put(self, priority: int, job: _Job) -> None:
+        job.timer = None
+        if self._queue is None:  # closed meanwhile; close() failed the job
+            return
+        self._queue.put_nowait((priority, next(self._seq), job))
+
+    def _put_later(self, delay: float, priority: int, job: _Job) -> None:
+        job.timer = asyncio.get_running_loop().call_later(delay, self._put, priority, job)
+
+    def _bucket(self, chat_id) -> TokenBucket | None:
+        if chat_id is None:
+            return None
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # Negative ids are groups and channels: ~20 messages a minute
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = TokenBucket(self.group_rate / 60, self.group_rate)
+            else:
+                bucket = TokenBucket(self.private_rate, 1)
+            self._buckets.put(chat_id, bucket)
+        return bucket
+
+    async def _worker(self) -> None:
+        while True:
+            priority, _, job = await self._queue.get()
+            if job.future.done():  # caller went away
+                self._release(job)
+                continue
+            bucket = self._bucket(job.chat_id)
+            wait = bucket.delay() if bucket is not None else 0
+            if wait > 0:
+                # Come back when the chat has a token instead of blocking the worker
+                self._put_later(wait, priority, job)
+                continue
+            while (wait := self._global.delay()) > 0:
+                await asyncio.sleep(wait)
+            self._global.take()
+            if bucket is not None:
+                bucket.take()
+            try:
+                result = await job.make_request(job.bot, job.method)
+            except TelegramRetryAfter as e:
+                self.retried += 1
+                job.retries += 1
+                if job.retries > _MAX_RETRIES:
+                    self._finish(job, exception=e)
+                    continue
+                logger.warning("Flood control: retry in %ss", e.retry_after)
+                (bucket or self._global).pause(e.retry_after)
+                self._put(priority, job)
+            except Exception as e:
+                self._finish(job, exception=e)
+            else:
+                self._finish(job, result=result)
+
+    def _release(self, job: _Job) -> None:
+        """Forget ``job`` and queue the next send to its chat."""
+        self._jobs.discard(job)
+        waiting = self._chats.get(job.chat_id)
+        if waiting is None:
+            return
+        while waiting:
+            priority, following = waiting.popleft()
+            if not following.future.done():
+                self._put(priority, following)
+                return
+            self._jobs.discard(following)
+        del self._chats[job.chat_id]
+
+    def _finish(self, job: _Job, result=None, exception: Exception | None = None) -> None:
+        self._release(job)
+        latency = time.monotonic() - job.queued_at
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        if exception is not None:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(exception)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def __len__(self) -> int:
+        if self._queue is None:
+            return 0
+        return self._queue.qsize() + sum(len(waiting) for waiting in self._chats.values())
+
+    def describe(self) -> str:
+        done = self.sent + self.failed
+        avg = f"{self.latency_total / done * 1000:.0f} ms" if done else "—"
+        return (
+            f"{self.name}: queued {len(self)}, sent {self.sent}, failed {self.failed}, "
+            f"retry_after {self.retried}, latency avg {avg}, "
+            f"max {self.latency_max * 1000:.0f} ms"
+        )
+
+
+# Cluster workers share the bot's limits; any of them may write to the admin
+# chat, while a private chat is mostly served by one worker
+_share = settings.CLUSTER_WORKERS if settings.BOT_MODE == "worker" else 1
+
+outbound = OutboundQueue(
+    workers=settings.OUTBOUND_WORKERS,
+    global_rate=settings.OUTBOUND_GLOBAL_RATE / _share,
+    private_rate=settings.OUTBOUND_PRIVATE_RATE,
+    group_rate=settings.OUTBOUND_GROUP_RATE / _share,
+)
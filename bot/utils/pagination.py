@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import Select, tuple_
+
+# A format_ticket_status() block is at most ~260 characters (80-char
+# description preview plus labels), so 10 of them with separators stay well
+# under Telegram's 4096-character message limit.
+PAGE_SIZE = 10
+
+OLDER = "o"
+NEWER = "n"
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass(frozen=True)
+class Cursor:
+    created_at: datetime
+    id: int
+
+    def encode(self) -> str:
+        micros = (self.created_at - _EPOCH) // timedelta(microseconds=1)
+        return f"{micros}.{self.id}"
+
+    @classmethod
+    def decode(cls, raw: str) -> "Cursor | None":
+        try:
+            micros, ticket_id = raw.split(".")
+            return cls(_EPOCH + timedelta(microseconds=int(micros)), int(ticket_id))
+        except ValueError:
+            return None
+
+    @classmethod
+    def of(cls, row) -> "Cursor":
+        return cls(row.created_at, row.id)
+
+
+@dataclass
+class Page:
+    items: list
+    newer: Cursor | None
+    older: Cursor | None
+
+
+def keyset(stmt: Select, columns, cursor: Cursor | None, direction: str, limit: int) -> Select:
+    """Restrict ``stmt`` to ``limit`` rows past ``cursor`` on (created_at, id).
+
+    ``columns`` is the (created_at, id) pair of whatever is being selected.
+    OLDER walks newest-first; NEWER walks oldest-first and the caller flips it.
+    """
+    created_at, id_ = columns
+    key = tuple_(created_at, id_)
+    if direction == OLDER:
+        if cursor is not None:
+            stmt = stmt.where(key < tuple_(cursor.created_at, cursor.id))
+        return stmt.order_by(created_at.desc(), id_.desc()).limit(limit)
+    if cursor is not None:
+        stmt = stmt.where(key > tuple_(cursor.created_at, cursor.id))
+    return stmt.order_by(created_at.asc(), id_.asc()).limit(limit)
+
+
+def make_page(rows: list, cursor: Cursor | None, direction: str, page_size: int) -> Page:
+    """Build a page from ``page_size + 1`` rows fetched by ``keyset()``."""
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == NEWER:
+        rows.reverse()
+        has_newer, has_older = has_more, cursor is not None
+    else:
+        has_newer, has_older = cursor is not None, has_more
+    if not rows:
+        return Page(rows, None, None)
+    return Page(
+        rows,
+        newer=Cursor.of(rows[0]) if has_newer else None,
+        older=Cursor.of(rows[-1]) if has_older else None,
+    )
@@ -1,94 +1,335 @@
+"""Reminders about tickets stuck in one status.
+
+An open ticket has at most one pending reminder: its age in the current
+status (created_at for new tickets, updated_at for the others) plus the
+threshold of its next escalation level in SCHEDULE. Deadlines are kept in
+a min-heap, loaded at startup and updated from committed ticket changes
+(the same write-through hooks as the open ticket index), so the loop
+sleeps until the earliest deadline instead of scanning the tickets table.
+
+Before a reminder is sent it is claimed in the DB (reminder_level + 1,
+last_reminded_at), so each one fires once, across restarts too. A status
+transition resets the level.
+
+Reminders that come due together (typically after downtime) are grouped
+by recipient: for the types in REMINDER_DIGEST a recipient with several
+gets one digest, split into messages of at most 4096 characters, with a
+button per ticket.
+"""
 import asyncio
+import heapq
 import logging
 from datetime import datetime, timedelta
 
 from aiogram import Bot
-from sqlalchemy import select
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
 
 from bot.config import settings
-from bot.db.database import async_session
+from bot.db.database import async_session, engine
 from bot.db.models import Ticket
-from bot.keyboards.inline import take_ticket_keyboard
-from bot.utils.ticket import format_ticket_status
+from bot.db.repository import TicketRepository
+from bot.keyboards.inline import take_ticket_keyboard, ticket_buttons_keyboard
+from bot.utils.broadcast import subscribe
+from bot.utils.outbound import LOW, outbound_priority
+from bot.utils.render import format_ticket_status
+from bot.utils.ticket import get_category_label
 
 logger = logging.getLogger(__name__)
 
-CHECK_INTERVAL = 5 * 60  # 5 minutes
+# Thresholds of successive reminders, by status
+SCHEDULE = {
+    "new": (timedelta(minutes=30),),
+    "on_hold": (timedelta(hours=24),),
+    "in_progress": (timedelta(hours=48),),
+}
 
-NEW_THRESHOLD = timedelta(minutes=30)
-ON_HOLD_THRESHOLD = timedelta(hours=24)
-IN_PROGRESS_THRESHOLD = timedelta(hours=48)
+# Rebuild the heap once stale entries outnumber live ones by this much
+_COMPACT_SLACK = 1024
 
+# With digests on, wait this long after a deadline for others to come due
+DIGEST_WINDOW = 5
 
-async def check_reminders(bot: Bot) -> None:
-    now = datetime.utcnow()
+MESSAGE_LIMIT = 4096
+# Tickets per digest message, so its keyboard stays small
+DIGEST_CHUNK = 40
+
+
+def reminder_deadline(
+    status: str, created_at: datetime, updated_at: datetime, level: int
+) -> datetime | None:
+    """When reminder ``level`` is due, or None if there is none."""
+    thresholds = SCHEDULE.get(status, ())
+    if level >= len(thresholds):
+        return None
+    return (created_at if status == "new" else updated_at) + thresholds[level]
+
+
+class ReminderScheduler:
+    def __init__(self) -> None:
+        # (deadline, ticket_id); entries that no longer match _due are stale
+        self._heap: list[tuple[datetime, int]] = []
+        self._due: dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
 
-    async with async_session() as session:
-        # new > 30 min — re-notify admin chat
-        result = await session.execute(
-            select(Ticket).where(
-                Ticket.status == "new",
-                Ticket.created_at < now - NEW_THRESHOLD,
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def schedule(self, ticket_id: int, when: datetime | None) -> None:
+        if when is None:
+            self._due.pop(ticket_id, None)
+            return
+        if self._due.get(ticket_id) == when:
+            return
+        self._due[ticket_id] = when
+        heapq.heappush(self._heap, (when, ticket_id))
+        if len(self._heap) > 2 * len(self._due) + _COMPACT_SLACK:
+            self._heap = [(due, ticket_id) for ticket_id, due in self._due.items()]
+            heapq.heapify(self._heap)
+        if self._heap[0] == (when, ticket_id):
+            self._wakeup.set()
+
+    async def load(self) -> None:
+        async with engine.connect() as conn:
+            rows = await conn.execute(
+                select(
+                    Ticket.id, Ticket.status, Ticket.created_at, Ticket.updated_at,
+                    Ticket.reminder_level,
+                ).where(Ticket.status.in_(SCHEDULE))
             )
-        )
-        new_tickets = result.scalars().all()
+            for row in rows:
+                when = reminder_deadline(
+                    row.status, row.created_at, row.updated_at, row.reminder_level
+                )
+                if when is not None:
+                    self._due[row.id] = when
+        self._heap = [(when, ticket_id) for ticket_id, when in self._due.items()]
+        heapq.heapify(self._heap)
+        logger.info("Reminder schedule loaded: %d pending", len(self))
+
+    async def reload(self, ticket_id: int) -> None:
+        """Re-read one ticket's deadline, e.g. after another worker changed it."""
+        async with engine.connect() as conn:
+            row = (await conn.execute(
+                select(
+                    Ticket.status, Ticket.created_at, Ticket.updated_at, Ticket.reminder_level,
+                ).where(Ticket.id == ticket_id)
+            )).first()
+        self.schedule(ticket_id, reminder_deadline(
+            row.status, row.created_at, row.updated_at, row.reminder_level
+        ) if row is not None else None)
 
-        for ticket in new_tickets:
+    def _next_wait(self) -> float | None:
+        """Seconds until the earliest deadline (<= 0 if due), None if none."""
+        while self._heap:
+            when, ticket_id = self._heap[0]
+            if self._due.get(ticket_id) == when:
+                return (when - datetime.utcnow()).total_seconds()
+            heapq.heappop(self._heap)
+        return None
+
+    def _pop_due(self) -> list[int]:
+        now = datetime.utcnow()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            when, ticket_id = heapq.heappop(self._heap)
+            if self._due.get(ticket_id) == when:
+                del self._due[ticket_id]
+                due.append(ticket_id)
+        return due
+
+    async def run(self, bot: Bot) -> None:
+        while True:
+            self._wakeup.clear()
+            wait = self._next_wait()
+            if wait is None or wait > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if settings.REMINDER_DIGEST:
+                await asyncio.sleep(DIGEST_WINDOW)
             try:
-                await bot.send_message(
-                    settings.ADMIN_CHAT_ID,
-                    f"⏰ Напоминание: заявка {ticket.ticket_number} ожидает назначения "
-                    f"более 30 минут!\n\n{format_ticket_status(ticket)}",
-                    reply_markup=take_ticket_keyboard(ticket.id),
-                )
+                await self._fire(bot, self._pop_due())
             except Exception:
-                logger.warning("Failed to send reminder for new ticket %s", ticket.ticket_number)
+                logger.exception("Error sending reminders")
+
+    async def _fire(self, bot: Bot, ticket_ids: list[int]) -> None:
+        claimed = []
+        async with async_session() as session:
+            repo = TicketRepository(session)
+            for ticket_id in ticket_ids:
+                ticket = await repo.get_by_id(ticket_id)
+                if ticket is None:
+                    continue
+                level = ticket.reminder_level
+                when = reminder_deadline(
+                    ticket.status, ticket.created_at, ticket.updated_at, level
+                )
+                if when is None or when > datetime.utcnow():
+                    # Changed in a way the hooks did not see (e.g. another process)
+                    self.schedule(ticket_id, when)
+                    continue
+                if await repo.claim_reminder(ticket_id, ticket.status, level):
+                    claimed.append(ticket)
+                    self.schedule(ticket_id, reminder_deadline(
+                        ticket.status, ticket.created_at, ticket.updated_at, level + 1
+                    ))
+            await session.commit()
+
+        by_recipient: dict[tuple[str, int], list[Ticket]] = {}
+        for ticket in claimed:
+            recipient = reminder_recipient(ticket)
+            if recipient is not None:
+                by_recipient.setdefault((ticket.status, recipient), []).append(ticket)
+        for (status, recipient), tickets in by_recipient.items():
+            if len(tickets) > 1 and status in settings.REMINDER_DIGEST:
+                await send_digest(bot, status, recipient, tickets)
+            else:
+                for ticket in tickets:
+                    await send_reminder(bot, ticket)
+
+
+def reminder_recipient(ticket: Ticket) -> int | None:
+    if ticket.status == "new":
+        return settings.ADMIN_CHAT_ID
+    if ticket.status == "on_hold":
+        return ticket.user_id
+    return ticket.admin_id
+
 
-        # on_hold > 24h — remind user
-        result = await session.execute(
-            select(Ticket).where(
-                Ticket.status == "on_hold",
-                Ticket.updated_at < now - ON_HOLD_THRESHOLD,
+async def send_reminder(bot: Bot, ticket: Ticket) -> None:
+    if ticket.status == "new":
+        try:
+            await bot.send_message(
+                settings.ADMIN_CHAT_ID,
+                f"⏰ Напоминание: заявка {ticket.ticket_number} ожидает назначения "
+                f"более 30 минут!\n\n{format_ticket_status(ticket)}",
+                reply_markup=take_ticket_keyboard(ticket.id),
             )
-        )
-        hold_tickets = result.scalars().all()
+        except Exception:
+            logger.warning("Failed to send reminder for new ticket %s", ticket.ticket_number)
 
-        for ticket in hold_tickets:
-            try:
-                await bot.send_message(
-                    ticket.user_id,
-                    f"⏰ Напоминание: ваша заявка {ticket.ticket_number} находится в ожидании.\n"
-                    "Пожалуйста, предоставьте запрошенную информацию.",
-                )
-            except Exception:
-                logger.warning("Failed to send hold reminder for ticket %s", ticket.ticket_number)
+    elif ticket.status == "on_hold":
+        try:
+            await bot.send_message(
+                ticket.user_id,
+                f"⏰ Напоминание: ваша заявка {ticket.ticket_number} находится в ожидании.\n"
+                "Пожалуйста, предоставьте запрошенную информацию.",
+            )
+        except Exception:
+            logger.warning("Failed to send hold reminder for ticket %s", ticket.ticket_number)
 
-        # in_progress > 48h — remind admin
-        result = await session.execute(
-            select(Ticket).where(
-                Ticket.status == "in_progress",
-                Ticket.updated_at < now - IN_PROGRESS_THRESHOLD,
+    elif ticket.status == "in_progress" and ticket.admin_id:
+        try:
+            await bot.send_message(
+                ticket.admin_id,
+                f"⏰ Напоминание: заявка {ticket.ticket_number} в работе более 48 часов.\n\n"
+                f"{format_ticket_status(ticket)}",
             )
-        )
-        progress_tickets = result.scalars().all()
+        except Exception:
+            logger.warning("Failed to send progress reminder for ticket %s", ticket.ticket_number)
 
-        for ticket in progress_tickets:
-            if ticket.admin_id:
-                try:
-                    await bot.send_message(
-                        ticket.admin_id,
-                        f"⏰ Напоминание: заявка {ticket.ticket_number} в работе более 48 часов.\n\n"
-                        f"{format_ticket_status(ticket)}",
-                    )
-                except Exception:
-                    logger.warning("Failed to send progress reminder for ticket %s", ticket.ticket_number)
 
+# status -> (digest header, ticket button text, button callback prefix).
+# Admins open the ticket's card (with its usual buttons) as a new message,
+# so taking one ticket does not replace the digest's keyboard.
+_DIGESTS = {
+    "new": ("⏰ Напоминание: заявки ожидают назначения", "🎫 {number}", "open_ticket"),
+    "on_hold": (
+        "⏰ Напоминание: ваши заявки находятся в ожидании.\n"
+        "Пожалуйста, предоставьте запрошенную информацию.",
+        "✍️ {number}",
+        "reply_ticket",
+    ),
+    "in_progress": ("⏰ Напоминание: заявки в работе более 48 часов", "🎫 {number}",
+                    "open_ticket"),
+}
 
-async def reminder_loop(bot: Bot) -> None:
-    logger.info("Reminder loop started (interval: %ds)", CHECK_INTERVAL)
-    while True:
-        await asyncio.sleep(CHECK_INTERVAL)
+
+def _digest_line(ticket: Ticket, now: datetime) -> str:
+    since = ticket.created_at if ticket.status == "new" else ticket.updated_at
+    hours = int((now - since).total_seconds() // 3600)
+    age = f"{hours} ч" if hours else "< 1 ч"
+    return f"• {ticket.ticket_number} — {get_category_label(ticket.category)}, {age}"
+
+
+async def send_digest(bot: Bot, status: str, chat_id: int, tickets: list[Ticket]) -> None:
+    """One message per DIGEST_CHUNK tickets (and per MESSAGE_LIMIT characters)."""
+    header, button, action = _DIGESTS[status]
+    now = datetime.utcnow()
+    chunks: list[list[Ticket]] = [[]]
+    length = len(header) + 2
+    for ticket in tickets:
+        line_length = len(_digest_line(ticket, now)) + 1
+        if chunks[-1] and (
+            len(chunks[-1]) == DIGEST_CHUNK or length + line_length > MESSAGE_LIMIT
+        ):
+            chunks.append([])
+            length = len(header) + 2
+        chunks[-1].append(ticket)
+        length += line_length
+
+    for chunk in chunks:
+        lines = [f"{header} ({len(tickets)}):", ""]
+        lines.extend(_digest_line(ticket, now) for ticket in chunk)
         try:
-            await check_reminders(bot)
+            await bot.send_message(
+                chat_id,
+                "\n".join(lines),
+                reply_markup=ticket_buttons_keyboard([
+                    (button.format(number=t.ticket_number), f"{action}:{t.id}") for t in chunk
+                ]),
+            )
         except Exception:
-            logger.exception("Error in reminder check")
+            logger.warning(
+                "Failed to send %s reminder digest to %s (%d tickets)", status, chat_id, len(chunk)
+            )
+
+
+reminder_scheduler = ReminderScheduler()
+
+_PENDING_DEADLINES = "pending_reminder_deadlines"
+
+
+@subscribe("ticket")
+async def _reload_deadline(ticket_id: int) -> None:
+    await reminder_scheduler.reload(ticket_id)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_deadlines(session: Session, flush_context) -> None:
+    pending = session.info.setdefault(_PENDING_DEADLINES, {})
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Ticket):
+            # Only what is already loaded: no lazy loads inside a flush
+            values = inspect(obj).dict
+            try:
+                pending[obj.id] = reminder_deadline(
+                    values["status"], values["created_at"], values["updated_at"],
+                    values["reminder_level"],
+                )
+            except KeyError:
+                pass
+    for obj in session.deleted:
+        if isinstance(obj, Ticket):
+            pending[obj.id] = None
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_deadlines(session: Session) -> None:
+    for ticket_id, when in session.info.pop(_PENDING_DEADLINES, {}).items():
+        reminder_scheduler.schedule(ticket_id, when)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_deadlines(session: Session) -> None:
+    session.info.pop(_PENDING_DEADLINES, None)
+
+
+async def reminder_loop(bot: Bot) -> None:
+    logger.info("Reminder scheduler started (%d pending)", len(reminder_scheduler))
+    # Reminders wait behind replies to users in the outbound queue
+    outbound_priority.set(LOW)
+    await reminder_scheduler.run(bot)
@@ -0,0 +1,153 @@
+"""Ticket cards and message edits.
+
+Cards are rendered from fixed templates and cached by (ticket id,
+updated_at): any change to a ticket bumps updated_at, so a cached card is
+never stale. Edits go through edit_text()/edit_markup(), which skip the API
+call when the message already shows the same text and markup.
+
+User text (descriptions, names) is escaped: messages are sent as HTML.
+"""
+import html
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, Message
+from sqlalchemy import inspect
+
+from bot.utils.cache import LRUCache
+from bot.utils.ticket import STATUS_LABELS, get_category_label, get_priority_label
+
+_STATUS_CARD = (
+    "🎫 {number} — {status}\n"
+    "📁 {category}\n"
+    "⚡ {priority}\n"
+    "📝 {preview}\n"
+    "📅 {created_at:%d.%m.%Y %H:%M}"
+)
+
+_MANAGE_CARD = (
+    "⚙️ Управление заявкой {number}\n\n"
+    "📁 Категория: {category}\n"
+    "⚡ Приоритет: {priority}\n"
+    "📝 Описание: {preview}"
+)
+
+_TICKET_CARD = (
+    "🎫 Заявка {number}\n"
+    "📁 Категория: {category}\n"
+    "⚡ Приоритет: {priority}\n"
+    "👤 Пользователь: {user}\n"
+    "📝 Описание:\n{description}"
+)
+
+_status_cards = LRUCache("render:status", 2048)
+_manage_cards = LRUCache("render:manage", 1024)
+
+
+def _preview(text: str, limit: int) -> str:
+    return html.escape(f"{text[:limit]}..." if len(text) > limit else text)
+
+
+def _card_key(ticket) -> tuple | None:
+    """Cache key, or None while an ORM ticket has changes not yet flushed
+    (its updated_at still has the old value)."""
+    if hasattr(ticket, "_sa_instance_state") and inspect(ticket).modified:
+        return None
+    return ticket.id, ticket.updated_at
+
+
+def _cached(cache: LRUCache, ticket, render) -> str:
+    key = _card_key(ticket)
+    if key is None:
+        return render(ticket)
+    text = cache.get(key)
+    if text is None:
+        text = render(ticket)
+        cache.put(key, text)
+    return text
+
+
+def _render_status(ticket) -> str:
+    return _STATUS_CARD.format(
+        number=ticket.ticket_number,
+        status=STATUS_LABELS.get(ticket.status, ticket.status),
+        category=get_category_label(ticket.category),
+        priority=get_priority_label(ticket.priority),
+        preview=_preview(ticket.description, 80),
+        created_at=ticket.created_at,
+    )
+
+
+def _render_manage(ticket) -> str:
+    return _MANAGE_CARD.format(
+        number=ticket.ticket_number,
+        category=get_category_label(ticket.category),
+        priority=get_priority_label(ticket.priority),
+        preview=_preview(ticket.description, 100),
+    )
+
+
+def format_ticket_status(ticket) -> str:
+    """Short status block for lists, /status and reminders (Ticket or archive row)."""
+    return _cached(_status_cards, ticket, _render_status)
+
+
+def format_manage_card(ticket) -> str:
+    """Header of the admin "manage ticket" menu."""
+    return _cached(_manage_cards, ticket, _render_manage)
+
+
+def format_ticket(ticket_number: str, category: str, priority: str,
+                  description: str, username: str | None, full_name: str) -> str:
+    return _TICKET_CARD.format(
+        number=ticket_number,
+        category=get_category_label(category),
+        priority=get_priority_label(priority),
+        user=html.escape(f"@{username}" if username else full_name),
+        description=html.escape(description),
+    )
+
+
+# --- Edits ---
+
+# (chat_id, message_id) -> (text hash, markup hash) last shown by the message.
+# Every edit of a bot message must go through the helpers below, otherwise
+# an entry goes stale and a needed edit could be skipped.
+_shown = LRUCache("render:shown", 4096)
+
+
+def _markup_hash(markup: InlineKeyboardMarkup | None) -> int:
+    return hash(markup.model_dump_json(exclude_none=True)) if markup is not None else 0
+
+
+def _is_not_modified(error: TelegramBadRequest) -> bool:
+    return "message is not modified" in str(error)
+
+
+async def edit_text(
+    message: Message, text: str, reply_markup: InlineKeyboardMarkup | None = None
+) -> None:
+    key = (message.chat.id, message.message_id)
+    shown = (hash(text), _markup_hash(reply_markup))
+    if _shown.get(key) == shown:
+        return
+    try:
+        await message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if not _is_not_modified(e):
+            raise
+    _shown.put(key, shown)
+
+
+async def edit_markup(message: Message, reply_markup: InlineKeyboardMarkup | None) -> None:
+    key = (message.chat.id, message.message_id)
+    markup = _markup_hash(reply_markup)
+    shown = _shown.get(key)
+    if shown is not None and shown[1] == markup:
+        return
+    try:
+        await message.edit_reply_markup(reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if not _is_not_modified(e):
+            raise
+    # Text hash stays unknown (None) if the text was never sent through edit_text()
+    _shown.put(key, (shown[0] if shown is not None else None, markup))
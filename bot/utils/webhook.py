@@ -0,0 +1,64 @@
+"""HTTP endpoint for Telegram webhook updates.
+
+Used by the bot in webhook mode (and by cluster workers, which the
+supervisor feeds the same way) and by the cluster supervisor itself.
+"""
+import asyncio
+import logging
+import secrets
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+from aiohttp import web
+
+from bot.config import settings
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+async def serve_webhook(
+    bot: Bot,
+    handle: Callable[[dict], Awaitable[None]],
+    allowed_updates: list[str] | None = None,
+    setup: Callable[[web.Application], None] | None = None,
+) -> None:
+    """Serve WEBHOOK_PATH until cancelled, registering WEBHOOK_URL if set.
+
+    Each update's JSON goes to ``handle`` and the response waits for it, so
+    a slow ``handle`` holds Telegram back. ``setup`` can add startup and
+    shutdown hooks to the app before it starts.
+    """
+    async def receive(request: web.Request) -> web.Response:
+        if settings.WEBHOOK_SECRET and not secrets.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), settings.WEBHOOK_SECRET
+        ):
+            return web.Response(status=401)
+        await handle(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(settings.WEBHOOK_PATH, receive)
+    if setup is not None:
+        setup(app)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT).start()
+    logger.info(
+        "Webhook server listening on %s:%d%s",
+        settings.WEBHOOK_HOST, settings.WEBHOOK_PORT, settings.WEBHOOK_PATH,
+    )
+    try:
+        if settings.WEBHOOK_URL:
+            await bot.set_webhook(
+                settings.WEBHOOK_URL,
+                secret_token=settings.WEBHOOK_SECRET or None,
+                max_connections=min(settings.UPDATE_CONCURRENCY, 100),
+                allowed_updates=allowed_updates,
+            )
+            logger.info("Webhook registered: %s", settings.WEBHOOK_URL)
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,155 @@
+"""Time and allocations of the keyboard rendering path per update.
+
+    python scripts/bench_keyboards.py [updates]
+
+An update renders what a ticket's life does most: the main menu, a taken
+ticket card and its manage keyboard. Three ways of doing it:
+
+- builder: the original functions, an InlineKeyboardBuilder per call
+  (reproduced below, as they were before the keyboard registry);
+- templates, cold: the current per-ticket templates, memo bypassed;
+- templates, memoized: the current functions for tickets clicked again.
+
+Allocations are measured with tracemalloc while the rendered markups are
+kept alive, so "retained" is what one update allocates for its keyboards;
+"peak" also counts the temporaries freed before the update ended.
+"""
+import gc
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup  # noqa: E402
+from aiogram.utils.keyboard import InlineKeyboardBuilder  # noqa: E402
+
+from bot.keyboards import inline  # noqa: E402
+
+ADMIN = "@admin"
+# Tickets being worked on at once; the memoized run cycles over them
+TICKETS = 100
+
+
+def builder_main_menu() -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="📝 Создать заявку", callback_data="new_ticket"))
+    builder.row(InlineKeyboardButton(text="📋 Мои заявки", callback_data="my_tickets"))
+    return builder.as_markup()
+
+
+def builder_ticket_taken(admin_name: str, ticket_id: int) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text=f"👷 Заявку взял: {admin_name}", callback_data="noop"))
+    builder.row(
+        InlineKeyboardButton(text="✍️ Ответить", callback_data=f"admin_reply_ticket:{ticket_id}"),
+        InlineKeyboardButton(text="✅ Закрыть заявку", callback_data=f"close_ticket:{ticket_id}"),
+    )
+    builder.row(
+        InlineKeyboardButton(text="⏸ Ожидание", callback_data=f"hold_ticket:{ticket_id}"),
+        InlineKeyboardButton(
+            text="⚙️ Управление", callback_data=f"admin_manage_ticket:{ticket_id}"
+        ),
+    )
+    builder.row(InlineKeyboardButton(text="📋 Мои заявки", callback_data="admin_my_tickets"))
+    return builder.as_markup()
+
+
+def builder_admin_manage(ticket_id: int) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text="📁 Категория", callback_data=f"admin_edit_cat:{ticket_id}"),
+        InlineKeyboardButton(text="⚡ Приоритет", callback_data=f"admin_edit_pri:{ticket_id}"),
+    )
+    builder.row(
+        InlineKeyboardButton(text="✏️ Описание", callback_data=f"admin_edit_desc:{ticket_id}")
+    )
+    builder.row(
+        InlineKeyboardButton(
+            text="🧹 Очистить историю", callback_data=f"admin_clear_history:{ticket_id}"
+        ),
+        InlineKeyboardButton(
+            text="🗑 Удалить заявку", callback_data=f"admin_delete_ticket:{ticket_id}"
+        ),
+    )
+    builder.row(
+        InlineKeyboardButton(text="◀️ Назад", callback_data=f"admin_manage_back:{ticket_id}")
+    )
+    return builder.as_markup()
+
+
+def render_builder(i: int):
+    ticket_id = i % TICKETS
+    return (
+        builder_main_menu(),
+        builder_ticket_taken(ADMIN, ticket_id),
+        builder_admin_manage(ticket_id),
+    )
+
+
+def render_cold(i: int):
+    ticket_id = i % TICKETS
+    return (
+        inline.main_menu_keyboard(),
+        inline.ticket_taken_keyboard.__wrapped__(ADMIN, ticket_id),
+        inline.admin_manage_keyboard.__wrapped__(ticket_id),
+    )
+
+
+def render_memoized(i: int):
+    ticket_id = i % TICKETS
+    return (
+        inline.main_menu_keyboard(),
+        inline.ticket_taken_keyboard(ADMIN, ticket_id),
+        inline.admin_manage_keyboard(ticket_id),
+    )
+
+
+def check_same_output() -> None:
+    for i in range(3):
+        expected = [markup.model_dump() for markup in render_builder(i)]
+        for render in (render_cold, render_memoized):
+            assert [markup.model_dump() for markup in render(i)] == expected, render.__name__
+
+
+def measure(render, updates: int) -> tuple[float, float, float, float]:
+    """(µs, retained bytes, retained blocks, peak bytes) per update."""
+    for i in range(TICKETS):  # warm up, fills the memo
+        render(i)
+    micros = min(timeit.repeat(lambda: [render(i) for i in range(updates)], number=1, repeat=5))
+    micros = micros / updates * 1e6
+
+    kept = []
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    start, _ = tracemalloc.get_traced_memory()
+    for i in range(updates):
+        kept.append(render(i))
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    size = sum(stat.size_diff for stat in diff)
+    blocks = sum(stat.count_diff for stat in diff)
+    return micros, size / updates, blocks / updates, (peak - start) / updates
+
+
+def main() -> None:
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    check_same_output()
+    print(f"{updates} updates: main menu + taken card + manage keyboard\n")
+    print(f"{'':22}{'µs/update':>10}{'retained B':>12}{'blocks':>8}{'peak B':>10}")
+    for name, render in (
+        ("builder", render_builder),
+        ("templates, cold", render_cold),
+        ("templates, memoized", render_memoized),
+    ):
+        micros, size, blocks, peak = measure(render, updates)
+        print(f"{name:22}{micros:10.1f}{size:12.0f}{blocks:8.1f}{peak:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Run the cluster against a fake Bot API and check what every chat got.
+
+    python scripts/cluster_smoke.py [workers] [chats] [--webhook]
+
+The fake API serves one ticket creation per chat (/new, category, priority,
+description, confirm), all chats interleaved, through getUpdates or, with
+--webhook, by posting them to the webhook the supervisor registers. It
+records what the bot sends to each chat. The run passes when:
+
+- every chat went through the whole dialog in order and got its ticket,
+  which an update handled out of order would break (the FSM state would not
+  match);
+- each ticket reached the admin chat once;
+- exactly one worker became the leader and started the singleton jobs.
+
+Exits with 1 on failure, after printing the cluster's log.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from aiohttp import ClientSession, web
+
+ROOT = Path(__file__).resolve().parent.parent
+
+TOKEN = "42:smoke"
+ADMIN_CHAT_ID = -100
+SECRET = "smoke-secret"
+TIMEOUT = 120
+
+# What a chat must get from the bot, in order, for one ticket
+EXPECTED = [
+    ("sendMessage", "📁 Выберите категорию"),
+    ("editMessageText", "⚡ Выберите приоритет"),
+    ("editMessageText", "📝 Опишите"),
+    ("sendMessage", "🎫 Заявка"),
+    ("editMessageText", "✅ Заявка"),
+]
+SINGLETON_LOGS = (
+    "is now the leader (jobs)",
+    "Reminder scheduler started",
+    "WAL checkpoint loop started",
+    "Archive loop started",
+    "Stats reconcile loop started",
+)
+
+
+def free_port(count: int = 1) -> int:
+    """First of ``count`` consecutive ports free for both TCP and UDP."""
+    for base in range(20000, 60000, 97):
+        try:
+            for port in range(base, base + count):
+                for kind in (socket.SOCK_STREAM, socket.SOCK_DGRAM):
+                    with socket.socket(socket.AF_INET, kind) as sock:
+                        sock.bind(("127.0.0.1", port))
+        except OSError:
+            continue
+        return base
+    raise RuntimeError("no free ports")
+
+
+def dialog(chat_id: int) -> list[dict]:
+    """The updates of one ticket creation, without update ids."""
+    user = {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"}
+    chat = {"id": chat_id, "type": "private"}
+    # The bot message the buttons are on; the fake API doesn't track message ids
+    shown = {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "…"}
+
+    def message(text: str, **extra) -> dict:
+        return {"message": {
+            "message_id": 1, "date": int(time.time()), "chat": chat, "from": user,
+            "text": text, **extra,
+        }}
+
+    def callback(data: str) -> dict:
+        return {"callback_query": {
+            "id": f"{chat_id}:{data}", "from": user, "chat_instance": str(chat_id),
+            "message": shown, "data": data,
+        }}
+
+    return [
+        message("/new", entities=[{"type": "bot_command", "offset": 0, "length": 4}]),
+        callback("cat:network"),
+        callback("pri:low"),
+        message(f"smoke ticket from chat {chat_id}"),
+        callback("confirm_ticket"),
+    ]
+
+
+class FakeBotAPI:
+    def __init__(self, chats: int, webhook: bool) -> None:
+        self.webhook = webhook
+        steps = [dialog(chat_id) for chat_id in range(1, chats + 1)]
+        # Step by step across the chats, so each chat's updates are interleaved
+        self.updates = [update for step in zip(*steps) for update in step]
+        for update_id, update in enumerate(self.updates, 1):
+            update["update_id"] = update_id
+        self.sent: dict[int, list[tuple[str, str]]] = defaultdict(list)
+        self.message_id = 1000
+        self.delivery: asyncio.Task | None = None
+
+    def done(self, chats: int) -> bool:
+        return len(self.sent[ADMIN_CHAT_ID]) >= chats
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        if method == "getUpdates":
+            offset = int(data.get("offset") or request.query.get("offset") or 0)
+            pending = [u for u in self.updates if u["update_id"] >= offset]
+            if not pending:
+                await asyncio.sleep(1)
+            return self.ok(pending)
+        if method == "getMe":
+            return self.ok({"id": 42, "is_bot": True, "first_name": "Smoke", "username": "smoke"})
+        if method == "setWebhook" and self.webhook:
+            self.delivery = asyncio.create_task(self.deliver(data["url"]))
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(data["chat_id"])
+            self.sent[chat_id].append((method, data["text"]))
+            if method == "sendMessage":
+                self.message_id += 1
+                return self.ok({
+                    "message_id": self.message_id, "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"}, "text": data["text"],
+                })
+        return self.ok(True)
+
+    @staticmethod
+    def ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    async def deliver(self, url: str) -> None:
+        # One at a time, like Telegram does for a chat
+        async with ClientSession() as http:
+            for update in self.updates:
+                while True:
+                    async with http.post(
+                        url, json=update,
+                        headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+                    ) as response:
+                        if response.status == 200:
+                            break
+                    await asyncio.sleep(1)
+
+
+def check(api: FakeBotAPI, chats: int, log: list[str]) -> list[str]:
+    errors = []
+    for chat_id in range(1, chats + 1):
+        got = api.sent[chat_id]
+        if len(got) != len(EXPECTED) or not all(
+            method == want_method and text.startswith(want_text)
+            for (method, text), (want_method, want_text) in zip(got, EXPECTED)
+        ):
+            errors.append(f"chat {chat_id} got {[(m, t[:25]) for m, t in got]}")
+    tickets = [text for _, text in api.sent[ADMIN_CHAT_ID]]
+    for chat_id in range(1, chats + 1):
+        count = sum(f"smoke ticket from chat {chat_id}\n" in f"{t}\n" for t in tickets)
+        if count != 1:
+            errors.append(f"ticket of chat {chat_id} reached the admin chat {count} times")
+    for line in SINGLETON_LOGS:
+        count = sum(line in entry for entry in log)
+        if count != 1:
+            errors.append(f"{line!r} logged {count} times, expected once")
+    return errors
+
+
+async def run(workers: int, chats: int, webhook: bool) -> int:
+    api = FakeBotAPI(chats, webhook)
+    app = web.Application()
+    app.router.add_route("*", "/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    api_port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+
+    data = tempfile.mkdtemp(prefix="cluster-smoke-")
+    # The workers' ports, then the supervisor's webhook
+    base_port = free_port(workers + 1)
+    webhook_port = base_port + workers
+    env = {
+        **os.environ,
+        "BOT_TOKEN": TOKEN,
+        "ADMIN_CHAT_ID": str(ADMIN_CHAT_ID),
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{api_port}",
+        "DATABASE_URL": f"sqlite+aiosqlite:///{data}/bot.db",
+        "ARCHIVE_DB_PATH": f"{data}/archive.db",
+        "CLUSTER_WORKERS": str(workers),
+        "CLUSTER_BASE_PORT": str(base_port),
+        "BOT_MODE": "webhook" if webhook else "polling",
+        "WEBHOOK_HOST": "127.0.0.1",
+        "WEBHOOK_PORT": str(webhook_port),
+        "WEBHOOK_URL": f"http://127.0.0.1:{webhook_port}/webhook" if webhook else "",
+        "WEBHOOK_SECRET": SECRET,
+        "LOG_LEVEL": "INFO",
+    }
+    cluster = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "bot.cluster", cwd=ROOT, env=env,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+        start_new_session=True,
+    )
+    log: list[str] = []
+
+    async def read_log() -> None:
+        async for line in cluster.stdout:
+            log.append(line.decode(errors="replace").rstrip())
+
+    reader = asyncio.create_task(read_log())
+    started = time.monotonic()
+    while not api.done(chats) and time.monotonic() - started < TIMEOUT:
+        if cluster.returncode is not None:
+            break
+        await asyncio.sleep(0.5)
+    elapsed = time.monotonic() - started
+
+    cluster.send_signal(signal.SIGINT)
+    try:
+        await asyncio.wait_for(cluster.wait(), 15)
+    except asyncio.TimeoutError:
+        os.killpg(cluster.pid, signal.SIGKILL)
+        await cluster.wait()
+    await reader
+    if api.delivery is not None:
+        api.delivery.cancel()
+    await runner.cleanup()
+
+    errors = check(api, chats, log)
+    mode = "webhook" if webhook else "polling"
+    if errors:
+        print("\n".join(log))
+        print(f"\nFAILED ({workers} workers, {chats} chats, {mode}):")
+        print("\n".join(f"- {error}" for error in errors))
+        return 1
+    print(f"OK: {workers} workers, {chats} chats, {mode}, {elapsed:.1f}s (with startup)")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("workers", type=int, nargs="?", default=3)
+    parser.add_argument("chats", type=int, nargs="?", default=20)
+    parser.add_argument("--webhook", action="store_true", help="deliver updates by webhook")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.workers, args.chats, args.webhook)))
+
+
+if __name__ == "__main__":
+    main()
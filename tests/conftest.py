@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# bot.config reads the environment at import time, so point the bot at a
+# throwaway database before any test module imports it
+_data_dir = tempfile.mkdtemp(prefix="bot-tests-")
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_data_dir}/bot.db"
+os.environ["ARCHIVE_DB_PATH"] = f"{_data_dir}/archive.db"
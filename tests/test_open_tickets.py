@@ -0,0 +1,162 @@
+"""The open ticket index against the tickets table.
+
+Each test drives tickets through the repository's write paths, the way the
+handlers do, and then runs the index's consistency check (OpenTicketStore.
+diff(), the same one OPEN_TICKETS_CHECK_INTERVAL runs), which must find
+nothing.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete
+
+from bot.db.archive import archive_batch
+from bot.db.database import async_session, engine, init_db
+from bot.db.models import (
+    Counter,
+    Ticket,
+    TicketMessage,
+    User,
+    archived_ticket_messages,
+    archived_tickets,
+)
+from bot.db.open_tickets import open_tickets, warm_open_tickets
+from bot.db.repository import TicketRepository
+
+USER_ID = 1
+ADMIN_ID = 10
+
+
+async def _wipe() -> None:
+    # The query plan tests seed their own tickets by id into the same database
+    async with engine.begin() as conn:
+        for table in (
+            archived_ticket_messages, archived_tickets, TicketMessage, Ticket, Counter, User,
+        ):
+            await conn.execute(delete(table))
+    await warm_open_tickets()
+
+
+@pytest.fixture(scope="module")
+def run():
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(init_db())
+    loop.run_until_complete(warm_open_tickets())
+    yield loop.run_until_complete
+    loop.run_until_complete(_wipe())
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+
+
+async def _create() -> int:
+    async with async_session() as session:
+        ticket = await TicketRepository(session).create(
+            user_id=USER_ID, category="network", priority="low", description="…"
+        )
+        await session.commit()
+        return ticket.id
+
+
+async def _write(ticket_id: int, change, commit: bool = True):
+    """Load the ticket in a new session, apply ``change(repo, ticket)``, commit."""
+    async with async_session() as session:
+        repo = TicketRepository(session)
+        result = await change(repo, await repo.get_by_id(ticket_id))
+        if commit:
+            await session.commit()
+        else:
+            await session.rollback()
+        return result
+
+
+async def _take(repo, ticket):
+    return await repo.take(ticket, ADMIN_ID)
+
+
+async def _hold(repo, ticket):
+    repo.transition(ticket, "on_hold")
+
+
+async def _resume(repo, ticket):
+    repo.transition(ticket, "in_progress")
+
+
+async def _close(repo, ticket):
+    repo.transition(ticket, "closed")
+
+
+def assert_in_sync(run) -> None:
+    async def diff() -> list[str]:
+        async with engine.connect() as conn:
+            return await open_tickets.diff(conn)
+
+    assert run(diff()) == []
+
+
+def test_lifecycle(run):
+    ticket_id = run(_create())
+    assert open_tickets.get(ticket_id).status == "new"
+    assert_in_sync(run)
+
+    async def post_card(repo, ticket):
+        ticket.message_id = 5000 + ticket.id
+
+    run(_write(ticket_id, post_card))
+    assert open_tickets.get_by_message(5000 + ticket_id).id == ticket_id
+    assert_in_sync(run)
+
+    assert run(_write(ticket_id, _take))
+    record = open_tickets.get(ticket_id)
+    assert (record.status, record.admin_id) == ("in_progress", ADMIN_ID)
+    assert_in_sync(run)
+
+    for change, status in ((_hold, "on_hold"), (_resume, "in_progress")):
+        run(_write(ticket_id, change))
+        assert open_tickets.get(ticket_id).status == status
+        assert_in_sync(run)
+
+    run(_write(ticket_id, _close))
+    assert open_tickets.get(ticket_id) is None
+    assert open_tickets.get_by_message(5000 + ticket_id) is None
+    assert_in_sync(run)
+
+
+def test_take_twice(run):
+    ticket_id = run(_create())
+    assert run(_write(ticket_id, _take))
+    # A second admin's click, e.g. on a card that still shows the ticket as new
+    assert not run(_write(ticket_id, lambda repo, ticket: repo.take(ticket, ADMIN_ID + 1)))
+    assert open_tickets.get(ticket_id).admin_id == ADMIN_ID
+    assert_in_sync(run)
+
+
+def test_rolled_back_take(run):
+    ticket_id = run(_create())
+    assert run(_write(ticket_id, _take, commit=False))
+    assert open_tickets.get(ticket_id).status == "new"
+    assert_in_sync(run)
+
+
+def test_delete(run):
+    ticket_id = run(_create())
+
+    async def remove(repo, ticket):
+        await repo.delete(ticket)
+
+    run(_write(ticket_id, remove))
+    assert open_tickets.get(ticket_id) is None
+    assert_in_sync(run)
+
+
+def test_archive(run):
+    ticket_ids = [run(_create()) for _ in range(3)]
+    for ticket_id in ticket_ids[:2]:
+        run(_write(ticket_id, _take))
+        run(_write(ticket_id, _close))
+    assert_in_sync(run)
+
+    moved = run(archive_batch(datetime.utcnow() + timedelta(days=1), 100))
+    assert moved >= 2
+    assert open_tickets.get(ticket_ids[2]) is not None
+    assert_in_sync(run)
@@ -0,0 +1,298 @@
+"""EXPLAIN QUERY PLAN regression tests for the hot queries.
+
+The database is seeded with 20k tickets, mostly closed, spread over users
+and admins the way a long-running bot accumulates them, plus 5k older ones
+in the archive. Each test makes a call (repository, archive, search, the
+in-memory indexes' loaders, prompts), captures the SQL it sends and checks
+the plan of every statement: an index SEARCH, never a full SCAN of a table
+or a temp B-tree for ORDER BY.
+"""
+import asyncio
+import random
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, insert, select
+
+from bot.db.database import async_session, engine, init_db
+from bot.db.models import (
+    Ticket,
+    TicketMessage,
+    User,
+    archived_ticket_messages,
+    archived_tickets,
+)
+from bot.db.open_tickets import OpenTicketStore
+from bot.db.prompts import REPLY, PromptRegistry
+from bot.db.repository import TicketRepository
+from bot.db.stats import read_stats, reconcile_stats
+from bot.utils.reminders import ReminderScheduler
+from bot.utils.pagination import NEWER, OLDER, Cursor
+
+TICKETS = 20_000
+ARCHIVED = 5_000
+USERS = 2_000
+ADMINS = (10, 11, 12)
+MESSAGES_PER_TICKET = 3
+
+_START = datetime(2024, 1, 1)
+_MIDDLE = Cursor(_START + timedelta(minutes=TICKETS // 2), TICKETS // 2)
+
+# The newest open tickets have no key to search on: the plan walks the
+# partial open-ticket index in order and stops after LIMIT rows
+_ORDERED_WALKS = {"SCAN tickets USING INDEX ix_tickets_open_created"}
+
+
+async def _seed() -> None:
+    await init_db()
+    rng = random.Random(42)
+    tickets, messages = [], []
+    # Archived tickets are the oldest ones, all closed
+    for ticket_id in range(-ARCHIVED + 1, TICKETS + 1):
+        if ticket_id > 0:
+            status = rng.choices(["new", "in_progress", "on_hold", "closed"], [2, 3, 1, 20])[0]
+            description = rng.choice(["принтер не печатает", "нет сети", "…"])
+        else:
+            status = "closed"
+            description = rng.choice(["принтер не печатает", "закончился картридж"])
+        created_at = _START + timedelta(minutes=ticket_id)
+        tickets.append({
+            "id": ticket_id,
+            "ticket_number": f"#{ticket_id:05d}",
+            "user_id": rng.randint(1, USERS),
+            "admin_id": None if status == "new" else rng.choice(ADMINS),
+            "category": rng.choice(["hardware", "software", "network", "access"]),
+            "priority": rng.choice(["low", "medium", "high", "critical"]),
+            "status": status,
+            "description": description,
+            "created_at": created_at,
+            "updated_at": created_at + timedelta(hours=1),
+            "closed_at": created_at + timedelta(days=1) if status == "closed" else None,
+            "message_id": ticket_id * 2,
+        })
+        messages += [
+            {
+                "ticket_id": ticket_id, "sender_id": 1, "sender_role": "user", "text": "…",
+                "created_at": created_at,
+            }
+            for _ in range(MESSAGES_PER_TICKET)
+        ]
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [
+            {"id": user_id, "full_name": f"User {user_id}"} for user_id in range(1, USERS + 1)
+        ])
+        hot = [ticket for ticket in tickets if ticket["id"] > 0]
+        await conn.execute(insert(Ticket), hot)
+        await conn.execute(insert(TicketMessage), [
+            message for message in messages if message["ticket_id"] > 0
+        ])
+        await conn.execute(insert(archived_tickets), [
+            {**ticket, "id": ticket["id"] + 2 * TICKETS} for ticket in tickets if ticket["id"] <= 0
+        ])
+        await conn.execute(insert(archived_ticket_messages), [
+            {**message, "id": index, "ticket_id": message["ticket_id"] + 2 * TICKETS}
+            for index, message in enumerate(messages)
+            if message["ticket_id"] <= 0
+        ])
+
+
+@pytest.fixture(scope="module")
+def run():
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(_seed())
+    yield loop.run_until_complete
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+
+
+def query_plans(run, call) -> list[tuple[str, list[str]]]:
+    """Run ``call(repo)`` (rolled back) and return (statement, plan details) pairs."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        # One parameter set is enough to plan a bulk statement
+        statements.append((statement, parameters[0] if executemany else parameters))
+
+    async def execute() -> None:
+        async with async_session() as session:
+            await call(TicketRepository(session))
+            await session.rollback()
+
+    async def explain() -> list[tuple[str, list[str]]]:
+        async with engine.connect() as conn:
+            return [
+                (statement, [
+                    row[3] for row in await conn.exec_driver_sql(
+                        f"EXPLAIN QUERY PLAN {statement}", parameters
+                    )
+                ])
+                for statement, parameters in statements
+            ]
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        run(execute())
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+    assert statements, "the call sent no SQL"
+    return run(explain())
+
+
+def assert_indexed(plans: list[tuple[str, list[str]]], allowed=lambda detail: False) -> None:
+    """Every statement searches an index. ``allowed(detail)`` admits plan
+    steps that are fine for the call, e.g. sorting a handful of matches."""
+    for statement, details in plans:
+        if not details and statement.startswith("INSERT"):
+            continue  # INSERT ... VALUES reads nothing
+        for detail in details:
+            if allowed(detail):
+                continue
+            assert "TEMP B-TREE" not in detail, f"{detail}\n  in: {statement}"
+            if detail.startswith("SCAN") and detail not in _ORDERED_WALKS:
+                pytest.fail(f"{detail}\n  in: {statement}")
+        assert any(d.startswith("SEARCH") or d in _ORDERED_WALKS for d in details), (
+            f"no index used: {details}\n  in: {statement}"
+        )
+
+
+def tables_searched(plans: list[tuple[str, list[str]]]) -> set[str]:
+    return {
+        detail.split()[1] for _, details in plans for detail in details
+        if detail.startswith("SEARCH")
+    }
+
+
+@pytest.mark.parametrize("call", [
+    pytest.param(lambda repo: repo.list_open_page(), id="first-page"),
+    pytest.param(lambda repo: repo.list_open_page(cursor=_MIDDLE), id="older"),
+    pytest.param(
+        lambda repo: repo.list_open_page(cursor=_MIDDLE, direction=NEWER), id="newer"
+    ),
+    pytest.param(lambda repo: repo.list_open_page(priority="high"), id="priority"),
+    pytest.param(lambda repo: repo.list_open_page(category="network"), id="category"),
+    pytest.param(lambda repo: repo.list_open_page(status="new"), id="status"),
+    pytest.param(
+        lambda repo: repo.list_open_page(status="on_hold", cursor=_MIDDLE, direction=NEWER),
+        id="status-newer",
+    ),
+])
+def test_open_queue(run, call):
+    assert_indexed(query_plans(run, call))
+
+
+@pytest.mark.parametrize("cursor, direction", [
+    (None, OLDER),
+    (_MIDDLE, OLDER),
+    (_MIDDLE, NEWER),
+])
+def test_user_tickets(run, cursor, direction):
+    plans = query_plans(
+        run, lambda repo: repo.list_user_page(USERS // 2, cursor, direction)
+    )
+    assert_indexed(plans)
+    # Both halves of the page: hot and archived tickets
+    assert {"tickets", "archive.tickets"} <= tables_searched(plans)
+
+
+def test_admin_open_tickets(run):
+    assert_indexed(query_plans(run, lambda repo: repo.list_admin_open(ADMINS[0], 20)))
+
+
+def test_admin_chat_reply_lookup(run):
+    assert_indexed(query_plans(run, lambda repo: repo.get_by_admin_message(TICKETS)))
+
+
+def test_message_history(run):
+    assert_indexed(query_plans(run, lambda repo: repo.clear_history(TICKETS // 3)))
+
+
+def test_ticket_point_lookups(run):
+    async def call(repo: TicketRepository) -> None:
+        await repo.get_by_number(f"#{TICKETS // 4:05d}")
+        await repo.claim_reminder(TICKETS // 4, "new", 0)
+
+    assert_indexed(query_plans(run, call))
+
+
+def test_archived_ticket(run):
+    plans = query_plans(run, lambda repo: repo.get_any(2 * TICKETS - ARCHIVED // 2))
+    assert_indexed(plans)
+    assert "archive.tickets" in tables_searched(plans)
+
+
+def test_take(run):
+    async def call(repo: TicketRepository) -> None:
+        ticket = await repo.session.scalar(select(Ticket).where(Ticket.status == "new").limit(1))
+        assert await repo.take(ticket, ADMINS[0])
+
+    assert_indexed(query_plans(run, call))
+
+
+# Each FTS table is read through its MATCH index; the few matches are then
+# grouped per ticket and ranked, which takes a sort by design
+_FTS_MATCH = re.compile(r"SCAN \S+_fts VIRTUAL TABLE INDEX \d+:M")
+_RANKING = re.compile(r"SCAN \(subquery-\d+\)|USE TEMP B-TREE FOR (GROUP|ORDER) BY")
+
+
+@pytest.mark.parametrize("query", ["принтер", "картридж"])
+def test_search(run, query):
+    plans = query_plans(run, lambda repo: repo.search(query, 6, offset=6))
+    assert_indexed(plans, lambda detail: bool(
+        _FTS_MATCH.match(detail) or _RANKING.fullmatch(detail)
+    ))
+    matched = {
+        detail.split()[1] for _, details in plans for detail in details
+        if _FTS_MATCH.match(detail)
+    }
+    assert matched == {
+        "main.tickets_fts", "main.ticket_messages_fts",
+        "archive.tickets_fts", "archive.ticket_messages_fts",
+    }
+    # Matches are resolved to tickets by primary key; only archived tickets
+    # mention a cartridge, so that page is looked up in the archive too
+    expected = {"tickets", "archive.tickets"} if query == "картридж" else {"tickets"}
+    assert expected <= tables_searched(plans)
+
+
+def test_in_memory_index_loads(run):
+    async def call(repo: TicketRepository) -> None:
+        reminders = ReminderScheduler()
+        await reminders.load()
+        await reminders.reload(TICKETS // 5)
+        async with engine.connect() as conn:
+            await OpenTicketStore().warm(conn)
+            await OpenTicketStore().reload(conn, TICKETS // 5)
+
+    assert_indexed(query_plans(run, call))
+
+
+def test_persisted_prompts(run):
+    registry = PromptRegistry("plans:prompts", 10, 60, persist=True)
+
+    async def call(repo: TicketRepository) -> None:
+        await registry.add(TICKETS, REPLY, 1)
+        assert await registry.pop(TICKETS) is not None
+        assert await registry.pop(TICKETS + 1) is None
+
+    assert_indexed(query_plans(run, call))
+
+
+def test_stats(run):
+    async def read(repo: TicketRepository) -> None:
+        await read_stats(await repo.session.connection())
+
+    assert_indexed(query_plans(run, read))
+
+    async def reconcile(repo: TicketRepository) -> None:
+        await reconcile_stats(await repo.session.connection())
+
+    plans = query_plans(run, reconcile)
+    # The recount is a full pass by design: one scan of each tickets table,
+    # no lookups per row; the counters themselves are found by key
+    recount = [details for statement, details in plans if "count(" in statement]
+    assert len(recount) == 1
+    assert {d for d in recount[0] if d.startswith(("SCAN", "SEARCH"))} <= {
+        "SCAN tickets", "SCAN archive.tickets", "SCAN anon_1",
+    }, recount[0]
+    assert_indexed([(s, d) for s, d in plans if "count(" not in s])